@@ -0,0 +1,7 @@
+"""Runs the command-line interface, with `python -m articleparser`."""
+
+import sys
+
+from articleparser.cli import main
+
+sys.exit(main())
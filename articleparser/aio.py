@@ -0,0 +1,314 @@
+"""Parsing of HTML documents from asyncio applications.
+
+`Article.parse()` is CPU-bound, and blocks the event loop for as long as it
+runs. This module runs `articleparser.batch.parse_one()` on an executor
+(a pool of processes or threads) instead, so that parsing overlaps with
+network I/O. Results are records, as described in `articleparser.batch`.
+
+For example,
+
+    async with AsyncParser(workers=8) as parser:
+        record = await parser.parse(html, uuid=url)
+        async for record in parser.parse_many(pages):
+            ...
+
+Routine Listings
+----------------
+parse(source, uuid=None, config=None, executor=None, **kwargs)
+    Parse a single HTML document on an executor.
+AsyncParser
+    Parses HTML documents on an executor, with bounded concurrency.
+"""
+
+# Python 3.7 onwards, for annotations with standard collections
+from __future__ import annotations
+
+import asyncio
+import collections
+import concurrent.futures
+import functools
+import logging
+import os
+from typing import Any, AsyncIterable, AsyncIterator, Iterable, Union
+
+from articleparser.batch import Source, parse_one
+from articleparser.config import Config
+from articleparser.util import extend_config
+
+LOGGER = logging.getLogger(__name__)
+
+EXECUTORS = ["process", "thread"]
+
+
+async def parse(
+    source: Union[Source, tuple[str, Source]],
+    uuid: str = None,
+    config: Config = None,
+    executor: concurrent.futures.Executor = None,
+    **kwargs,
+) -> dict[str, Any]:
+    """Parse a single HTML document on an executor.
+
+    Parameters
+    ----------
+    source : str or Path or bytes or bytearray or tuple[str, source]
+        The document; see `articleparser.batch.parse_one()`.
+    uuid : str, optional
+        An identifier of the HTML document.
+    config : articleparser.config.Config, optional
+        A Config object consisting optional settings.
+    executor : concurrent.futures.Executor, optional
+        The executor to parse on, defaulting to the default executor of
+        the event loop (a thread pool).
+    **kwargs : optional
+        Extra optional arguments to extend `config`.
+
+    Returns
+    -------
+    record : dict[str, Any]
+        The record of the document; see `articleparser.batch`.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        executor, functools.partial(parse_one, source, uuid, config, **kwargs)
+    )
+
+
+class AsyncParser(object):
+    """Parses HTML documents on an executor, with bounded concurrency.
+
+    At most `max_in_flight` documents are in the executor (waiting or being
+    parsed) at any time, across all calls to `parse()` and `parse_many()`.
+    `parse_many()` also holds at most `max_in_flight` records not yet
+    consumed, and only draws from its inputs when below both limits, so a
+    slow consumer slows down the reading of inputs (backpressure), and
+    memory use stays bounded.
+
+    Cancelling a call to `parse()`, or closing the iterator of
+    `parse_many()`, cancels documents still waiting in the executor;
+    documents already being parsed run to completion in the background,
+    and keep their slot until then.
+
+    An executor created by the parser is replaced if it breaks (e.g. when
+    a worker process is killed): documents being parsed fail with
+    `BrokenProcessPool`, and later documents are parsed by new workers.
+    Use as an asynchronous context manager, or call `close()`, to shut
+    down an executor created by the parser.
+
+    Parameters
+    ----------
+    executor : {"process", "thread"} or concurrent.futures.Executor, default "process"
+        The executor to parse on: a new `ProcessPoolExecutor` (for parallel
+        parsing, since parsing holds the GIL) or `ThreadPoolExecutor`
+        of `workers` workers, or an existing executor, which is not shut
+        down by `close()`.
+    workers : int, optional
+        The number of workers of a new executor, defaulting to
+        `os.cpu_count()`.
+    max_in_flight : int, optional
+        The maximum number of documents in flight, defaulting to twice
+        `workers`.
+    config : articleparser.config.Config, optional
+        A Config object consisting optional settings, used for all
+        documents.
+    **kwargs : optional
+        Extra optional arguments to extend `config`.
+
+    Attributes
+    ----------
+    executor : concurrent.futures.Executor
+    config : articleparser.config.Config
+    max_in_flight : int
+
+    Raises
+    ------
+    ValueError
+        if `executor` is a string not in `EXECUTORS`.
+    """
+
+    def __init__(
+        self,
+        executor: Union[str, concurrent.futures.Executor] = "process",
+        workers: int = None,
+        max_in_flight: int = None,
+        config: Config = None,
+        **kwargs,
+    ):
+        if workers is None:
+            workers = os.cpu_count() or 1
+        # creates a new executor, if the executor is created by the parser
+        self._make_executor = None
+        if isinstance(executor, str):
+            if executor not in EXECUTORS:
+                raise ValueError("Wrong executor specified: {}".format(executor))
+            if executor == "process":
+                self._make_executor = functools.partial(
+                    concurrent.futures.ProcessPoolExecutor, workers
+                )
+            else:
+                self._make_executor = functools.partial(
+                    concurrent.futures.ThreadPoolExecutor, workers
+                )
+            executor = self._make_executor()
+        self.executor = executor
+        self.config = extend_config(config or Config(), kwargs)
+        self.max_in_flight = max_in_flight or 2 * workers
+        # created in the event loop by `_get_semaphore()`, since before
+        # Python 3.10 it is bound to the loop current at creation
+        self._semaphore = None
+
+    async def __aenter__(self) -> AsyncParser:
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Shuts down the executor, if created by the parser, without
+        waiting for documents being parsed."""
+        if self._make_executor is not None:
+            self.executor.shutdown(wait=False)
+
+    def _restart_executor(self) -> None:
+        # Replaces a broken executor created by the parser.
+        LOGGER.warning("Restarting the executor.")
+        self.executor.shutdown(wait=False)
+        self.executor = self._make_executor()
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # Returns the semaphore of the slots of documents in the executor,
+        # creating it in the running event loop.
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        return self._semaphore
+
+    def _submit(
+        self,
+        source: Union[Source, tuple[str, Source]],
+        uuid: str = None,
+    ) -> asyncio.Future:
+        # Submits a document to the executor; the caller must hold a slot
+        # of `self._semaphore`, which is released once the document leaves
+        # the executor (is parsed, fails or is cancelled), whether or not
+        # the returned future is still awaited.
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphore
+
+        def release(_: concurrent.futures.Future) -> None:
+            try:
+                loop.call_soon_threadsafe(semaphore.release)
+            except RuntimeError:
+                # the event loop was closed
+                pass
+
+        try:
+            try:
+                future = self.executor.submit(parse_one, source, uuid, self.config)
+            except concurrent.futures.BrokenExecutor:
+                # e.g. a worker process was killed
+                if self._make_executor is None:
+                    raise
+                self._restart_executor()
+                future = self.executor.submit(parse_one, source, uuid, self.config)
+        except BaseException:
+            semaphore.release()
+            raise
+        future.add_done_callback(release)
+        return asyncio.wrap_future(future)
+
+    async def parse(
+        self,
+        source: Union[Source, tuple[str, Source]],
+        uuid: str = None,
+    ) -> dict[str, Any]:
+        """Parse a single HTML document.
+
+        Waits for a slot if `max_in_flight` documents are in flight.
+
+        Parameters
+        ----------
+        source : str or Path or bytes or bytearray or tuple[str, source]
+            The document; see `articleparser.batch.parse_one()`.
+        uuid : str, optional
+            An identifier of the HTML document.
+
+        Returns
+        -------
+        record : dict[str, Any]
+            The record of the document; see `articleparser.batch`.
+        """
+        await self._get_semaphore().acquire()
+        return await self._submit(source, uuid)
+
+    async def parse_many(
+        self,
+        inputs: Union[Iterable, AsyncIterable],
+        ordered: bool = False,
+    ) -> AsyncIterator[dict[str, Any]]:
+        """Parse many HTML documents, yielding records as they complete.
+
+        Parameters
+        ----------
+        inputs : Iterable or AsyncIterable
+            The documents, each as accepted by
+            `articleparser.batch.parse_one()`.
+        ordered : bool, default False
+            Whether to yield records in the order of `inputs`. If False,
+            records are yielded as soon as they complete; use "index" to
+            match them to `inputs`.
+
+        Yields
+        ------
+        record : dict[str, Any]
+            The record of each document; see `articleparser.batch`.
+        """
+        # futures of documents submitted and not yet yielded, in order of
+        # submission
+        pending = collections.OrderedDict()
+        semaphore = self._get_semaphore()
+
+        def take(future: asyncio.Future) -> dict[str, Any]:
+            # Removes a completed future.
+            index = pending.pop(future)
+            record = future.result()
+            record["index"] = index
+            return record
+
+        async def wait_one() -> list[dict[str, Any]]:
+            # Waits for the next record(s) to yield.
+            if ordered:
+                future = next(iter(pending))
+                await asyncio.wait([future])
+                return [take(future)]
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            return [take(future) for future in list(pending) if future in done]
+
+        if isinstance(inputs, AsyncIterable):
+            iterator = inputs.__aiter__()
+        else:
+            iterator = _aiter_sync(inputs)
+
+        try:
+            index = 0
+            async for source in iterator:
+                # yield records while no slot is free, rather than waiting
+                # for a slot held by records not yet yielded
+                while pending and (semaphore.locked() or len(pending) >= self.max_in_flight):
+                    for record in await wait_one():
+                        yield record
+                await semaphore.acquire()
+                pending[self._submit(source)] = index
+                index += 1
+            while pending:
+                for record in await wait_one():
+                    yield record
+        finally:
+            for future in pending:
+                future.cancel()
+            pending.clear()
+
+
+async def _aiter_sync(iterable: Iterable) -> AsyncIterator:
+    # Iterates over a synchronous iterable, asynchronously.
+    for item in iterable:
+        yield item
@@ -12,17 +12,24 @@ from __future__ import annotations
 import copy
 import logging
 from pathlib import Path
-from typing import Any, Union
+import sqlite3
+import time
+from typing import Any, IO, Union
 
 import bs4
 
+from articleparser.cache import get_cache, hash_source, make_cache_key
 from articleparser.cleaner import Cleaner
 from articleparser.config import Config
+from articleparser.exceptions import BudgetExceededError, DeadlineExceededError
 from articleparser.extractor import ArticleExtractor
 from articleparser.metadata import extract_metadata
 from articleparser.util import (
     make_soup,
+    check_deadline,
     extend_config,
+    find_head_end,
+    is_filepath,
 )
 
 LOGGER = logging.getLogger(__name__)
@@ -38,29 +45,57 @@ class Article(object):
 
     Parameters
     ----------
-    filepath : str
+    filepath : str, optional
         The filepath containing the HTML document.
+    html : str or bytes or bytearray or memoryview or IO, optional
+        The HTML document, as a string, raw bytes, or a readable binary or
+        text stream. Strings are always the document itself, never read as
+        filepaths. Takes precedence over `filepath`.
     soup : bs4.BeautifulSoup, optional
         The `bs4.BeautifulSoup` object representing the document.
-        If None, will be loaded from `filepath` with `make_soup()`.
+        If None, will be loaded from `html` or `filepath` with `make_soup()`.
     uuid : str, optional
-        An identifier of the HTML document, for external use.
+        An identifier of the HTML document, for external use. Defaults to
+        `filepath`, or None if the document is not read from a file.
+    encoding : str, optional
+        The encoding of the document in `html` or at `filepath`, if known.
+        If None, it is detected by `make_soup()`.
     config : articleparser.config.Config, optional
         A Config object consisting optional settings.
+    lazy_backup : bool, default True
+        Whether to defer building `backup_soup` until it is first needed.
+        If True, the document is only parsed once at construction; see
+        `backup_soup` below.
+        If False, `backup_soup` is built eagerly at construction, unless
+        the results are found in the cache.
     **kwargs : optional
         Extra optional arguments to extend `config`.
 
     Attributes
     ----------
     filepath
+    html
     uuid
+    encoding
     config
+    metadata_only : bool
+        Whether only metadata and short fields are extracted by `parse()`;
+        see `articleparser.config.Config.metadata_only`. Also set for
+        documents exceeding a budget with `config.budget_action` of
+        "metadata_only".
     soup : bs4.BeautifulSoup
         The `bs4.BeautifulSoup` object stored at `filepath`, as loaded by
-        `make_soup()`.
+        `make_soup()`; None if `from_cache`.
+    from_cache : bool
+        Whether `content` and `methods` were found in the cache at
+        `config.cache_path` (see `articleparser.cache`), in which case the
+        document is not loaded, and `parse()` does nothing.
     backup_soup : bs4.BeautifulSoup
-        The `bs4.BeautifulSoup` object stored at `filepath`, as loaded by
-        `make_soup()`.
+        An unmodified copy of `soup`, as at construction.
+        With `lazy_backup`, this is re-loaded from `html` or `filepath` on
+        first access, if possible (streams must be seekable);
+        otherwise, it is copied on first access, or just before `parse()`
+        first modifies `soup` (copy-on-write).
     article_url : str
         The article URL obtained from extraction.
     cleaner : articleparser.cleaner.Cleaner
@@ -109,6 +144,16 @@ class Article(object):
             "alt_text": str, non-empty or None
     methods : dict[str, Any]
         The method of extraction for fields in `content`.
+        Also contains the key "parser", the name of the parser that built
+        `soup` (for example, "lxml" or "html5lib"), and for documents
+        exceeding a budget in `config` (see `config.budget_action`), the key
+        "budget_exceeded", with the name of the budget exceeded.
+
+    Raises
+    ------
+    articleparser.exceptions.BudgetExceededError
+        if the document exceeds a budget in `config` (`MAX_INPUT_BYTES`,
+        `MAX_NODES` or `MAX_DEPTH`) and `config.budget_action` is "reject".
 
     Methods
     -------
@@ -150,41 +195,193 @@ class Article(object):
         self,
         *,  # all arguments are keyword-only
         filepath: Union[str, Path] = None,
+        html: Union[str, bytes, bytearray, memoryview, IO] = None,
         soup: bs4.BeautifulSoup = None,
         uuid: str = None,
+        encoding: str = None,
         config: Config = None,
+        lazy_backup: bool = True,
         **kwargs,
     ):
         if isinstance(filepath, str):
             filepath = Path(filepath)
         self.filepath = filepath
-
-        if soup:
-            self.soup = soup
-            self.backup_soup = copy.copy(soup)
-        elif filepath:
-            self.soup = make_soup(self.filepath)
-            self.backup_soup = make_soup(self.filepath)
-        else:
-            raise ValueError("Must provide at least one of filepath and soup!")
-
+        self.encoding = encoding
         if uuid:
             self.uuid = uuid
-        else:
+        elif filepath is not None:
             self.uuid = str(filepath)
+        else:
+            self.uuid = None
 
         self.config = config or Config()
         self.config = extend_config(self.config, kwargs)
+        # may be set by `_load_soup()` for documents exceeding a budget
+        self.metadata_only = self.config.metadata_only
+
+        self.content = dict.fromkeys(self.CONTENT_FIELDS)
+        self.methods = {}
+
+        self.html = html
+        self.from_cache = False
+        # the key of the results in the cache, if `config.cache_path` is set
+        self._cache_key = None
+        if self.config.cache_path is not None and soup is None:
+            self._lookup_cache()
+            html = self.html
+
+        # `_backup_from_source` records whether `backup_soup` can be
+        # re-loaded from `html` or `filepath`, rather than copied from `soup`;
+        # `_html_position` is the start position of `html`, if a stream
+        self._backup_soup = None
+        self._html_position = None
+        if soup:
+            self.soup = soup
+            self._backup_from_source = False
+        elif self.from_cache:
+            self.soup = None
+            self._backup_from_source = True
+        elif html is not None:
+            if hasattr(html, "read"):
+                if html.seekable():
+                    self._html_position = html.tell()
+                self._backup_from_source = self._html_position is not None
+            else:
+                self._backup_from_source = True
+            self.soup = self._load_soup()
+        elif filepath:
+            self.soup = self._load_soup()
+            self._backup_from_source = True
+        else:
+            raise ValueError("Must provide at least one of filepath, html and soup!")
+        # no tree is needed for results found in the cache
+        if not lazy_backup and not self.from_cache:
+            self._make_backup_soup()
 
         self.article_url = None
 
         self.cleaner = None
         self.extractor = None
 
-        self.content = dict.fromkeys(self.CONTENT_FIELDS)
-        self.methods = {}
+    @property
+    def backup_soup(self) -> bs4.BeautifulSoup:
+        if self._backup_soup is None:
+            self._make_backup_soup()
+        return self._backup_soup
+
+    @backup_soup.setter
+    def backup_soup(self, soup: bs4.BeautifulSoup) -> None:
+        self._backup_soup = soup
+
+    def _lookup_cache(self) -> None:
+        # Looks up the results of the document in the cache, setting
+        # `content` and `methods` on a hit. Streams are read into memory
+        # first, to be hashed, but no further than `make_soup()` would read
+        # them. Documents exceeding MAX_INPUT_BYTES are not cached: the
+        # budget is applied by `_load_soup()`.
+        max_bytes = self.config.MAX_INPUT_BYTES
+        if hasattr(self.html, "read"):
+            self.html = self.html.read(-1 if max_bytes is None else max_bytes + 1)
+        source = self.html if self.html is not None else self.filepath
+        if source is None:
+            return
+        if max_bytes is not None and not is_filepath(source) and len(source) > max_bytes:
+            LOGGER.debug("Document exceeds MAX_INPUT_BYTES, not cached: {}".format(self.uuid))
+            return
+        try:
+            source_hash = hash_source(source)
+        except OSError:
+            # reported when loading the document
+            return
+        self._cache_key = make_cache_key(source_hash, self.config, self.encoding)
+        try:
+            cache = get_cache(self.config.cache_path, self.config.cache_max_bytes)
+            result = cache.get(self._cache_key)
+        except sqlite3.Error:
+            LOGGER.exception("Reading cache failed for: {}".format(self.uuid))
+            return
+        if result is not None:
+            LOGGER.debug("Found cached results for: {}".format(self.uuid))
+            self.content, self.methods = result
+            self.from_cache = True
+
+    def _store_in_cache(self) -> None:
+        # Stores `content` and `methods` in the cache.
+        try:
+            cache = get_cache(self.config.cache_path, self.config.cache_max_bytes)
+            cache.put(self._cache_key, self.content, self.methods)
+        except sqlite3.Error:
+            LOGGER.exception("Writing cache failed for: {}".format(self.uuid))
+
+    def _load_soup(self) -> bs4.BeautifulSoup:
+        # Loads the document from `html` or `filepath` with `make_soup()`.
+        # Documents exceeding a budget are handled per `config.budget_action`.
+        if self._html_position is not None:
+            self.html.seek(self._html_position)
+        try:
+            return make_soup(
+                self.html if self.html is not None else self.filepath,
+                parser=self.config.parser,
+                remove_in_head=self.config.HEAD_REMOVE_TAGS,
+                encoding=self.encoding,
+                head_only=self.metadata_only,
+                max_bytes=self.config.MAX_INPUT_BYTES,
+                max_nodes=self.config.MAX_NODES,
+                max_depth=self.config.MAX_DEPTH,
+            )
+        except BudgetExceededError as e:
+            if self.config.budget_action not in ("truncate", "metadata_only"):
+                if self.config.budget_action != "reject":
+                    LOGGER.error(
+                        "Unknown budget_action: {}".format(self.config.budget_action)
+                    )
+                raise
+            LOGGER.info(
+                "{} for: {}; using budget_action {}".format(
+                    e, self.uuid, self.config.budget_action
+                )
+            )
+            self.methods["budget_exceeded"] = e.budget
+            error = e
+        # the document is re-parsed within MAX_NODES and MAX_DEPTH; with
+        # "truncate", it is cut again wherever these are still exceeded
+        while True:
+            if self.config.budget_action == "truncate":
+                html_doc = error.html_doc[: error.position]
+                # nothing of <body> is left to extract article text from
+                if error.position <= find_head_end(error.html_doc):
+                    self.metadata_only = True
+            else:
+                html_doc = error.html_doc
+                self.metadata_only = True
+            try:
+                return make_soup(
+                    html_doc,
+                    parser=self.config.parser,
+                    remove_in_head=self.config.HEAD_REMOVE_TAGS,
+                    head_only=self.metadata_only,
+                    max_nodes=self.config.MAX_NODES,
+                    max_depth=self.config.MAX_DEPTH,
+                )
+            except BudgetExceededError as e:
+                if self.config.budget_action != "truncate" or e.position >= len(html_doc):
+                    raise
+                LOGGER.info("{} for: {}; truncating again".format(e, self.uuid))
+                error = e
+
+    def _make_backup_soup(self) -> None:
+        # Builds `self._backup_soup`, if not yet built.
+        # Re-loading from `html` or `filepath` is possible if the source can
+        # be read again, since it is unaffected by `parse()`; otherwise `soup`
+        # is copied, which must happen before `soup` is first modified.
+        if self._backup_soup is not None:
+            return
+        if self._backup_from_source:
+            self._backup_soup = self._load_soup()
+        elif self.soup is not None:
+            self._backup_soup = copy.copy(self.soup)
 
-    def parse(self) -> None:
+    def parse(self, deadline: float = None) -> None:
         """Parses article into content fields.
 
         First, collects HTML metadata from `self.soup` via `extract_metadata()`.
@@ -194,11 +391,30 @@ class Article(object):
         before performing asset extraction and content extraction with
         `ArticleExtractor`. Collected data is stored in `self.content`.
 
+        If `self.metadata_only` (set from `config.metadata_only`, or for
+        documents exceeding a budget with `config.budget_action` of
+        "metadata_only"), only the short fields and authors are
+        extracted, without cleaning; "record_content" and the asset lists
+        remain None.
+
+        If `config.cache_path` is set, results are stored in the cache, and
+        documents found in it at construction (see `from_cache`) are not
+        parsed again. Results of parsing which timed out are not stored.
+
+        If `deadline` (or `config.timeout`) is set, it is checked between
+        stages, and within the long-running loops of cleaning and text
+        extraction. Once it passes, parsing stops, keeping the fields
+        extracted so far (including the paragraphs of "record_content"
+        extracted before the deadline), and the stage at which it stopped
+        is recorded in `self.methods["timed_out"]`.
+
         Written February 2021.
 
         Parameters
         ----------
-        None
+        deadline : float, optional
+            A deadline for parsing, as a value of `time.monotonic()`.
+            Defaults to `config.timeout` seconds from now, if set.
 
         Returns
         -------
@@ -213,12 +429,33 @@ class Article(object):
         articleparser.cleaner.Cleaner
             Cleans HTML.
         """
+        if self.from_cache:
+            LOGGER.info("Using cached results for: {}".format(self.uuid))
+            return
+        if deadline is None and self.config.timeout is not None:
+            deadline = time.monotonic() + self.config.timeout
+        try:
+            self._parse(deadline)
+        except DeadlineExceededError as e:
+            LOGGER.warning("Parsing timed out for: {}; {}".format(self.uuid, e))
+            self.methods["timed_out"] = e.stage
+            return
+        if self._cache_key is not None and self.soup is not None:
+            self._store_in_cache()
+
+    def _parse(self, deadline: float = None) -> None:
+        # Performs `parse()`, raising `DeadlineExceededError` if `deadline`
+        # passes; fields are stored in `self.content` as they are extracted.
         LOGGER.info("Parsing article from: {}".format(self.uuid))
 
         if self.soup is None:
             LOGGER.error("Soup parsing failed for: {}".format(self.uuid))
             return
 
+        # parser used; with `config.parser="adaptive"`, this may be either
+        # "lxml" or the "html5lib" fallback
+        self.methods["parser"] = self.soup.builder.NAME
+
         # code for content extraction from soup.head
         metadata = extract_metadata(self.soup, self.uuid)
         LOGGER.debug("Collected article metadata.")
@@ -227,6 +464,7 @@ class Article(object):
             soup=self.soup,
             metadata=metadata,
             config=self.config,
+            deadline=deadline,
         )
 
         # record_url
@@ -237,13 +475,19 @@ class Article(object):
         self.article_url = self.content["record_url"]
 
         ### cleaning HTML ###
-        self.cleaner = Cleaner(
-            soup=self.soup,
-            config=self.config,
-            unwrap_markup=False,
-        )
-        self.cleaner.clean()
-        self.soup = self.cleaner.soup
+        # not required for metadata and short fields
+        if not self.metadata_only:
+            # copy-on-write: the cleaner modifies `self.soup` in-place
+            if not self._backup_from_source:
+                self._make_backup_soup()
+            self.cleaner = Cleaner(
+                soup=self.soup,
+                config=self.config,
+                deadline=deadline,
+                unwrap_markup=False,
+            )
+            self.cleaner.clean()
+            self.soup = self.cleaner.soup
         ###
 
         # record_title
@@ -291,6 +535,20 @@ class Article(object):
         )
         # fmt: on
 
+        if self.metadata_only:
+            # <body> was not parsed, so there are no tags to search for
+            # authors; these are found from metadata only
+            self.extractor.base_tag = self.soup.body
+            self.extractor.top_tag = self.soup.body
+            # author_list
+            (
+                self.content["author_list"],
+                self.methods["author_list"],
+            ) = self.extractor.extract_authors()
+
+            LOGGER.debug("Metadata extraction complete.")
+            return None
+
         ### section on retrieving top node ###
         self.extractor.soup = self.soup
 
@@ -298,8 +556,16 @@ class Article(object):
         base_tag = self.extractor.base_tag
         self.extractor.set_top_tag()
         top_tag = self.extractor.top_tag
+        check_deadline(deadline, "set_top_tag")
         ###
 
+        # author_list; extracted before assets and article text, which are
+        # the slowest stages, so that authors are kept if the deadline passes
+        (
+            self.content["author_list"],
+            self.methods["author_list"],
+        ) = self.extractor.extract_authors()
+
         # record_images_list
         self.extractor.get_pictures()
         self.content["record_images_list"] = [
@@ -321,6 +587,7 @@ class Article(object):
             for video_item in self.extractor.video_list
         ]
         self.content["record_comment_areas_list"] = self.extractor.comment_area_list
+        check_deadline(deadline, "get_assets")
         self.extractor.get_documents()
         self.content["record_documents_list"] = [
             {
@@ -332,18 +599,17 @@ class Article(object):
 
         ###
         # getting article text and inline links
-        article_text = self.extractor.get_article_text()
+        try:
+            article_text = self.extractor.get_article_text()
+        except DeadlineExceededError:
+            # keep the paragraphs extracted before the deadline
+            self.content["record_content"] = self.extractor.article_text
+            raise
         ###
 
         # record_content
         self.content["record_content"] = article_text
         self.content["record_links_list"].extend(self.extractor.inline_links_list)
 
-        # author_list
-        (
-            self.content["author_list"],
-            self.methods["author_list"],
-        ) = self.extractor.extract_authors()
-
         LOGGER.debug("Extraction complete.")
         return None
\ No newline at end of file
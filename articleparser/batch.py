@@ -0,0 +1,584 @@
+"""Parsing of many HTML documents in parallel.
+
+This module contains functions parsing batches of HTML documents with
+`Article`, over a pool of worker processes. Each document gives one
+record, a dict with the following keys:
+    "index" : int
+        The position of the document in the inputs.
+    "uuid" : str or None
+        The identifier of the document: as given, or else its filepath.
+    "content" : dict[str, Any] or None
+        `Article.content`, or None if parsing failed.
+    "methods" : dict[str, Any] or None
+        `Article.methods`, or None if parsing failed.
+    "error" : dict[str, str] or None
+        None if parsing succeeded; otherwise a dict with keys "type" (the
+        name of the exception class) and "message".
+    "timings" : dict[str, float]
+        The time taken in seconds: "load", to read and parse the document
+        into a tree (constructing `Article`), and "parse", for
+        `Article.parse()` (missing if loading failed).
+
+Exceptions raised while parsing a document are caught and recorded in its
+record, so that one failing document never stops a batch.
+
+For long batches, `parse_many()` can also supervise its workers: a worker
+which exceeds a time limit on a document, or a memory (RSS) ceiling, is
+killed and replaced, and the document is recorded as failed with "error"
+type "WorkerTimeout" or "WorkerMemoryExceeded" ("WorkerDied" if the worker
+dies otherwise). Workers can also be recycled after a number of documents,
+since the memory of `bs4` trees, which are cyclic, is returned to the
+operating system slowly.
+
+Routine Listings
+----------------
+parse_one(source, uuid=None, config=None, **kwargs)
+    Parse a single HTML document into a record.
+parse_many(inputs, workers=None, chunksize=1, ordered=True, config=None, **kwargs)
+    Parse many HTML documents over a pool of worker processes.
+"""
+
+# Python 3.7 onwards, for annotations with standard collections
+from __future__ import annotations
+
+import collections
+import logging
+import multiprocessing
+import multiprocessing.connection
+import os
+from pathlib import Path
+import signal
+import threading
+import time
+from typing import Any, Iterable, Iterator, Optional, Union
+
+from articleparser.article import Article
+from articleparser.config import Config
+from articleparser.util import extend_config, is_filepath
+
+LOGGER = logging.getLogger(__name__)
+
+Source = Union[str, Path, bytes, bytearray]
+
+# Config of each worker process, set by `_init_worker()`
+_WORKER_CONFIG = None
+
+# Interval in seconds between checks of the RSS of busy workers
+RSS_CHECK_INTERVAL = 1.0
+# In ordered mode with supervision, the maximum number of documents
+# submitted ahead of the earliest document not yet yielded, per worker
+REORDER_WINDOW = 4
+
+
+def parse_one(
+    source: Union[Source, tuple[str, Source]],
+    uuid: str = None,
+    config: Config = None,
+    **kwargs,
+) -> dict[str, Any]:
+    """Parse a single HTML document into a record.
+
+    Parameters
+    ----------
+    source : str or Path or bytes or bytearray or tuple[str, source]
+        A filepath (`Path`), or the HTML document itself, as a string or
+        raw bytes; or a tuple of `uuid` and one of these.
+    uuid : str, optional
+        An identifier of the HTML document. Defaults to the filepath, or
+        None for in-memory documents.
+    config : articleparser.config.Config, optional
+        A Config object consisting optional settings.
+    **kwargs : optional
+        Extra optional arguments to extend `config`.
+
+    Returns
+    -------
+    record : dict[str, Any]
+        The record of the document, with keys "uuid", "content", "methods",
+        "error" and "timings"; see the module docstring. "index" is not set.
+    """
+    if isinstance(source, tuple):
+        uuid, source = source
+    from_file = is_filepath(source)
+    if uuid is None and from_file:
+        uuid = str(source)
+    timings = {}
+    start = time.perf_counter()
+    try:
+        if from_file:
+            article = Article(filepath=source, uuid=uuid, config=config, **kwargs)
+        else:
+            article = Article(html=source, uuid=uuid, config=config, **kwargs)
+        timings["load"] = time.perf_counter() - start
+        article.parse()
+        timings["parse"] = time.perf_counter() - start - timings["load"]
+    except Exception as e:
+        LOGGER.exception("Parsing failed for: {}".format(uuid))
+        if "load" in timings:
+            timings["parse"] = time.perf_counter() - start - timings["load"]
+        else:
+            timings["load"] = time.perf_counter() - start
+        return {
+            "uuid": uuid,
+            "content": None,
+            "methods": None,
+            "error": {"type": type(e).__name__, "message": str(e)},
+            "timings": timings,
+        }
+    return {
+        "uuid": uuid,
+        "content": article.content,
+        "methods": article.methods,
+        "error": None,
+        "timings": timings,
+    }
+
+
+def _get_uuid(source: Union[Source, tuple[str, Source]]) -> str:
+    # The uuid of the record of `source`, as set by `parse_one()`.
+    if isinstance(source, tuple):
+        return source[0]
+    if is_filepath(source):
+        return str(source)
+    return None
+
+
+def _init_worker(config: Config) -> None:
+    # Stores the config of the batch in the worker process, so that it is
+    # sent once per worker rather than once per document. As in supervised
+    # workers, interrupts are left to the main process, which terminates
+    # the pool (with SIGTERM, whose handler may have been inherited).
+    global _WORKER_CONFIG
+    _WORKER_CONFIG = config
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+
+def _parse_indexed(item: tuple[int, Union[Source, tuple[str, Source]]]) -> dict[str, Any]:
+    # Parses the document `item[1]`, in a worker process.
+    index, source = item
+    record = parse_one(source, config=_WORKER_CONFIG)
+    record["index"] = index
+    return record
+
+
+def _take_slots(
+    inputs: Iterable[Union[Source, tuple[str, Source]]],
+    slots: threading.Semaphore,
+    stopped: threading.Event,
+) -> Iterator[Union[Source, tuple[str, Source]]]:
+    # Iterates over `inputs`, taking a slot before reading each document;
+    # slots are released by `parse_many()` as records are yielded.
+    inputs = iter(inputs)
+    while True:
+        slots.acquire()
+        if stopped.is_set():
+            return
+        try:
+            source = next(inputs)
+        except StopIteration:
+            return
+        yield source
+
+
+def _get_rss(pid: Union[int, str] = "self") -> Optional[int]:
+    # Returns the resident set size of process `pid` in bytes, from /proc;
+    # None if unavailable (e.g. not on Linux, or the process has exited).
+    try:
+        with open("/proc/{}/statm".format(pid)) as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _worker_main(conn: multiprocessing.connection.Connection, config: Config) -> None:
+    # Main loop of a supervised worker process: receives (index, source,
+    # config) tasks from `conn`, and sends back each record with the RSS of
+    # the worker. Documents are parsed with the config of their task, or
+    # else `config`. Exits on receiving None, or when `conn` is closed.
+    # Interrupts are left to the supervising process, which kills workers.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+        index, source, task_config = task
+        record = parse_one(source, config=task_config or config)
+        record["index"] = index
+        conn.send((record, _get_rss()))
+
+
+class _Worker(object):
+    # A supervised worker process, parsing one document at a time.
+
+    def __init__(self, context: multiprocessing.context.BaseContext, config: Config):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main,
+            args=(child_conn, config),
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+        self.task = None  # (index, source) being parsed, if any
+        self.started = None  # `time.monotonic()` at which `task` was sent
+        self.tasks_done = 0
+
+    def submit(
+        self,
+        index: int,
+        source: Union[Source, tuple[str, Source]],
+        config: Config = None,
+    ) -> None:
+        # Sends a task; `config` overrides the config of the worker.
+        self.conn.send((index, source, config))
+        self.task = (index, source)
+        self.started = time.monotonic()
+
+    def fail(self, error_type: str, message: str) -> dict[str, Any]:
+        # Kills the worker, returning a failed record for its task.
+        LOGGER.error("{} for: {}; {}".format(error_type, _get_uuid(self.task[1]), message))
+        self.kill()
+        return {
+            "index": self.task[0],
+            "uuid": _get_uuid(self.task[1]),
+            "content": None,
+            "methods": None,
+            "error": {"type": error_type, "message": message},
+            "timings": {},
+        }
+
+    def stop(self) -> None:
+        # Asks the (idle) worker to exit, killing it if it does not.
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(timeout=1.0)
+        self.kill()
+
+    def kill(self) -> None:
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class _InputReader(object):
+    # Reads the documents of `_parse_supervised()` from `inputs` on a thread,
+    # at most `size` ahead, so that workers are supervised while reading
+    # blocks (e.g. on a directory being watched, or a pipe). `wake` becomes
+    # readable whenever documents are read, or `inputs` ends.
+
+    def __init__(self, inputs: Iterable[Union[Source, tuple[str, Source]]], size: int):
+        self.documents = collections.deque()  # (index, source) read
+        self.exhausted = False  # set once every document has been read
+        self.error = None  # raised by `inputs`, if any
+        self.wake, self._wake_writer = multiprocessing.Pipe(duplex=False)
+        self._slots = threading.Semaphore(size)
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, args=(inputs,), name="InputReader", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self, inputs: Iterable[Union[Source, tuple[str, Source]]]) -> None:
+        try:
+            for task in _take_slots(enumerate(inputs), self._slots, self._stopped):
+                self.documents.append(task)
+                self._notify()
+        except Exception as e:
+            self.error = e
+        self.exhausted = True
+        self._notify()
+
+    def _notify(self) -> None:
+        try:
+            self._wake_writer.send_bytes(b"\0")
+        except OSError:
+            # closed by `close()`
+            pass
+
+    def clear_wake(self) -> None:
+        # Consumes the wake-ups sent so far.
+        while self.wake.poll():
+            self.wake.recv_bytes()
+
+    def get(self) -> Optional[tuple[int, Union[Source, tuple[str, Source]]]]:
+        # Returns the next document read, or None if there is none yet.
+        try:
+            task = self.documents.popleft()
+        except IndexError:
+            return None
+        self._slots.release()
+        return task
+
+    def done(self) -> bool:
+        # Whether every document has been taken; raises the error of
+        # `inputs`, if any, once the documents before it are taken.
+        if not self.exhausted or self.documents:
+            return False
+        if self.error is not None:
+            raise self.error
+        return True
+
+    def close(self) -> None:
+        # Stops reading; a thread blocked within `inputs` is left to exit
+        # with the process.
+        self._stopped.set()
+        self._slots.release()
+        self.wake.close()
+        self._wake_writer.close()
+
+
+def _get_worker_context() -> multiprocessing.context.BaseContext:
+    # Returns the context starting supervised workers. Workers are replaced
+    # while the thread of `_InputReader` runs, and a child forked while
+    # another thread holds a lock (e.g. of logging) may deadlock on it, so
+    # workers are started from a fork server, with this module preloaded,
+    # or else spawned.
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload([__name__])
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+def _parse_supervised(
+    inputs: Iterable[Union[Source, tuple[str, Source]]],
+    workers: int,
+    ordered: bool,
+    config: Config,
+    task_timeout: float,
+    max_rss: int,
+    max_tasks_per_child: int,
+) -> Iterator[dict[str, Any]]:
+    # Implements `parse_many()` with supervised workers; see `parse_many()`.
+    if max_rss is not None and _get_rss() is None:
+        LOGGER.warning("RSS cannot be read on this platform; max_rss is ignored.")
+        max_rss = None
+    context = _get_worker_context()
+    pool = [_Worker(context, config) for _ in range(workers)]
+    reader = _InputReader(inputs, workers)
+    submitted = 0
+    next_index = 0  # in ordered mode, the next index to yield
+    buffer = {}  # in ordered mode, records waiting to be yielded
+    try:
+        while True:
+            for worker in pool:
+                if worker.task is not None:
+                    continue
+                if ordered and submitted - next_index >= REORDER_WINDOW * workers:
+                    break
+                task = reader.get()
+                if task is None:
+                    break
+                worker.submit(*task)
+                submitted += 1
+
+            busy = [worker for worker in pool if worker.task is not None]
+            if not busy and reader.done():
+                break
+            timeout = None
+            now = time.monotonic()
+            if task_timeout is not None and busy:
+                timeout = max(min(w.started + task_timeout for w in busy) - now, 0.0)
+            if max_rss is not None and busy:
+                if timeout is None:
+                    timeout = RSS_CHECK_INTERVAL
+                else:
+                    timeout = min(timeout, RSS_CHECK_INTERVAL)
+            # also woken up by documents read, for idle workers
+            ready = multiprocessing.connection.wait(
+                [w.conn for w in busy] + [reader.wake], timeout
+            )
+            if reader.wake in ready:
+                reader.clear_wake()
+
+            records = []
+            now = time.monotonic()
+            for i, worker in enumerate(pool):
+                if worker.task is None:
+                    continue
+                replace = False
+                if worker.conn in ready:
+                    try:
+                        record, rss = worker.conn.recv()
+                    except (EOFError, OSError):
+                        records.append(
+                            worker.fail(
+                                "WorkerDied",
+                                "Worker exited with code {}.".format(worker.process.exitcode),
+                            )
+                        )
+                        replace = True
+                    else:
+                        records.append(record)
+                        worker.task = None
+                        worker.tasks_done += 1
+                        if max_tasks_per_child and worker.tasks_done >= max_tasks_per_child:
+                            replace = True
+                        elif max_rss is not None and rss is not None and rss > max_rss:
+                            LOGGER.info("Recycling worker with RSS of {} bytes.".format(rss))
+                            replace = True
+                        if replace:
+                            worker.stop()
+                elif task_timeout is not None and now - worker.started > task_timeout:
+                    records.append(
+                        worker.fail(
+                            "WorkerTimeout",
+                            "Document took longer than {} seconds.".format(task_timeout),
+                        )
+                    )
+                    replace = True
+                elif max_rss is not None:
+                    rss = _get_rss(worker.process.pid)
+                    if rss is not None and rss > max_rss:
+                        records.append(
+                            worker.fail(
+                                "WorkerMemoryExceeded",
+                                "Worker RSS of {} bytes exceeded {} bytes.".format(rss, max_rss),
+                            )
+                        )
+                        replace = True
+                if replace:
+                    pool[i] = _Worker(context, config)
+
+            for record in records:
+                if ordered:
+                    buffer[record["index"]] = record
+                else:
+                    yield record
+            while next_index in buffer:
+                yield buffer.pop(next_index)
+                next_index += 1
+    finally:
+        reader.close()
+        for worker in pool:
+            if worker.task is None:
+                worker.stop()
+            else:
+                worker.kill()
+
+
+def parse_many(
+    inputs: Iterable[Union[Source, tuple[str, Source]]],
+    workers: int = None,
+    chunksize: int = 1,
+    ordered: bool = True,
+    config: Config = None,
+    task_timeout: float = None,
+    max_rss: int = None,
+    max_tasks_per_child: int = None,
+    max_pending: int = None,
+    **kwargs,
+) -> Iterator[dict[str, Any]]:
+    """Parse many HTML documents over a pool of worker processes.
+
+    Documents are sent to `workers` processes of a `multiprocessing.Pool`
+    in chunks of `chunksize`, and records are yielded as they complete.
+    Workers share no state, so throughput scales with the number of cores,
+    as long as documents are passed as filepaths (or are small): in-memory
+    documents are copied to the workers.
+
+    If `task_timeout` or `max_rss` is given, workers are supervised
+    instead: each worker is sent one document at a time (`chunksize` is
+    ignored), and is killed and replaced if it exceeds either limit, with
+    the document recorded as failed. Unlike `config.timeout`, which stops
+    parsing cooperatively, `task_timeout` also covers loading the document,
+    and workers stuck anywhere.
+
+    Parameters
+    ----------
+    inputs : Iterable[str or Path or bytes or bytearray or tuple[str, source]]
+        The documents, each as accepted by `parse_one()`: a filepath, a
+        HTML string or raw bytes, or a tuple of uuid and one of these.
+    workers : int, optional
+        The number of worker processes, defaulting to `os.cpu_count()`.
+        If 1, documents are parsed in the current process, without a pool.
+    chunksize : int, default 1
+        The number of documents sent to a worker at a time. Larger chunks
+        reduce inter-process overhead for batches of many small documents.
+    ordered : bool, default True
+        Whether to yield records in the order of `inputs`. If False, records
+        are yielded as soon as they complete; use "index" to match them
+        to `inputs`.
+    config : articleparser.config.Config, optional
+        A Config object consisting optional settings, used for all
+        documents.
+    task_timeout : float, optional
+        The time limit in seconds for a worker to parse a document.
+    max_rss : int, optional
+        The maximum resident set size of a worker, in bytes. Checked every
+        `RSS_CHECK_INTERVAL` seconds while a worker is busy, and after each
+        document; a worker over the limit after a document is recycled.
+        Only supported on Linux.
+    max_tasks_per_child : int, optional
+        The number of documents after which a worker is replaced by a new
+        process, releasing its memory. Without supervision, this is counted
+        in chunks of `chunksize` documents.
+    max_pending : int, optional
+        The maximum number of documents read from `inputs` whose records
+        have not yet been yielded (at least `chunksize`). Otherwise, the
+        pool reads `inputs` as fast as it can, holding the documents read
+        ahead in memory; bounding this makes a slow consumer of records
+        slow down the reading of `inputs` (e.g. from a pipe) instead.
+        A single worker reads `inputs` as needed; supervised workers read
+        at most `workers` documents ahead, on a separate thread, so that
+        timeouts and RSS ceilings are enforced while reading blocks.
+    **kwargs : optional
+        Extra optional arguments to extend `config`.
+
+    Yields
+    ------
+    record : dict[str, Any]
+        The record of each document; see the module docstring.
+    """
+    config = extend_config(config or Config(), kwargs)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers < 1:
+        raise ValueError("workers must be at least 1.")
+
+    if task_timeout is not None or max_rss is not None:
+        yield from _parse_supervised(
+            inputs, workers, ordered, config, task_timeout, max_rss, max_tasks_per_child
+        )
+        return
+
+    if workers == 1 and max_tasks_per_child is None:
+        for index, source in enumerate(inputs):
+            record = parse_one(source, config=config)
+            record["index"] = index
+            yield record
+        return
+
+    slots = None
+    stopped = threading.Event()
+    if max_pending is not None:
+        slots = threading.Semaphore(max(max_pending, chunksize))
+        inputs = _take_slots(inputs, slots, stopped)
+    with multiprocessing.Pool(
+        workers,
+        initializer=_init_worker,
+        initargs=(config,),
+        maxtasksperchild=max_tasks_per_child,
+    ) as pool:
+        if ordered:
+            records = pool.imap(_parse_indexed, enumerate(inputs), chunksize)
+        else:
+            records = pool.imap_unordered(_parse_indexed, enumerate(inputs), chunksize)
+        try:
+            for record in records:
+                if slots is not None:
+                    slots.release()
+                yield record
+        finally:
+            # the pool waits for its thread reading `inputs` when closed
+            stopped.set()
+            if slots is not None:
+                slots.release()
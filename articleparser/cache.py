@@ -0,0 +1,315 @@
+"""A persistent cache of parsing results, keyed by document and Config.
+
+Parsing is deterministic given the bytes of a document, the attributes of
+`Config` and the version of articleparser, so the results of
+`Article.parse()` (`content` and `methods`) can be stored under a hash of
+all three, and re-used whenever the same document is parsed again, without
+building a tree. Results are stored in a SQLite database, which can be
+shared by many processes, and the least recently used results are evicted
+once the database exceeds a size limit.
+
+The cache is used by `Article` when `config.cache_path` is set.
+
+Routine Listings
+----------------
+config_fingerprint(config)
+    Returns a stable hash of the attributes of `config`.
+hash_source(source)
+    Returns a hash of the bytes of a HTML document.
+make_cache_key(source_hash, config, encoding=None)
+    Returns the key of the results of a document parsed with `config`.
+get_cache(path, max_bytes=None)
+    Returns the `ResultCache` at `path`, shared within the process.
+ResultCache
+    A SQLite cache of parsing results.
+"""
+
+# Python 3.7 onwards, for annotations with standard collections
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+import sqlite3
+import threading
+import time
+from typing import Any, Optional, Union
+import zlib
+
+from articleparser.config import Config
+from articleparser.util import is_filepath
+from articleparser.version import __version__
+
+LOGGER = logging.getLogger(__name__)
+
+# Attributes of `Config` which do not affect results, and are excluded from
+# `config_fingerprint()`. Results of documents which timed out are never
+# stored, so `timeout` does not affect stored results; it is set per request
+# by `articleparser.server`.
+FINGERPRINT_EXCLUDE = ["cache_path", "cache_max_bytes", "timeout"]
+# Size of the chunks in which files are read by `hash_source()`
+HASH_CHUNK_SIZE = 1 << 20
+# Seconds to wait for a lock held by another process
+SQLITE_TIMEOUT = 30.0
+# On eviction, the fraction of `max_bytes` down to which results are evicted,
+# so that eviction does not run on every write
+EVICTION_TARGET = 0.9
+# Number of results deleted at a time on eviction
+EVICTION_BATCH_SIZE = 256
+
+# `ResultCache` objects of the current process, by path and size limit
+_CACHES = {}
+_CACHES_LOCK = threading.Lock()
+
+
+def _json_default(value: Any) -> Any:
+    # Serializes values of `Config` attributes which are not JSON types.
+    if isinstance(value, (set, frozenset)):
+        return sorted(value, key=repr)
+    return repr(value)
+
+
+def config_fingerprint(config: Config) -> str:
+    """Returns a stable hash of the attributes of `config`.
+
+    All attributes are included, except those in `FINGERPRINT_EXCLUDE`,
+    so that changing any setting changes the fingerprint. The fingerprint
+    is the same across processes and runs.
+
+    Parameters
+    ----------
+    config : articleparser.config.Config
+
+    Returns
+    -------
+    str
+        A SHA-256 hex digest.
+    """
+    attributes = {
+        key: value for key, value in vars(config).items() if key not in FINGERPRINT_EXCLUDE
+    }
+    serialized = json.dumps(attributes, sort_keys=True, default=_json_default)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+def hash_source(source: Union[str, Path, bytes, bytearray, memoryview]) -> str:
+    """Returns a hash of the bytes of a HTML document.
+
+    Parameters
+    ----------
+    source : str or Path or bytes or bytearray or memoryview
+        A filepath (`Path`), whose raw (possibly compressed) bytes are
+        hashed; the HTML document itself (`str`), hashed as UTF-8; or its
+        raw bytes.
+
+    Returns
+    -------
+    str
+        A SHA-256 hex digest.
+
+    Raises
+    ------
+    OSError
+        if `source` is a filepath which cannot be read.
+    TypeError
+        if `source` is not of a type above.
+    """
+    digest = hashlib.sha256()
+    if is_filepath(source):
+        with open(source, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+    elif isinstance(source, str):
+        digest.update(source.encode("utf-8", errors="surrogatepass"))
+    elif isinstance(source, (bytes, bytearray, memoryview)):
+        digest.update(source)
+    else:
+        raise TypeError("Cannot hash source of type: {}".format(type(source).__name__))
+    return digest.hexdigest()
+
+
+def make_cache_key(source_hash: str, config: Config, encoding: str = None) -> str:
+    """Returns the key of the results of a document parsed with `config`.
+
+    Parameters
+    ----------
+    source_hash : str
+        The hash of the document, from `hash_source()`.
+    config : articleparser.config.Config
+        The Config object the document is parsed with.
+    encoding : str, optional
+        The encoding the document is parsed with, if given.
+
+    Returns
+    -------
+    str
+        A SHA-256 hex digest of `source_hash`, `config_fingerprint(config)`,
+        `encoding` and the version of articleparser.
+    """
+    parts = [source_hash, config_fingerprint(config), encoding or "", __version__]
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+
+def get_cache(path: Union[str, Path], max_bytes: int = None) -> ResultCache:
+    """Returns the `ResultCache` at `path`, shared within the process.
+
+    Caches are opened once per process (and re-opened in forked child
+    processes, which cannot share SQLite connections).
+
+    Parameters
+    ----------
+    path : str or Path
+        The path of the SQLite database.
+    max_bytes : int, optional
+        See `ResultCache`.
+
+    Returns
+    -------
+    ResultCache
+    """
+    key = (str(path), max_bytes, os.getpid())
+    with _CACHES_LOCK:
+        if key not in _CACHES:
+            _CACHES[key] = ResultCache(path, max_bytes=max_bytes)
+        return _CACHES[key]
+
+
+class ResultCache(object):
+    """A SQLite cache of parsing results.
+
+    Results (`Article.content` and `Article.methods`) are stored as
+    compressed JSON, under keys from `make_cache_key()`. The database uses
+    write-ahead logging, so that many processes can read and write it at
+    once. If `max_bytes` is given, the least recently used results are
+    evicted whenever the database exceeds it, down to `EVICTION_TARGET`
+    of `max_bytes`.
+
+    Parameters
+    ----------
+    path : str or Path
+        The path of the SQLite database, created if it does not exist.
+    max_bytes : int, optional
+        The maximum size of the database, in bytes (default None, meaning
+        no limit).
+
+    Attributes
+    ----------
+    path : str
+    max_bytes : int or None
+    hits : int
+        The number of calls to `get()` finding a result, in this process.
+    misses : int
+        The number of calls to `get()` finding no result, in this process.
+    evictions : int
+        The number of results evicted by this process.
+    """
+
+    def __init__(self, path: Union[str, Path], max_bytes: int = None):
+        self.path = str(path)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            self.path,
+            timeout=SQLITE_TIMEOUT,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results "
+            "(key TEXT PRIMARY KEY, value BLOB NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+
+    def __enter__(self) -> ResultCache:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def get(self, key: str) -> Optional[tuple[dict[str, Any], dict[str, Any]]]:
+        """Returns the results stored under `key`, or None.
+
+        Returns
+        -------
+        tuple[dict[str, Any], dict[str, Any]] or None
+            `content` and `methods`, or None if not found.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute(
+                "UPDATE results SET accessed = ? WHERE key = ?", (time.time(), key)
+            )
+        value = json.loads(zlib.decompress(row[0]))
+        return value["content"], value["methods"]
+
+    def put(self, key: str, content: dict[str, Any], methods: dict[str, Any]) -> None:
+        """Stores `content` and `methods` under `key`, evicting if needed."""
+        value = zlib.compress(
+            json.dumps({"content": content, "methods": methods}).encode("utf-8")
+        )
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, value, accessed) VALUES (?, ?, ?)",
+                (key, value, time.time()),
+            )
+            if self.max_bytes is not None and self._size() > self.max_bytes:
+                self._evict()
+
+    def _size(self) -> int:
+        # The size of the database in bytes, excluding free pages.
+        page_count = self._conn.execute("PRAGMA page_count").fetchone()[0]
+        freelist_count = self._conn.execute("PRAGMA freelist_count").fetchone()[0]
+        page_size = self._conn.execute("PRAGMA page_size").fetchone()[0]
+        return (page_count - freelist_count) * page_size
+
+    def _evict(self) -> None:
+        # Deletes the least recently used results, until the database is
+        # below `EVICTION_TARGET` of `max_bytes`; the caller holds the lock.
+        target = self.max_bytes * EVICTION_TARGET
+        while self._size() > target:
+            deleted = self._conn.execute(
+                "DELETE FROM results WHERE key IN "
+                "(SELECT key FROM results ORDER BY accessed LIMIT ?)",
+                (EVICTION_BATCH_SIZE,),
+            ).rowcount
+            if deleted <= 0:
+                break
+            self.evictions += deleted
+        LOGGER.debug("Evicted results from cache: {}".format(self.path))
+
+    def stats(self) -> dict[str, int]:
+        """Returns the counters of the cache, and its number of results
+        and size in bytes."""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+            size = self._size()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": size,
+        }
+
+    def clear(self) -> None:
+        """Deletes all results."""
+        with self._lock:
+            self._conn.execute("DELETE FROM results")
+
+    def close(self) -> None:
+        """Closes the database."""
+        with self._lock:
+            self._conn.close()
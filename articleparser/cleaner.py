@@ -23,7 +23,7 @@ from articleparser.settings import (
     LEFT_NOSPACE_PUNCTUATION,
     RIGHT_NOSPACE_PUNCTUATION,
 )
-from articleparser.util import extend_config
+from articleparser.util import check_deadline, extend_config
 
 LOGGER = logging.getLogger(__name__)
 
@@ -41,11 +41,17 @@ class Cleaner:
         An identifier of the HTML document, for external use.
     config : articleparser.config.Config, optional
         A Config object consisting optional settings.
+    deadline : float, optional
+        A deadline for cleaning, as a value of `time.monotonic()`. It is
+        checked between the steps of `clean()` and within `replace_breaks()`;
+        once passed, these raise `DeadlineExceededError`, leaving
+        `self.soup` partially cleaned.
 
     Attributes
     ----------
     self.soup : bs4.BeautifulSoup
         The `bs4.BeautifulSoup` object representing the document.
+    self.deadline : float
 
     Methods
     -------
@@ -74,12 +80,15 @@ class Cleaner:
         soup: bs4.BeautifulSoup,
         uuid: str = None,
         config: Config = None,
+        deadline: float = None,
         **kwargs,
     ):
         self.soup = soup
         self.uuid = uuid
-        self.config = config or Config()
-        self.config = extend_config(self.config, kwargs)
+        # overrides in `kwargs` apply to this cleaner only, so are set on a
+        # copy of `config`, which may be shared with other documents
+        self.config = extend_config(copy.copy(config or Config()), kwargs)
+        self.deadline = deadline
 
     def decompose_tags(
         self,
@@ -309,8 +318,14 @@ class Cleaner:
         Returns
         -------
         None
+
+        Raises
+        ------
+        articleparser.exceptions.DeadlineExceededError
+            if `self.deadline` passes.
         """
         while True:
+            check_deadline(self.deadline, "replace_breaks")
             br = self.soup.find("br")
             if br is None:
                 break
@@ -546,6 +561,11 @@ class Cleaner:
         Returns
         -------
         None
+
+        Raises
+        ------
+        articleparser.exceptions.DeadlineExceededError
+            if `self.deadline` passes.
         """
         if self.soup is None:
             LOGGER.error("No soup supplied for: {}!".format(self.uuid))
@@ -555,6 +575,7 @@ class Cleaner:
             self.decompose_comments()
             self.decompose_header_footer()
             LOGGER.debug("Decomposed tags, and removed HTML comments!")
+        check_deadline(self.deadline, "decompose")
         if self.config.cssvis:
             self.clear_invisible(self.soup.body)
             LOGGER.debug(
@@ -564,6 +585,7 @@ class Cleaner:
         # remove whitespace before removing breaks, because of the
         # neighbour check in remove_breaks
         self.remove_whitespace()
+        check_deadline(self.deadline, "remove_whitespace")
         if self.config.replace_breaks:
             self.replace_breaks()
             LOGGER.debug("Removed <br> tags!")
@@ -572,6 +594,7 @@ class Cleaner:
             self.unwrap_tags(self.config.MARKUP_TAGS)
             LOGGER.debug("Stripped HTML markup from file!")
         self.soup.smooth()
+        check_deadline(self.deadline, "unwrap_tags")
         if self.config.get_linkdensity:
             self.get_linkdensity()
             self.soup.smooth()
@@ -0,0 +1,655 @@
+"""Command-line interface, parsing HTML documents on disk into JSON lines.
+
+Installed as the `articleparser` console script; also run with
+`python -m articleparser`. For example,
+
+    articleparser -j 16 -o articles.jsonl.gz corpus/ "extra/**/*.html"
+
+parses every HTML document under "corpus/" and matching the glob over 16
+worker processes (see `articleparser.batch.parse_many()`), writing one
+JSON object per document, with keys "uuid", "content", "methods", "error"
+and "timings", to a gzipped file (see `articleparser.sinks.JsonlSink`).
+Output files ending with ".parquet" are written in a columnar schema
+instead (see `articleparser.sinks.ParquetSink`; requires pyarrow), and
+those ending with ".sqlite" or ".db" to a SQLite database, in normalized
+tables (see `articleparser.sinks.SqliteSink`), replacing the records of
+documents parsed before.
+
+With `--journal`, completed documents are recorded in a journal (see
+`articleparser.journal`), so that an interrupted run can be resumed by
+running the same command again: completed documents are skipped, and
+records are appended to the output.
+
+To parse a corpus on many machines, either give each the same inputs and
+a different `--shard i/N`, or a shared `--queue` directory, from which
+machines lease chunks of documents until none are left (see
+`articleparser.workqueue`). Each machine should write its own output, in
+JSON lines or SQLite: Parquet files are only complete once closed.
+Progress and throughput are reported on standard error.
+
+With `--ndjson`, the interface is a filter for pipelines, e.g.
+
+    fetcher | articleparser --ndjson -j 8 | loader
+
+reading requests from standard input as JSON lines, each with either
+"html" (the HTML document) or "path" (its filepath), and optionally "uuid"
+and "url" (also used as the uuid, if not given), and writing each record
+(with the "url" of its request) as soon as it is parsed. Only a bounded
+number of requests are read ahead of the records written, so that a slow
+consumer slows down reading rather than filling memory. Malformed requests
+get a record with "error" type "RequestError".
+
+With `--watch`, a spool directory is watched for new HTML files (see
+`articleparser.watch`), which are parsed as they appear, and then renamed
+with the suffix ".done" (or moved to `--processed-dir`) once their records
+are flushed, until interrupted (by SIGINT or SIGTERM, after which the
+documents being parsed are finished).
+
+Routine Listings
+----------------
+iter_filepaths(paths, manifest=None)
+    Iterate over the filepaths of HTML documents given on the command line.
+main(argv=None)
+    Run the command-line interface.
+"""
+
+# Python 3.7 onwards, for annotations with standard collections
+from __future__ import annotations
+
+import argparse
+import collections
+import glob
+import json
+import logging
+import os
+from pathlib import Path
+import signal
+import sys
+import time
+from typing import IO, Any, Iterable, Iterator, Optional
+
+from articleparser.batch import REORDER_WINDOW, Source, parse_many
+from articleparser.config import Config
+from articleparser.journal import Journal
+from articleparser.sinks import JsonlSink, ParquetSink, SqliteSink
+from articleparser.util import COMPRESSION_SUFFIXES, PARSERS
+from articleparser.version import __version__
+from articleparser.watch import DirectoryWatcher, ProcessedMarker
+from articleparser.workqueue import (
+    CHUNK_SIZE,
+    LEASE_SECONDS,
+    SpoolQueue,
+    in_shard,
+    parse_shard,
+)
+
+LOGGER = logging.getLogger(__name__)
+
+# Suffixes of files collected from directories
+HTML_SUFFIXES = tuple([".html"] + [".html" + suffix for suffix in COMPRESSION_SUFFIXES])
+# Interval in seconds between progress reports
+PROGRESS_INTERVAL = 1.0
+# Interval in seconds between progress reports, if standard error is not
+# a terminal (one line per report)
+PROGRESS_INTERVAL_NO_TTY = 30.0
+# Suffixes of output files written as SQLite databases
+SQLITE_SUFFIXES = (".sqlite", ".sqlite3", ".db")
+# Keys of each output record
+OUTPUT_KEYS = ["uuid", "content", "methods", "error", "timings"]
+# Maximum number of requests read ahead of the records parsed, and of
+# records waiting to be written, per worker, with --ndjson
+NDJSON_PENDING_PER_WORKER = 8
+
+
+def _walk(directory: str) -> Iterator[str]:
+    # Iterates over HTML files under `directory`, recursively, in sorted order.
+    for root, dirnames, filenames in os.walk(directory):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.endswith(HTML_SUFFIXES):
+                yield os.path.join(root, filename)
+
+
+def iter_filepaths(
+    paths: Iterable[str],
+    manifest: IO[str] = None,
+) -> Iterator[str]:
+    """Iterate over the filepaths of HTML documents given on the command line.
+
+    Each of `paths` is either:
+    - a directory, searched recursively for files ending with a suffix in
+      `HTML_SUFFIXES`;
+    - a glob pattern (with "**" matching any number of directories),
+      whose matches are treated as files or directories;
+    - a filepath, yielded as is.
+    Filepaths are then read from `manifest`, one per line; empty lines and
+    lines beginning with "#" are skipped.
+
+    Filepaths are yielded lazily, so that parsing can begin before a large
+    directory has been listed in full.
+
+    Parameters
+    ----------
+    paths : Iterable[str]
+        Directories, glob patterns or filepaths.
+    manifest : IO[str], optional
+        A text stream listing filepaths.
+
+    Yields
+    ------
+    filepath : str
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            yield from _walk(path)
+        elif glob.has_magic(path):
+            for match in sorted(glob.iglob(path, recursive=True)):
+                if os.path.isdir(match):
+                    yield from _walk(match)
+                else:
+                    yield match
+        else:
+            yield path
+    if manifest is not None:
+        for line in manifest:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                yield line
+
+
+def _parse_request(line: bytes) -> tuple[Optional[str], Optional[str], Source]:
+    # Parses a request of --ndjson, returning its uuid, url and document;
+    # raises ValueError for malformed requests.
+    request = json.loads(line)
+    if not isinstance(request, dict):
+        raise ValueError("Request is not a JSON object.")
+    for key in ("uuid", "url", "html", "path"):
+        if request.get(key) is not None and not isinstance(request[key], str):
+            raise ValueError("{} must be a string.".format(key))
+    uuid = request.get("uuid") or request.get("url")
+    html = request.get("html")
+    path = request.get("path")
+    if (html is None) == (path is None):
+        raise ValueError("Request must have one of html and path.")
+    source = Path(path) if path is not None else html
+    return uuid, request.get("url"), source
+
+
+class _RequestReader(object):
+    # Iterates over the documents of --ndjson requests read from `stream`,
+    # as inputs of `parse_many()`: the url of the request of each document
+    # is kept in `urls`, by index, and records of malformed requests are
+    # appended to `rejected`. May be iterated by a thread of the pool.
+
+    def __init__(self, stream: IO[bytes]):
+        self.stream = stream
+        self.urls = {}
+        self.rejected = collections.deque()
+
+    def __iter__(self) -> Iterator[tuple[Optional[str], Source]]:
+        index = 0
+        for number, line in enumerate(self.stream, 1):
+            if not line.strip():
+                continue
+            try:
+                uuid, url, source = _parse_request(line)
+            except ValueError as e:
+                # including `json.JSONDecodeError` and `UnicodeDecodeError`
+                LOGGER.warning("Malformed request on line {}: {}".format(number, e))
+                self.rejected.append(
+                    {
+                        "uuid": None,
+                        "content": None,
+                        "methods": None,
+                        "error": {
+                            "type": "RequestError",
+                            "message": "Line {}: {}".format(number, e),
+                        },
+                        "timings": {},
+                        "url": None,
+                    }
+                )
+                continue
+            self.urls[index] = url
+            index += 1
+            yield uuid, source
+
+
+def _shard(value: str) -> tuple[int, int]:
+    # Parses the value of --shard.
+    try:
+        return parse_shard(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def _make_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="articleparser",
+        description="Parse HTML documents into JSON lines, one per document.",
+    )
+    parser.add_argument(
+        "paths",
+        nargs="*",
+        help="HTML files, directories (searched recursively) or glob patterns",
+    )
+    parser.add_argument(
+        "--ndjson",
+        action="store_true",
+        help='read requests from standard input as JSON lines, with "html" '
+        'or "path", and optionally "uuid" and "url", writing records as they '
+        "are parsed",
+    )
+    parser.add_argument(
+        "--watch",
+        metavar="DIRECTORY",
+        help="watch a directory for new HTML files, parsing them as they "
+        "appear until interrupted",
+    )
+    parser.add_argument(
+        "--processed-dir",
+        help='with --watch, move processed files to this directory (default: '
+        'rename them with the suffix ".done")',
+    )
+    parser.add_argument(
+        "--poll",
+        action="store_true",
+        help="with --watch, poll the directory instead of using inotify "
+        "(e.g. on network filesystems)",
+    )
+    parser.add_argument(
+        "-m",
+        "--manifest",
+        help='file listing HTML files, one per line ("-" for standard input)',
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        default="-",
+        help='output file, gzipped if ending with ".gz", Parquet if ending '
+        'with ".parquet", or a SQLite database if ending with ".sqlite" or '
+        '".db" (default: standard output)',
+    )
+    parser.add_argument(
+        "--rotate-records",
+        type=int,
+        help="begin a new output file after this many records",
+    )
+    parser.add_argument(
+        "--rotate-mb",
+        type=float,
+        help="begin a new output file after this many MB (uncompressed)",
+    )
+    parser.add_argument(
+        "--journal",
+        help="journal of completed documents, for resuming an interrupted run "
+        "with the same command (requires an uncompressed JSON lines output file)",
+    )
+    parser.add_argument(
+        "--shard",
+        type=_shard,
+        help='only parse documents of shard I out of N (given as "I/N", '
+        "with 0 <= I < N), partitioned by a stable hash of their filepaths",
+    )
+    parser.add_argument(
+        "--queue",
+        help="shared spool directory of a work queue, populated with the "
+        "documents given by the first machine to use it, from which "
+        "machines lease chunks of documents",
+    )
+    parser.add_argument(
+        "--queue-chunk-size",
+        type=int,
+        default=CHUNK_SIZE,
+        help="documents per chunk of a new work queue (default: {})".format(CHUNK_SIZE),
+    )
+    parser.add_argument(
+        "--lease-seconds",
+        type=float,
+        default=LEASE_SECONDS,
+        help="seconds after which chunks leased by a machine which stopped "
+        "renewing its leases are taken over (default: {:g})".format(LEASE_SECONDS),
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="number of worker processes (default: number of CPUs)",
+    )
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        help="documents sent to a worker at a time (default: 4, or 1 with "
+        "--ndjson, so that each request is parsed as soon as it is read)",
+    )
+    parser.add_argument(
+        "--ordered",
+        action="store_true",
+        help="write records in input order (default: as completed)",
+    )
+    parser.add_argument(
+        "--parser",
+        choices=PARSERS,
+        help='parser for documents (default: "html5lib")',
+    )
+    parser.add_argument(
+        "--metadata-only",
+        action="store_true",
+        help="only extract metadata and short fields",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        help="time limit in seconds for parsing each document, after which "
+        "the fields extracted so far are kept (default: no limit)",
+    )
+    parser.add_argument(
+        "--cache",
+        help="SQLite database caching results, so that documents parsed "
+        "before with the same settings are not parsed again",
+    )
+    parser.add_argument(
+        "--cache-mb",
+        type=float,
+        help="size limit of the cache in MB, above which the least recently "
+        "used results are evicted (default: no limit)",
+    )
+    parser.add_argument(
+        "--task-timeout",
+        type=float,
+        help="time limit in seconds for a worker on a document, after which "
+        "the worker is killed and the document recorded as failed",
+    )
+    parser.add_argument(
+        "--max-rss",
+        type=float,
+        help="memory limit of a worker in MB (Linux only), after which the "
+        "worker is killed, or replaced if between documents",
+    )
+    parser.add_argument(
+        "--max-tasks-per-child",
+        type=int,
+        help="number of documents after which a worker is replaced",
+    )
+    parser.add_argument(
+        "-q",
+        "--quiet",
+        action="store_true",
+        help="do not report progress and throughput",
+    )
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        action="count",
+        default=0,
+        help="log more (-v for info, -vv for debug)",
+    )
+    parser.add_argument("--version", action="version", version=__version__)
+    return parser
+
+
+def _with_rejected(
+    records: Iterator[dict[str, Any]],
+    requests: Optional[_RequestReader],
+) -> Iterator[dict[str, Any]]:
+    # Iterates over `records`, adding the url of their --ndjson requests,
+    # and the records of malformed requests.
+    if requests is None:
+        yield from records
+        return
+    for record in records:
+        while requests.rejected:
+            yield requests.rejected.popleft()
+        record["url"] = requests.urls.pop(record["index"])
+        yield record
+    while requests.rejected:
+        yield requests.rejected.popleft()
+
+
+def _stop_on_signals(watcher: DirectoryWatcher) -> None:
+    # Stops `watcher` on SIGINT or SIGTERM, so that the documents being
+    # parsed are finished; a second SIGINT interrupts as usual.
+    def stop(signum: int, frame: Any) -> None:
+        LOGGER.warning("Stopping; finishing the documents being parsed.")
+        watcher.close()
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+
+def _report(count: int, errors: int, elapsed: float, final: bool = False) -> None:
+    # Writes progress or final throughput statistics to standard error.
+    rate = count / elapsed if elapsed > 0 else 0.0
+    message = "{} documents, {} errors, {:.1f}s, {:.1f} documents/s".format(
+        count, errors, elapsed, rate
+    )
+    if sys.stderr.isatty():
+        sys.stderr.write("\r" + message + ("\n" if final else ""))
+    else:
+        sys.stderr.write(message + "\n")
+    sys.stderr.flush()
+
+
+def main(argv: list[str] = None) -> int:
+    """Run the command-line interface.
+
+    Parameters
+    ----------
+    argv : list[str], optional
+        The command-line arguments, defaulting to `sys.argv[1:]`.
+
+    Returns
+    -------
+    int
+        The exit status: 0 on success, 2 if no documents were given.
+    """
+    args = _make_parser().parse_args(argv)
+    logging.basicConfig(
+        level=[logging.WARNING, logging.INFO, logging.DEBUG][min(args.verbose, 2)],
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    )
+    if args.ndjson and (
+        args.paths
+        or args.manifest is not None
+        or args.queue is not None
+        or args.shard is not None
+        or args.journal is not None
+    ):
+        _make_parser().error(
+            "--ndjson cannot be used with paths, --manifest, --queue, --shard or --journal"
+        )
+    if args.watch is not None and (
+        args.paths
+        or args.manifest is not None
+        or args.ndjson
+        or args.queue is not None
+        or args.shard is not None
+        or args.journal is not None
+        or args.output.endswith(".parquet")
+    ):
+        _make_parser().error(
+            "--watch cannot be used with paths, --manifest, --ndjson, --queue, "
+            "--shard, --journal or Parquet output"
+        )
+    if args.watch is None and (args.processed_dir is not None or args.poll):
+        _make_parser().error("--processed-dir and --poll require --watch")
+    if (
+        not args.paths
+        and args.manifest is None
+        and args.queue is None
+        and not args.ndjson
+        and args.watch is None
+    ):
+        _make_parser().print_usage(sys.stderr)
+        sys.stderr.write("articleparser: error: no documents given\n")
+        return 2
+    if args.output.endswith((".parquet",) + SQLITE_SUFFIXES) and (
+        args.rotate_records is not None or args.rotate_mb is not None
+    ):
+        _make_parser().error("Parquet and SQLite output cannot be rotated")
+    if args.queue is not None and args.output.endswith(".parquet"):
+        # chunks are completed once their records are flushed, but Parquet
+        # files are only readable once closed
+        _make_parser().error("--queue cannot be used with Parquet output")
+    if args.journal is not None and (
+        args.output == "-"
+        or args.output.endswith((".gz", ".parquet") + SQLITE_SUFFIXES)
+        or args.rotate_records is not None
+        or args.rotate_mb is not None
+    ):
+        _make_parser().error(
+            "--journal requires an uncompressed JSON lines output file, without rotation"
+        )
+
+    if args.chunksize is None:
+        args.chunksize = 1 if args.ndjson or args.watch is not None else 4
+
+    config = Config()
+    config.parser = args.parser
+    config.metadata_only = args.metadata_only
+    config.timeout = args.timeout
+    config.cache_path = args.cache
+    config.cache_max_bytes = None if args.cache_mb is None else int(args.cache_mb * 2 ** 20)
+
+    manifest = None
+    if args.manifest == "-":
+        manifest = sys.stdin
+    elif args.manifest is not None:
+        manifest = open(args.manifest, encoding="utf-8")
+    requests = None
+    filepaths = iter_filepaths(args.paths, manifest)
+    if args.ndjson:
+        requests = _RequestReader(sys.stdin.buffer)
+        filepaths = requests
+    watcher = None
+    if args.watch is not None:
+        try:
+            watcher = DirectoryWatcher(
+                args.watch, HTML_SUFFIXES, use_inotify=False if args.poll else None
+            )
+        except OSError as e:
+            _make_parser().error(str(e))
+        filepaths = watcher
+        _stop_on_signals(watcher)
+    if args.shard is not None:
+        shard_index, shard_count = args.shard
+        filepaths = (
+            filepath for filepath in filepaths if in_shard(filepath, shard_index, shard_count)
+        )
+    journal = None
+    if args.journal is not None:
+        journal = Journal(args.journal)
+    max_pending = None
+    if args.ndjson:
+        max_pending = args.jobs * NDJSON_PENDING_PER_WORKER
+    if args.output.endswith(".parquet"):
+        output = ParquetSink(args.output)
+    elif args.output.endswith(SQLITE_SUFFIXES):
+        output = SqliteSink(args.output)
+    else:
+        output = JsonlSink(
+            sys.stdout if args.output == "-" else args.output,
+            queue_size=max_pending or 1024,
+            rotate_bytes=None if args.rotate_mb is None else int(args.rotate_mb * 2 ** 20),
+            rotate_records=args.rotate_records,
+            journal=journal,
+        )
+    spool = None
+    if args.queue is not None:
+        spool = SpoolQueue(args.queue, lease_seconds=args.lease_seconds)
+        spool.create(filepaths, args.queue_chunk_size)
+        filepaths = spool.iter_items(
+            before_complete=output.flush,
+            skip=None if journal is None else journal.__contains__,
+            # enough for the documents of every worker being parsed or read
+            # ahead, and with --ordered, waiting to be reordered, so that
+            # workers are kept busy while the next chunk is leased
+            max_outstanding=(
+                0 if args.jobs == 1 else args.jobs * (2 * args.chunksize + REORDER_WINDOW + 1)
+            ),
+        )
+    elif journal is not None:
+        filepaths = (filepath for filepath in filepaths if filepath not in journal)
+
+    marker = None
+    if watcher is not None:
+        marker = ProcessedMarker(output.flush, args.processed_dir)
+    output_keys = OUTPUT_KEYS + ["url"] if args.ndjson else OUTPUT_KEYS
+    show_progress = not args.quiet
+    interval = PROGRESS_INTERVAL if sys.stderr.isatty() else PROGRESS_INTERVAL_NO_TTY
+    count = 0
+    errors = 0
+    start = time.perf_counter()
+    last_report = start
+    records = None
+    try:
+        records = parse_many(
+            # filepaths as given on the command line are kept as uuids
+            (
+                (filepath, Path(filepath)) if isinstance(filepath, str) else filepath
+                for filepath in filepaths
+            ),
+            workers=args.jobs,
+            chunksize=args.chunksize,
+            ordered=args.ordered,
+            config=config,
+            task_timeout=args.task_timeout,
+            max_rss=None if args.max_rss is None else int(args.max_rss * 2 ** 20),
+            max_tasks_per_child=args.max_tasks_per_child,
+            max_pending=max_pending,
+        )
+        for record in _with_rejected(records, requests):
+            try:
+                output.write({key: record[key] for key in output_keys})
+            except ValueError as e:
+                # records which cannot be stored in the database, e.g. those
+                # of malformed requests, which have no uuid
+                if not isinstance(output, SqliteSink):
+                    raise
+                LOGGER.warning(
+                    "Skipping record with error {!r}: {}".format(record["error"], e)
+                )
+            if spool is not None:
+                spool.item_done(record["index"])
+            if marker is not None:
+                marker.add(record["uuid"])
+            count += 1
+            if record["error"] is not None:
+                errors += 1
+            now = time.perf_counter()
+            if show_progress and now - last_report >= interval:
+                _report(count, errors, now - start)
+                last_report = now
+    except BrokenPipeError:
+        if args.output != "-":
+            raise
+        # standard output was closed by its consumer (e.g. `head`); further
+        # writes, including flushing at exit, would fail again
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 1
+    finally:
+        if watcher is not None:
+            watcher.close()
+        if records is not None:
+            # stops the pool before its thread reading inputs waits for
+            # further records to be consumed
+            records.close()
+        try:
+            if marker is not None:
+                marker.close()
+            output.close()
+        except BrokenPipeError:
+            if args.output != "-":
+                raise
+        if spool is not None:
+            spool.close()
+        if journal is not None:
+            journal.close()
+        if manifest is not None and manifest is not sys.stdin:
+            manifest.close()
+
+    if show_progress:
+        _report(count, errors, time.perf_counter() - start, final=True)
+    return 0
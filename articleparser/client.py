@@ -0,0 +1,206 @@
+"""Client of the parsing daemon, over a Unix domain socket.
+
+This module only imports the standard library, so that it starts quickly:
+the parsing itself happens in the daemon (see `articleparser.daemon`),
+which has already imported articleparser and its dependencies.
+
+The protocol is as follows. Each request is a line of JSON, with either:
+    "path" : str
+        The absolute filepath of a HTML document readable by the daemon;
+or:
+    "length" : int
+        The size in bytes of the HTML document, which follows the line as
+        raw bytes;
+and optionally:
+    "uuid" : str
+        An identifier of the HTML document.
+Each response is a line of JSON: the record of the document, with keys
+"uuid", "content", "methods", "error" and "timings" (see
+`articleparser.batch`). Many requests can be sent on one connection,
+without waiting for responses, which are sent in the order of requests.
+Malformed requests get a record with "error" type "ProtocolError", and the
+connection is closed.
+
+Installed as the `articleparser-client` console script; for example,
+
+    articleparser-client page.html other.html.gz
+    curl -s https://example.com/ | articleparser-client -
+
+Routine Listings
+----------------
+DaemonClient
+    A connection to the parsing daemon.
+main(argv=None)
+    Run the command-line client.
+"""
+
+# Python 3.7 onwards, for annotations with standard collections
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import socket
+import sys
+from typing import Any, Union
+
+LOGGER = logging.getLogger(__name__)
+
+# Path of the socket of the daemon, unless given; `tempfile` is not used to
+# find the temporary directory, since it is slow to import
+DEFAULT_SOCKET_PATH = os.environ.get(
+    "ARTICLEPARSER_SOCKET",
+    os.path.join(
+        os.environ.get("TMPDIR", "/tmp"), "articleparser-{}.sock".format(os.getuid())
+    ),
+)
+# Maximum number of requests sent by `main()` before receiving responses
+PIPELINE_WINDOW = 32
+
+
+class DaemonClient(object):
+    """A connection to the parsing daemon.
+
+    Parameters
+    ----------
+    socket_path : str, default DEFAULT_SOCKET_PATH
+        The path of the socket of the daemon; defaults to the environment
+        variable "ARTICLEPARSER_SOCKET", if set.
+    timeout : float, optional
+        The timeout in seconds of operations on the socket.
+
+    Raises
+    ------
+    OSError
+        if the daemon cannot be connected to (e.g. `FileNotFoundError` or
+        `ConnectionRefusedError`, if it is not running).
+    """
+
+    def __init__(self, socket_path: str = None, timeout: float = None):
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.settimeout(timeout)
+        self._socket.connect(socket_path or DEFAULT_SOCKET_PATH)
+        self._reader = self._socket.makefile("rb")
+
+    def __enter__(self) -> DaemonClient:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def send(
+        self,
+        path: str = None,
+        html: Union[str, bytes] = None,
+        uuid: str = None,
+    ) -> None:
+        """Sends a request for a document, given by `path` or `html`,
+        without waiting for the response; see `receive()`."""
+        request = {}
+        if uuid is not None:
+            request["uuid"] = uuid
+        if html is not None:
+            if isinstance(html, str):
+                html = html.encode("utf-8")
+            request["length"] = len(html)
+            body = html
+        elif path is not None:
+            request["path"] = os.path.abspath(path)
+            body = b""
+        else:
+            raise ValueError("Must provide one of path and html!")
+        self._socket.sendall(json.dumps(request).encode("utf-8") + b"\n" + body)
+
+    def receive(self) -> dict[str, Any]:
+        """Receives the response to the earliest request not yet received.
+
+        Raises
+        ------
+        ConnectionError
+            if the daemon closed the connection.
+        """
+        line = self._reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed by the daemon.")
+        return json.loads(line)
+
+    def parse(
+        self,
+        path: str = None,
+        html: Union[str, bytes] = None,
+        uuid: str = None,
+    ) -> dict[str, Any]:
+        """Parses a document, given by `path` or `html`, returning its
+        record."""
+        self.send(path=path, html=html, uuid=uuid)
+        return self.receive()
+
+    def close(self) -> None:
+        self._reader.close()
+        self._socket.close()
+
+
+def main(argv: list[str] = None) -> int:
+    """Run the command-line client.
+
+    Up to `PIPELINE_WINDOW` documents are sent ahead of their responses, so
+    that the daemon parses them in parallel; records are written to
+    standard output as JSON lines, in order.
+
+    Returns
+    -------
+    int
+        The exit status: 0 on success, 1 if the daemon cannot be reached,
+        or any document failed.
+    """
+    parser = argparse.ArgumentParser(
+        prog="articleparser-client",
+        description="Parse HTML documents with a running articleparser daemon.",
+    )
+    parser.add_argument(
+        "paths",
+        nargs="+",
+        help='HTML files ("-" for a document on standard input)',
+    )
+    parser.add_argument(
+        "-s",
+        "--socket",
+        default=DEFAULT_SOCKET_PATH,
+        help="socket of the daemon (default: %(default)s)",
+    )
+    parser.add_argument("--uuid", help="identifier of a document on standard input")
+    args = parser.parse_args(argv)
+
+    try:
+        client = DaemonClient(args.socket)
+    except OSError as e:
+        sys.stderr.write("articleparser-client: cannot connect to {}: {}\n".format(args.socket, e))
+        return 1
+    status = 0
+
+    def write_record() -> None:
+        nonlocal status
+        record = client.receive()
+        if record["error"] is not None:
+            status = 1
+        sys.stdout.write(json.dumps(record) + "\n")
+
+    with client:
+        pending = 0
+        for path in args.paths:
+            if path == "-":
+                client.send(html=sys.stdin.buffer.read(), uuid=args.uuid)
+            else:
+                client.send(path=path)
+            pending += 1
+            if pending >= PIPELINE_WINDOW:
+                write_record()
+                pending -= 1
+        for _ in range(pending):
+            write_record()
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
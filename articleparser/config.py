@@ -7,6 +7,7 @@ import logging
 
 from articleparser.settings import (
     DECOMPOSE_TAGS,
+    HEAD_REMOVE_TAGS,
     MARKUP_TAGS,
 )
 
@@ -22,6 +23,55 @@ class Config(object):
         # This list should be chosen from tags in `PHRASING_TAGS`.
         # This list should not contain "a".
         self.MARKUP_TAGS = MARKUP_TAGS
+        # A list of tag names to remove from <head> before parsing.
+        # Should be chosen from "iframe", "noscript" and "script".
+        self.HEAD_REMOVE_TAGS = HEAD_REMOVE_TAGS
+
+        # The parser used by `make_soup()` when loading documents, from
+        # {"html.parser", "lxml", "html5lib", "adaptive"} (default None, which
+        # uses "html5lib"). "adaptive" parses with "lxml" and falls back to
+        # "html5lib" for documents failing `check_soup_structure()`.
+        self.parser = None
+
+        # Whether to only extract metadata and short fields (default False).
+        # If True, only the <head> of the document (and any JSON-LD, <h1> and
+        # timestamp elements in <body>; see `extract_head()`) is parsed, and
+        # `Article.parse()` does not clean the document or extract article
+        # text and assets.
+        self.metadata_only = False
+
+        # Resource budgets per document, checked before the document is
+        # parsed (default None, meaning no limit):
+        # The maximum size of the (decompressed) document, in bytes.
+        self.MAX_INPUT_BYTES = None
+        # The maximum number of elements, counted from start tags.
+        self.MAX_NODES = None
+        # The maximum nesting depth of elements; an estimate, since end tags
+        # which may be omitted (e.g. of <p> and <li>) are not counted.
+        self.MAX_DEPTH = None
+        # What to do with documents exceeding a budget, from
+        # {"reject", "truncate", "metadata_only"} (default "reject"):
+        # "reject" raises `BudgetExceededError`;
+        # "truncate" parses the document up to where the budget was exceeded
+        # (only its <head>, if exceeded there);
+        # "metadata_only" parses only its <head>, as with `metadata_only`.
+        # The budget exceeded is recorded in `Article.methods`.
+        self.budget_action = "reject"
+
+        # The time limit in seconds for `Article.parse()` (default None,
+        # meaning no limit). Once it passes, parsing stops at the next check,
+        # keeping the fields extracted so far; see `Article.parse()`.
+        # Loading the document is not included.
+        self.timeout = None
+
+        # The path of a SQLite database caching results of `Article.parse()`
+        # (default None, meaning no cache); see `articleparser.cache`.
+        # Results are keyed by the bytes of the document and every other
+        # attribute of this object, so changing any setting misses the cache.
+        self.cache_path = None
+        # The maximum size of the cache in bytes, above which the least
+        # recently used results are evicted (default None, meaning no limit).
+        self.cache_max_bytes = None
 
         # Whether tags (as defined in `DECOMPOSE_TAGS`) and comments are
         # decomposed (default True)
@@ -0,0 +1,314 @@
+"""A long-lived parsing daemon, listening on a Unix domain socket.
+
+Importing articleparser and its dependencies takes far longer than parsing
+a typical document, so running the command-line interface once per
+document is dominated by startup. The daemon pays for it once: it imports
+the library, starts a pool of worker processes (warmed up by parsing a
+small document), and then parses documents sent by clients (see
+`articleparser.client`, which describes the protocol) on the pool, so that
+the latency of each document is its parse time alone.
+
+Installed as the `articleparser-daemon` console script; for example,
+
+    articleparser-daemon -j 4 &
+    articleparser-client page.html
+
+Routine Listings
+----------------
+serve(socket_path=None, workers=None, config=None, **kwargs)
+    Run the daemon until interrupted.
+main(argv=None)
+    Run the daemon from the command line.
+"""
+
+# Python 3.7 onwards, for annotations with standard collections
+from __future__ import annotations
+
+import argparse
+import asyncio
+import functools
+import json
+import logging
+import os
+from pathlib import Path
+import signal
+import socket
+import sys
+from typing import Any
+
+from articleparser.aio import AsyncParser
+from articleparser.batch import parse_one
+from articleparser.client import DEFAULT_SOCKET_PATH
+from articleparser.config import Config
+from articleparser.util import PARSERS
+
+LOGGER = logging.getLogger(__name__)
+
+# Maximum number of requests of a connection being parsed, or waiting to be
+# sent, before the daemon stops reading further requests
+PIPELINE_DEPTH = 64
+# Maximum size of a HTML document sent in a request, in bytes
+MAX_REQUEST_BYTES = 1 << 26
+# Document parsed to warm up the daemon and its workers, exercising the
+# extraction of every field, so that lazily loaded data (e.g. language tags
+# and date parsers) is loaded before the first request
+WARMUP_HTML = """<!DOCTYPE html>
+<html lang="en-GB"><head><meta charset="utf-8"><title>Warm-up | Site</title>
+<link rel="canonical" href="https://example.com/news/warm-up">
+<meta name="description" content="A document to warm up the parser.">
+<meta property="og:type" content="article"><meta property="og:title" content="Warm-up">
+<meta property="og:site_name" content="Site">
+<meta property="article:published_time" content="2021-02-01T10:00:00Z">
+<meta property="article:section" content="News"><meta property="article:tag" content="a, b">
+<script type="application/ld+json">{"@context": "https://schema.org", "@type": "NewsArticle",
+"headline": "Warm-up", "datePublished": "2021-02-01T10:00:00Z", "keywords": "a, b",
+"author": {"@type": "Person", "name": "Name", "url": "https://example.com/name"}}</script>
+</head><body><nav><a href="/">Home</a></nav><article><h1>Warm-up</h1>
+<figure><img src="/a.jpg" alt="An image"><figcaption>A caption</figcaption></figure>
+<p>A first paragraph of text, with enough words in it to be detected as article text.</p>
+<p>A second paragraph with <a href="https://example.org/page">a link</a> and
+<a href="https://example.com/a.pdf">a document</a>.</p><div style="display:none">Hidden</div>
+<iframe src="https://www.youtube.com/embed/abcdefghijk"></iframe></article></body></html>
+"""
+
+
+def _error_record(uuid: str, error_type: str, message: str) -> dict[str, Any]:
+    # The record of a request which could not be parsed.
+    return {
+        "uuid": uuid,
+        "content": None,
+        "methods": None,
+        "error": {"type": error_type, "message": message},
+        "timings": {},
+    }
+
+
+async def _read_request(reader: asyncio.StreamReader) -> tuple[Any, str]:
+    # Reads a request, returning the source of the document and its uuid;
+    # raises ValueError for malformed requests, and EOFError at the end of
+    # the connection.
+    line = await reader.readline()
+    if not line:
+        raise EOFError
+    request = json.loads(line)
+    if not isinstance(request, dict):
+        raise ValueError("Request is not a JSON object.")
+    uuid = request.get("uuid")
+    if uuid is not None and not isinstance(uuid, str):
+        raise ValueError("uuid must be a string.")
+    if "path" in request:
+        if not isinstance(request["path"], str) or not os.path.isabs(request["path"]):
+            raise ValueError("path must be an absolute path.")
+        return Path(request["path"]), uuid
+    length = request.get("length")
+    if not isinstance(length, int) or not 0 <= length <= MAX_REQUEST_BYTES:
+        raise ValueError("length must be an integer from 0 to {}.".format(MAX_REQUEST_BYTES))
+    try:
+        return await reader.readexactly(length), uuid
+    except asyncio.IncompleteReadError:
+        raise ValueError("Connection closed before the end of the document.")
+
+
+async def _handle_connection(
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+    parser: AsyncParser,
+) -> None:
+    # Serves the requests of a connection: requests are read and submitted
+    # to `parser` as they arrive, and responses sent in order.
+    responses = asyncio.Queue(PIPELINE_DEPTH)
+
+    async def send_responses() -> None:
+        # Sends responses until None is received; if the connection breaks,
+        # remaining documents are cancelled.
+        broken = False
+        while True:
+            response = await responses.get()
+            if response is None:
+                return
+            if broken:
+                response.cancel()
+                continue
+            try:
+                record = await response
+            except Exception as e:
+                # e.g. `BrokenProcessPool`, if a worker was killed
+                LOGGER.exception("Parsing failed in the daemon.")
+                record = _error_record(None, type(e).__name__, str(e))
+            try:
+                writer.write(json.dumps(record).encode("utf-8") + b"\n")
+                await writer.drain()
+            except (ConnectionError, OSError):
+                broken = True
+
+    sender = asyncio.ensure_future(send_responses())
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            try:
+                source, uuid = await _read_request(reader)
+            except EOFError:
+                break
+            except (ValueError, ConnectionError) as e:
+                # also raised by `reader.readline()` for overlong lines
+                LOGGER.warning("Malformed request: {}".format(e))
+                response = loop.create_future()
+                response.set_result(_error_record(None, "ProtocolError", str(e)))
+                await responses.put(response)
+                break
+            await responses.put(asyncio.ensure_future(parser.parse(source, uuid)))
+    finally:
+        await responses.put(None)
+        await sender
+        writer.close()
+
+
+def _remove_stale_socket(socket_path: str) -> None:
+    # Removes the socket of a daemon which is no longer running.
+    if not os.path.exists(socket_path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+    except OSError:
+        os.unlink(socket_path)
+    else:
+        raise OSError("A daemon is already listening on: {}".format(socket_path))
+    finally:
+        probe.close()
+
+
+async def serve(
+    socket_path: str = None,
+    workers: int = None,
+    config: Config = None,
+    **kwargs,
+) -> None:
+    """Run the daemon until interrupted.
+
+    Listens on `socket_path` (readable and writable by the current user
+    only), until SIGINT or SIGTERM is received, and then removes it.
+
+    Parameters
+    ----------
+    socket_path : str, default DEFAULT_SOCKET_PATH
+        The path of the socket to listen on.
+    workers : int, optional
+        The number of worker processes, defaulting to `os.cpu_count()`.
+    config : articleparser.config.Config, optional
+        A Config object consisting optional settings, used for all
+        documents.
+    **kwargs : optional
+        Extra optional arguments to extend `config`.
+
+    Raises
+    ------
+    OSError
+        if another daemon is listening on `socket_path`.
+    """
+    socket_path = socket_path or DEFAULT_SOCKET_PATH
+    workers = workers or os.cpu_count() or 1
+    _remove_stale_socket(socket_path)
+
+    # warm up in the daemon first, so that forked workers start warm
+    parse_one(WARMUP_HTML, config=config, **kwargs)
+    parser = AsyncParser(
+        "process",
+        workers=workers,
+        max_in_flight=workers * PIPELINE_DEPTH,
+        config=config,
+        **kwargs,
+    )
+    await asyncio.gather(*[parser.parse(WARMUP_HTML) for _ in range(workers)])
+
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+    # the socket is created readable and writable by the current user only,
+    # so that it is never accessible to others, even briefly
+    umask = os.umask(0o177)
+    try:
+        server = await asyncio.start_unix_server(
+            functools.partial(_handle_connection, parser=parser), path=socket_path
+        )
+    finally:
+        os.umask(umask)
+    LOGGER.info("Listening on {} with {} workers.".format(socket_path, workers))
+    try:
+        async with server:
+            await stop.wait()
+    finally:
+        parser.close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        LOGGER.info("Stopped listening on: {}".format(socket_path))
+
+
+def main(argv: list[str] = None) -> int:
+    """Run the daemon from the command line.
+
+    Returns
+    -------
+    int
+        The exit status: 0 once stopped, 1 if another daemon is running.
+    """
+    parser = argparse.ArgumentParser(
+        prog="articleparser-daemon",
+        description="Parse HTML documents sent over a Unix domain socket.",
+    )
+    parser.add_argument(
+        "-s",
+        "--socket",
+        default=DEFAULT_SOCKET_PATH,
+        help="socket to listen on (default: %(default)s)",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="number of worker processes (default: number of CPUs)",
+    )
+    parser.add_argument(
+        "--parser",
+        choices=PARSERS,
+        help='parser for documents (default: "html5lib")',
+    )
+    parser.add_argument(
+        "--metadata-only",
+        action="store_true",
+        help="only extract metadata and short fields",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        help="time limit in seconds for parsing each document",
+    )
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        action="count",
+        default=0,
+        help="log more (-v for info, -vv for debug)",
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(
+        level=[logging.WARNING, logging.INFO, logging.DEBUG][min(args.verbose, 2)],
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    )
+
+    config = Config()
+    config.parser = args.parser
+    config.metadata_only = args.metadata_only
+    config.timeout = args.timeout
+    try:
+        asyncio.run(serve(args.socket, args.jobs, config))
+    except OSError as e:
+        sys.stderr.write("articleparser-daemon: {}\n".format(e))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
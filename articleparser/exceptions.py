@@ -0,0 +1,53 @@
+"""Defines the exceptions raised by the package.
+"""
+
+
+class ArticleParserError(Exception):
+    """Base class for exceptions raised by the package."""
+
+
+class BudgetExceededError(ArticleParserError):
+    """Raised when a document exceeds a resource budget set in `Config`.
+
+    Parameters
+    ----------
+    budget : {"MAX_INPUT_BYTES", "MAX_NODES", "MAX_DEPTH"}
+        The name of the budget exceeded.
+    limit : int
+        The value of the budget.
+    position : int
+        The index in `html_doc` at which the budget was exceeded.
+    html_doc : str, optional
+        The HTML document as read so far; for "MAX_INPUT_BYTES", this is
+        the document truncated to `limit` bytes.
+    """
+
+    def __init__(
+        self,
+        budget: str,
+        limit: int,
+        position: int,
+        html_doc: str = None,
+    ):
+        super().__init__(
+            "Document exceeds {} of {} (at character {}).".format(budget, limit, position)
+        )
+        self.budget = budget
+        self.limit = limit
+        self.position = position
+        self.html_doc = html_doc
+
+
+class DeadlineExceededError(ArticleParserError):
+    """Raised when a deadline set for parsing a document has passed.
+
+    Parameters
+    ----------
+    stage : str
+        The stage of the pipeline at which the deadline was found to have
+        passed, e.g. "replace_breaks".
+    """
+
+    def __init__(self, stage: str):
+        super().__init__("Deadline exceeded at stage: {}.".format(stage))
+        self.stage = stage
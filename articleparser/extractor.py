@@ -33,6 +33,7 @@ from articleparser.settings import (
     RIGHT_NOSPACE_PUNCTUATION,
 )
 from articleparser.util import (
+    check_deadline,
     extend_config,
     get_child_text,
     get_css_selector_of_soup_tag,
@@ -1413,6 +1414,11 @@ class ArticleExtractor(AssetExtractor):
     page_url : str, optional
         The page URL of the article, or None if not provided.
         Same as in AssetExtractor.
+    deadline : float, optional
+        A deadline for extracting article text, as a value of
+        `time.monotonic()`. It is checked within
+        `remove_high_linkdensity_sections()` and `get_article_text()`;
+        once passed, these raise `DeadlineExceededError`.
 
     Attributes
     ----------
@@ -1420,6 +1426,7 @@ class ArticleExtractor(AssetExtractor):
     metadata
     config
     page_url
+    deadline
     base_tag : bs4.element.Tag
         A `bs4.element.Tag` object representing the main section of the HTML
         document, from which all content and media are extracted.
@@ -1543,9 +1550,11 @@ class ArticleExtractor(AssetExtractor):
         metadata: dict[str, dict[str, Any]],
         config: Config,
         page_url: str = None,
+        deadline: float = None,
     ):
         super().__init__(soup, page_url)
         self.config = config
+        self.deadline = deadline
 
         self.metadata = metadata
         self.inline_links_list = []
@@ -2680,7 +2689,7 @@ class ArticleExtractor(AssetExtractor):
         else:
             # In practice, never raised because the last selector in
             # `BASE_TAG_SELECTORS` is the body itself.
-            raise ValueError
+            raise ValueError("No base tag found from BASE_TAG_SELECTORS.")
 
     @staticmethod
     def _get_lowest_common_ancestor(
@@ -2973,6 +2982,11 @@ class ArticleExtractor(AssetExtractor):
         Returns
         -------
         None
+
+        Raises
+        ------
+        articleparser.exceptions.DeadlineExceededError
+            if `self.deadline` passes.
         """
         # assert top_tag.parent is None
         SECTIONING_TAGS = [
@@ -2986,6 +3000,7 @@ class ArticleExtractor(AssetExtractor):
             "ul",
         ]
         while True:
+            check_deadline(self.deadline, "remove_high_linkdensity_sections")
             for sectioning_tag in tag.find_all(SECTIONING_TAGS):
                 link_density = sectioning_tag.get("_linkdensity")
                 if float(link_density) > self.config.LINKDENSITY_UPPERBOUND:
@@ -3105,6 +3120,11 @@ class ArticleExtractor(AssetExtractor):
         -------
         article_text : list[str]
             A list, with each element representing text from a paragraph.
+
+        Raises
+        ------
+        articleparser.exceptions.DeadlineExceededError
+            if `self.deadline` passes.
         """
         # calculate top_tag if not yet done
         if not self.top_tag:
@@ -3126,7 +3146,10 @@ class ArticleExtractor(AssetExtractor):
             # error reporting
             choices = self.TEXT_TO_COLLECT_LISTS[-1]
 
+        # paragraphs are kept in `self.article_text` as they are extracted,
+        # so that they are available if the deadline passes
         text_list = []
+        self.article_text = text_list
         if top_tag.name in choices:
             tags_list = [top_tag] + top_tag.find_all(choices)
         else:
@@ -3134,6 +3157,7 @@ class ArticleExtractor(AssetExtractor):
         # tags_list may contain duplicated content from nested tags.
 
         while tags_list:
+            check_deadline(self.deadline, "get_article_text")
             tag = tags_list.pop(0)
 
             # check if tag contains text
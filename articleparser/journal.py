@@ -0,0 +1,118 @@
+"""An append-only journal of completed documents, for resumable batches.
+
+A batch writing records to a file with `articleparser.sinks.JsonlSink` can
+keep a journal of the documents whose records have been written, each
+with the size of the output once its record was written. If the batch is
+interrupted (even by `kill -9`), it can be restarted with the same inputs:
+documents in the journal are skipped, the output is truncated to the size
+recorded for the last journaled document (dropping any records written
+after it, which are not journaled), and new records are appended.
+
+Journal entries are only made durable after the records they refer to:
+`JsonlSink` fsyncs the output, then the journal, every
+`JOURNAL_SYNC_RECORDS` records or `JOURNAL_SYNC_INTERVAL` seconds.
+
+Each line of the journal is a JSON array of the key of a document (its
+uuid, which for files is the filepath) and the output size.
+
+Routine Listings
+----------------
+Journal
+    An append-only journal of completed documents.
+"""
+
+# Python 3.7 onwards, for annotations with standard collections
+from __future__ import annotations
+
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Union
+
+LOGGER = logging.getLogger(__name__)
+
+# Number of records after which `JsonlSink` syncs the output and journal
+JOURNAL_SYNC_RECORDS = 1000
+# Interval in seconds after which `JsonlSink` syncs the output and journal
+JOURNAL_SYNC_INTERVAL = 5.0
+
+
+class Journal(object):
+    """An append-only journal of completed documents.
+
+    Opening a journal reads its existing entries, so that `key in journal`
+    is a set lookup. An incomplete last line, left by a process killed
+    while writing it, is discarded. New entries are buffered by `add()`,
+    and written and fsynced by `sync()`.
+
+    Parameters
+    ----------
+    path : str or Path
+        The path of the journal, created if it does not exist.
+
+    Attributes
+    ----------
+    path : str
+    done : set[str]
+        The keys of the documents in the journal, including those added
+        and not yet synced.
+    offset : int
+        The output size recorded by the last entry, or 0 if none.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = str(path)
+        self.done = set()
+        self.offset = 0
+        self._pending = []
+
+        if os.path.exists(self.path):
+            with open(self.path, "rb") as f:
+                data = f.read()
+            end = data.rfind(b"\n") + 1
+            if end < len(data):
+                LOGGER.warning("Discarding incomplete last entry of journal: {}".format(self.path))
+                os.truncate(self.path, end)
+            for line in data[:end].splitlines():
+                key, offset = json.loads(line)
+                self.done.add(key)
+                self.offset = offset
+            LOGGER.info("Read {} entries from journal: {}".format(len(self.done), self.path))
+        self._file = open(self.path, "ab")
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.done
+
+    def __len__(self) -> int:
+        return len(self.done)
+
+    def __enter__(self) -> Journal:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def add(self, key: str, offset: int) -> None:
+        """Adds an entry for the document `key`, whose record ends at
+        `offset` in the output. The entry is written by `sync()`."""
+        self._pending.append(json.dumps([key, offset]) + "\n")
+        self.done.add(key)
+        self.offset = offset
+
+    def sync(self) -> None:
+        """Writes entries added since the last call, and fsyncs the journal.
+
+        The output must be synced before, so that no entry refers to records
+        which are not durable.
+        """
+        if not self._pending:
+            return
+        self._file.write("".join(self._pending).encode("utf-8"))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = []
+
+    def close(self) -> None:
+        """Closes the journal, discarding entries not synced."""
+        self._file.close()
@@ -0,0 +1,693 @@
+"""A local HTTP service parsing HTML documents, over a pool of processes.
+
+The server is built on `http.server` only, and parses documents on a pool
+of worker processes started (and warmed up) ahead of requests. Requests
+wait in one of two lanes: "interactive", which is always served first, and
+"backfill", which is served when no interactive requests are waiting. Each
+lane holds a limited number of waiting requests, beyond which requests are
+rejected with 503, rather than piling up. Each request has a deadline:
+requests still waiting at their deadline are dropped with 504, and
+documents being parsed stop at the deadline (see `Config.timeout`),
+keeping the fields extracted so far. Workers still parsing a document
+`DEADLINE_GRACE` seconds after its deadline are killed and replaced.
+
+Endpoints:
+    POST /parse
+        The body is a HTML document, as raw bytes (compressed documents are
+        detected). Optional query parameters are:
+        "url" (the uuid of the document, e.g. its URL), "priority"
+        ("interactive" or "backfill"), "timeout" (the deadline in seconds),
+        and overrides of the settings in `CONFIG_OVERRIDES`, such as
+        "parser=lxml" or "metadata_only=1". Documents larger than
+        `MAX_DOCUMENT_BYTES` once decompressed exceed `MAX_INPUT_BYTES`
+        (see `Config.budget_action`). Responds with the record of the
+        document, as in `articleparser.batch`, with "timings" extended with
+        "queue", the time spent waiting.
+    GET /metrics
+        Counters and gauges in the Prometheus text format.
+    GET /health
+        Responds with 200 while the server runs.
+
+Installed as the `articleparser-server` console script; for example,
+
+    articleparser-server -j 8 --port 8080
+    curl --data-binary @page.html "localhost:8080/parse?url=https://example.com/page"
+
+Routine Listings
+----------------
+ParseService
+    Parses documents on a pool of processes, with priority lanes.
+make_server(service, host="127.0.0.1", port=8080)
+    Returns a HTTP server for `service`.
+main(argv=None)
+    Run the server from the command line.
+"""
+
+# Python 3.7 onwards, for annotations with standard collections
+from __future__ import annotations
+
+import argparse
+import collections
+import copy
+import http.server
+import json
+import logging
+import math
+import multiprocessing
+import multiprocessing.connection
+import os
+import sys
+import threading
+import time
+from typing import Any, Optional
+import urllib.parse
+
+from articleparser.batch import _get_worker_context, _Worker
+from articleparser.config import Config
+from articleparser.daemon import WARMUP_HTML
+from articleparser.util import PARSERS, extend_config
+
+LOGGER = logging.getLogger(__name__)
+
+# Lanes of requests, in order of priority
+LANES = ["interactive", "backfill"]
+# Default maximum number of waiting requests per lane
+MAX_WAITING = {"interactive": 64, "backfill": 1024}
+# Default deadline of requests in seconds
+REQUEST_TIMEOUT = 30.0
+# Time in seconds allowed after the deadline for a document being parsed to
+# stop cooperatively, before the request fails
+DEADLINE_GRACE = 5.0
+# Maximum size of a request body, in bytes
+MAX_BODY_BYTES = 1 << 26
+# Default maximum size of a (decompressed) document, in bytes; a cap on
+# `Config.MAX_INPUT_BYTES` which requests cannot raise, so that compressed
+# bodies are never decompressed without bound
+MAX_DOCUMENT_BYTES = 1 << 27
+# Settings which requests can override, with the functions parsing them
+CONFIG_OVERRIDES = {
+    "parser": lambda value: _choice(value, PARSERS),
+    "metadata_only": lambda value: _bool(value),
+    "budget_action": lambda value: _choice(value, ["reject", "truncate", "metadata_only"]),
+    "MAX_NODES": int,
+    "MAX_DEPTH": int,
+}
+
+
+def _choice(value: str, choices: list[str]) -> str:
+    if value not in choices:
+        raise ValueError("must be one of: {}".format(", ".join(choices)))
+    return value
+
+
+def _timeout(value: str) -> float:
+    timeout = float(value)
+    if not math.isfinite(timeout) or timeout <= 0.0:
+        raise ValueError("timeout must be a positive number of seconds")
+    return timeout
+
+
+def _bool(value: str) -> bool:
+    if value.lower() in ("1", "true", "yes"):
+        return True
+    if value.lower() in ("0", "false", "no"):
+        return False
+    raise ValueError("must be a boolean")
+
+
+class _Request(object):
+    # A request waiting in a lane, or being parsed.
+
+    def __init__(self, lane: str, html: bytes, uuid: str, config: Config, deadline: float):
+        self.lane = lane
+        self.html = html
+        self.uuid = uuid
+        self.config = config
+        self.deadline = deadline  # as a value of `time.monotonic()`
+        self.enqueued = time.monotonic()
+        self.started = None
+        self.record = None
+        self.status = None  # HTTP status, once done
+        self.abandoned = False  # set if the handler stopped waiting
+        self.done = threading.Event()
+
+    def finish(self, status: int, record: dict[str, Any]) -> None:
+        self.status = status
+        self.record = record
+        self.done.set()
+
+
+class ParseService(object):
+    """Parses documents on a pool of processes, with priority lanes.
+
+    Worker processes are started, and each warmed up by parsing a small
+    document, by `start()`. A dispatcher thread then sends waiting requests
+    to workers as they become free, taking requests from the "interactive"
+    lane before the "backfill" lane. A worker still parsing a document
+    `DEADLINE_GRACE` seconds after the deadline of its request (e.g. stuck
+    outside of the cooperative checks of the deadline) is killed and
+    replaced, as by the supervised workers of `articleparser.batch`, and the
+    request fails with 504; a worker which dies fails its request with 500.
+
+    Parameters
+    ----------
+    workers : int, optional
+        The number of worker processes, defaulting to `os.cpu_count()`.
+    config : articleparser.config.Config, optional
+        A Config object consisting optional settings, used for all
+        documents unless overridden by requests.
+    max_waiting : dict[str, int], optional
+        The maximum number of waiting requests per lane, defaulting to
+        `MAX_WAITING`.
+    request_timeout : float, default REQUEST_TIMEOUT
+        The deadline of requests not giving one, in seconds.
+    max_document_bytes : int, default MAX_DOCUMENT_BYTES
+        The maximum size of a (decompressed) document: `MAX_INPUT_BYTES`
+        of the config of each request is at most this, even if None.
+
+    Attributes
+    ----------
+    workers : int
+    config : articleparser.config.Config
+    max_waiting : dict[str, int]
+    request_timeout : float
+    max_document_bytes : int
+    """
+
+    def __init__(
+        self,
+        workers: int = None,
+        config: Config = None,
+        max_waiting: dict[str, int] = None,
+        request_timeout: float = REQUEST_TIMEOUT,
+        max_document_bytes: int = MAX_DOCUMENT_BYTES,
+    ):
+        self.workers = workers or os.cpu_count() or 1
+        self.config = config or Config()
+        self.max_waiting = dict(MAX_WAITING, **(max_waiting or {}))
+        self.request_timeout = request_timeout
+        self.max_document_bytes = max_document_bytes
+
+        self._context = _get_worker_context()
+        self._pool = []
+        # the request being parsed by each busy worker; None while warming up
+        self._requests_of = {}
+        self._lanes = {lane: collections.deque() for lane in LANES}
+        # reentrant, since metrics are counted while holding it
+        self._lock = threading.RLock()
+        # readable whenever requests are queued, or the service stops
+        self._wake, self._wake_writer = multiprocessing.Pipe(duplex=False)
+        self._running = False
+        self._dispatcher = None
+        self._started = time.time()
+        # metrics, by lane (and status)
+        self._requests = collections.Counter()
+        self._parse_seconds = collections.Counter()
+        self._queue_seconds = collections.Counter()
+        self._parsed = collections.Counter()
+        self._in_flight = 0
+        self._worker_restarts = 0
+
+    def _start_worker(self, warm_up: bool = True) -> _Worker:
+        # Starts a worker process; if `warm_up`, it is busy parsing a small
+        # document until its (ignored) record is received.
+        worker = _Worker(self._context, self.config)
+        if warm_up:
+            worker.submit(None, WARMUP_HTML.encode("utf-8"))
+            self._requests_of[worker] = None
+        return worker
+
+    def start(self) -> None:
+        """Starts the worker processes and the dispatcher."""
+        self._pool = [self._start_worker() for _ in range(self.workers)]
+        for worker in self._pool:
+            worker.conn.recv()
+            worker.task = None
+            del self._requests_of[worker]
+        self._running = True
+        self._dispatcher = threading.Thread(
+            target=self._dispatch, name="ParseService", daemon=True
+        )
+        self._dispatcher.start()
+        LOGGER.info("Started {} workers.".format(self.workers))
+
+    def stop(self) -> None:
+        """Stops the dispatcher and the worker processes; waiting requests,
+        and requests being parsed, fail with 503."""
+        with self._lock:
+            self._running = False
+            for lane in self._lanes.values():
+                while lane:
+                    lane.popleft().finish(503, {"message": "Server is stopping."})
+        self._notify()
+        if self._dispatcher is not None:
+            self._dispatcher.join()
+        for worker in self._pool:
+            if worker.task is None:
+                worker.stop()
+                continue
+            worker.kill()
+            request = self._requests_of.pop(worker)
+            if request is not None:
+                request.finish(503, {"message": "Server is stopping."})
+                self._count(request)
+        self._wake.close()
+        self._wake_writer.close()
+
+    def _notify(self) -> None:
+        # Wakes up the dispatcher.
+        try:
+            self._wake_writer.send_bytes(b"\0")
+        except OSError:
+            # closed by `stop()`
+            pass
+
+    def submit(
+        self,
+        html: bytes,
+        uuid: str = None,
+        lane: str = "interactive",
+        timeout: float = None,
+        overrides: dict[str, Any] = None,
+    ) -> _Request:
+        """Queues a document in `lane`.
+
+        Returns
+        -------
+        _Request
+            The request, whose `done` event is set once it has a `status`
+            and `record`. If the lane is full, it is done at once, with
+            status 503.
+        """
+        config = self.config
+        if overrides:
+            config = extend_config(copy.copy(self.config), overrides)
+        timeout = self.request_timeout if timeout is None else timeout
+        request = _Request(lane, html, uuid, config, time.monotonic() + timeout)
+        with self._lock:
+            if not self._running:
+                request.finish(503, {"message": "Server is stopping."})
+            elif len(self._lanes[lane]) >= self.max_waiting[lane]:
+                request.finish(503, {"message": "Too many requests waiting."})
+            else:
+                self._lanes[lane].append(request)
+        if request.done.is_set():
+            self._count(request)
+        else:
+            self._notify()
+        return request
+
+    def _next_request(self) -> Optional[_Request]:
+        # Returns the next request to parse, by priority; None if none is
+        # waiting. Requests past their deadline, or abandoned, are dropped.
+        with self._lock:
+            for lane in LANES:
+                while self._lanes[lane]:
+                    request = self._lanes[lane].popleft()
+                    if request.abandoned:
+                        continue
+                    if time.monotonic() >= request.deadline:
+                        request.finish(504, {"message": "Deadline passed while waiting."})
+                        self._count(request)
+                        continue
+                    return request
+        return None
+
+    def _dispatch(self) -> None:
+        # Main loop of the dispatcher thread: sends requests to idle
+        # workers, and finishes them with the records received; workers
+        # past the deadline of their request are killed and replaced.
+        while self._running:
+            for i, worker in enumerate(self._pool):
+                if worker.task is not None:
+                    continue
+                request = self._next_request()
+                if request is None:
+                    break
+                self._send(i, request)
+
+            busy = [worker for worker in self._pool if worker.task is not None]
+            deadlines = [
+                request.deadline + DEADLINE_GRACE
+                for request in (self._requests_of[worker] for worker in busy)
+                if request is not None
+            ]
+            timeout = None
+            if deadlines:
+                timeout = max(min(deadlines) - time.monotonic(), 0.0)
+            ready = multiprocessing.connection.wait(
+                [worker.conn for worker in busy] + [self._wake], timeout
+            )
+            if self._wake in ready:
+                while self._wake.poll():
+                    self._wake.recv_bytes()
+
+            now = time.monotonic()
+            for i, worker in enumerate(self._pool):
+                if worker.task is None:
+                    continue
+                request = self._requests_of[worker]
+                if worker.conn in ready:
+                    try:
+                        record, _ = worker.conn.recv()
+                    except (EOFError, OSError):
+                        message = "Worker exited with code {}.".format(worker.process.exitcode)
+                        self._fail(i, 500, "WorkerDied", message)
+                        continue
+                    worker.task = None
+                    del self._requests_of[worker]
+                    if request is not None:
+                        record.pop("index", None)
+                        record["timings"]["queue"] = request.started - request.enqueued
+                        self._finish(request, 200, record)
+                elif request is not None and now >= request.deadline + DEADLINE_GRACE:
+                    message = "Document took longer than its deadline."
+                    self._fail(i, 504, "WorkerTimeout", message)
+
+    def _send(self, i: int, request: _Request) -> None:
+        # Sends `request` to the idle worker `self._pool[i]`, replacing the
+        # worker if it died while idle; fails the request if this fails.
+        request.started = time.monotonic()
+        # the remaining time is the time limit of parsing
+        config = copy.copy(request.config)
+        config.timeout = max(request.deadline - request.started, 0.0)
+        if config.MAX_INPUT_BYTES is None or config.MAX_INPUT_BYTES > self.max_document_bytes:
+            config.MAX_INPUT_BYTES = self.max_document_bytes
+        task = (None, (request.uuid, request.html), config)
+        try:
+            try:
+                self._pool[i].submit(*task)
+            except OSError:
+                LOGGER.warning("Worker died while idle; restarting it.")
+                self._replace_worker(i, warm_up=False)
+                self._pool[i].submit(*task)
+        except Exception as e:
+            # e.g. the worker could not be restarted; the request fails,
+            # and the next request tries again
+            LOGGER.exception("Submitting failed for: {}".format(request.uuid))
+            request.finish(500, {"message": "{}: {}".format(type(e).__name__, e)})
+            self._count(request)
+            return
+        self._requests_of[self._pool[i]] = request
+        with self._lock:
+            self._in_flight += 1
+
+    def _fail(self, i: int, status: int, error_type: str, message: str) -> None:
+        # Kills the busy worker `self._pool[i]`, failing its request (if
+        # not warming up), and replaces it.
+        worker = self._pool[i]
+        request = self._requests_of.pop(worker)
+        if request is None:
+            LOGGER.error("{} while warming up; {}".format(error_type, message))
+            worker.kill()
+        else:
+            record = worker.fail(error_type, message)
+            self._finish(request, status, {"message": record["error"]["message"]})
+        worker.task = None
+        try:
+            self._replace_worker(i)
+        except Exception:
+            # the dead worker is kept, and replaced again when next used
+            LOGGER.exception("Restarting a worker failed.")
+
+    def _finish(self, request: _Request, status: int, record: dict[str, Any]) -> None:
+        # Finishes a request which was being parsed.
+        with self._lock:
+            self._in_flight -= 1
+        request.finish(status, record)
+        self._count(request)
+
+    def _replace_worker(self, i: int, warm_up: bool = True) -> None:
+        # Replaces the dead or killed worker `self._pool[i]`.
+        LOGGER.warning("Restarting a worker process.")
+        self._pool[i].kill()
+        self._pool[i] = self._start_worker(warm_up)
+        with self._lock:
+            self._worker_restarts += 1
+
+    def _count(self, request: _Request) -> None:
+        # Updates the metrics for a finished request.
+        with self._lock:
+            self._requests[request.lane, request.status] += 1
+            if request.started is not None:
+                self._queue_seconds[request.lane] += request.started - request.enqueued
+                self._parse_seconds[request.lane] += time.monotonic() - request.started
+                self._parsed[request.lane] += 1
+
+    def metrics(self) -> str:
+        """Returns the metrics of the service, in the Prometheus text
+        format."""
+        lines = []
+
+        def add(name: str, kind: str, help_text: str, samples: list[tuple[str, float]]) -> None:
+            lines.append("# HELP articleparser_{} {}".format(name, help_text))
+            lines.append("# TYPE articleparser_{} {}".format(name, kind))
+            for labels, value in samples:
+                lines.append("articleparser_{}{} {}".format(name, labels, value))
+
+        with self._lock:
+            add(
+                "requests_total",
+                "counter",
+                "Requests finished, by lane and HTTP status.",
+                [
+                    ('{{lane="{}",status="{}"}}'.format(lane, status), count)
+                    for (lane, status), count in sorted(self._requests.items())
+                ],
+            )
+            add(
+                "waiting_requests",
+                "gauge",
+                "Requests waiting, by lane.",
+                [('{{lane="{}"}}'.format(lane), len(self._lanes[lane])) for lane in LANES],
+            )
+            add(
+                "waiting_requests_limit",
+                "gauge",
+                "Maximum number of requests waiting, by lane.",
+                [('{{lane="{}"}}'.format(lane), self.max_waiting[lane]) for lane in LANES],
+            )
+            add("in_flight", "gauge", "Documents being parsed.", [("", self._in_flight)])
+            add("workers", "gauge", "Worker processes.", [("", self.workers)])
+            add(
+                "worker_restarts_total",
+                "counter",
+                "Restarts of worker processes.",
+                [("", self._worker_restarts)],
+            )
+            for name, counter, help_text in [
+                ("queue_seconds", self._queue_seconds, "Time spent waiting, by lane."),
+                ("parse_seconds", self._parse_seconds, "Time spent parsing, by lane."),
+            ]:
+                add(
+                    name + "_sum",
+                    "counter",
+                    help_text,
+                    [('{{lane="{}"}}'.format(lane), round(counter[lane], 6)) for lane in LANES],
+                )
+            add(
+                "parsed_total",
+                "counter",
+                "Documents sent to workers, by lane.",
+                [('{{lane="{}"}}'.format(lane), self._parsed[lane]) for lane in LANES],
+            )
+            add(
+                "uptime_seconds",
+                "gauge",
+                "Time since the service was created.",
+                [("", round(time.time() - self._started, 3))],
+            )
+        return "\n".join(lines) + "\n"
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    # Handles the requests of `make_server()`; `self.server.service` is the
+    # `ParseService`.
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args) -> None:
+        LOGGER.debug("%s - %s", self.address_string(), format % args)
+
+    def _send(self, status: int, body: bytes, content_type: str, headers: dict = None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status: int, value: Any, headers: dict = None) -> None:
+        self._send(status, json.dumps(value).encode("utf-8"), "application/json", headers)
+
+    def do_GET(self) -> None:
+        path = urllib.parse.urlsplit(self.path).path
+        if path == "/metrics":
+            body = self.server.service.metrics().encode("utf-8")
+            self._send(200, body, "text/plain; version=0.0.4")
+        elif path == "/health":
+            self._send_json(200, {"status": "ok"})
+        else:
+            self._send_json(404, {"message": "Not found."})
+
+    def _reject(self, status: int, message: str) -> None:
+        # Responds with an error before the body of the request is read, and
+        # closes the connection, so that the body is never read as the next
+        # request of the connection.
+        self._send_json(status, {"message": message}, {"Connection": "close"})
+
+    def do_POST(self) -> None:
+        url = urllib.parse.urlsplit(self.path)
+        if url.path != "/parse":
+            self._reject(404, "Not found.")
+            return
+        service = self.server.service
+        query = dict(urllib.parse.parse_qsl(url.query))
+
+        lane = query.pop("priority", "interactive")
+        if lane not in LANES:
+            self._reject(400, "priority must be one of: {}".format(", ".join(LANES)))
+            return
+        timeout = None
+        overrides = {}
+        try:
+            if "timeout" in query:
+                timeout = _timeout(query.pop("timeout"))
+            for key, value in query.items():
+                if key in CONFIG_OVERRIDES:
+                    overrides[key] = CONFIG_OVERRIDES[key](value)
+        except ValueError as e:
+            self._reject(400, "Wrong parameter: {}".format(e))
+            return
+
+        if self.headers.get("Content-Length") is None:
+            self._reject(411, "Content-Length is required.")
+            return
+        try:
+            length = int(self.headers["Content-Length"])
+            if length < 0:
+                raise ValueError
+        except ValueError:
+            self._reject(400, "Wrong Content-Length.")
+            return
+        if length > MAX_BODY_BYTES:
+            self._reject(413, "Document is too large.")
+            return
+        html = self.rfile.read(length)
+
+        request = service.submit(html, query.get("url"), lane, timeout, overrides)
+        wait = max(request.deadline - time.monotonic(), 0.0) + DEADLINE_GRACE
+        if not request.done.wait(min(wait, threading.TIMEOUT_MAX)):
+            request.abandoned = True
+            self._send_json(504, {"message": "Deadline passed."})
+            return
+        headers = {"Retry-After": "1"} if request.status == 503 else None
+        self._send_json(request.status, request.record, headers)
+
+
+def make_server(
+    service: ParseService,
+    host: str = "127.0.0.1",
+    port: int = 8080,
+) -> http.server.ThreadingHTTPServer:
+    """Returns a HTTP server for `service`, handling each connection on a
+    thread. Call `serve_forever()` to run it.
+
+    Parameters
+    ----------
+    service : ParseService
+        A started `ParseService`.
+    host : str, default "127.0.0.1"
+    port : int, default 8080
+    """
+    server = http.server.ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+
+def main(argv: list[str] = None) -> int:
+    """Run the server from the command line, until interrupted.
+
+    Returns
+    -------
+    int
+        The exit status.
+    """
+    parser = argparse.ArgumentParser(
+        prog="articleparser-server",
+        description="Parse HTML documents sent to a local HTTP server.",
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="address (default: %(default)s)")
+    parser.add_argument("--port", type=int, default=8080, help="port (default: %(default)s)")
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="number of worker processes (default: number of CPUs)",
+    )
+    for lane in LANES:
+        parser.add_argument(
+            "--max-{}".format(lane),
+            type=int,
+            default=MAX_WAITING[lane],
+            help="maximum number of {} requests waiting, beyond which requests "
+            "get 503 (default: %(default)s)".format(lane),
+        )
+    parser.add_argument(
+        "--request-timeout",
+        type=float,
+        default=REQUEST_TIMEOUT,
+        help="default deadline of requests in seconds (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--max-document-bytes",
+        type=int,
+        default=MAX_DOCUMENT_BYTES,
+        help="maximum size of a decompressed document in bytes, which requests "
+        "cannot raise (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--parser",
+        choices=PARSERS,
+        help='default parser for documents (default: "html5lib")',
+    )
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        action="count",
+        default=0,
+        help="log more (-v for info, -vv for debug)",
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(
+        level=[logging.WARNING, logging.INFO, logging.DEBUG][min(args.verbose, 2)],
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    )
+
+    config = Config()
+    config.parser = args.parser
+    service = ParseService(
+        args.jobs,
+        config,
+        max_waiting={lane: getattr(args, "max_" + lane) for lane in LANES},
+        request_timeout=args.request_timeout,
+        max_document_bytes=args.max_document_bytes,
+    )
+    service.start()
+    server = make_server(service, args.host, args.port)
+    LOGGER.info("Listening on http://{}:{}/".format(args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
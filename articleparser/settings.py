@@ -308,6 +308,14 @@ KILL_TAGS = [
     "template",
 ]
 
+# tags removed from <head> before parsing, in `make_soup()`;
+# parsers begin <body> prematurely on encountering these in <head>.
+# Adding "script" also removes JSON-LD metadata in <head>.
+HEAD_REMOVE_TAGS = [
+    "iframe",
+    "noscript",
+]
+
 IMAGE_AND_MULTIMEDIA_TAGS = [
     "area",
     "audio",
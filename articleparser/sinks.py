@@ -0,0 +1,926 @@
+"""Writing of parsing results to files.
+
+This module contains sinks, which accept records (such as those of
+`articleparser.batch`, or `Article.content` dicts) one at a time and write
+them out. Sinks are used as context managers, or closed with `close()`,
+which writes any remaining records.
+
+Routine Listings
+----------------
+JsonlSink
+    Writes records as JSON lines, on a background thread.
+ParquetSink
+    Writes records as Parquet files, in a fixed columnar schema.
+get_arrow_schema()
+    Returns the Arrow schema of records written by `ParquetSink`.
+records_to_table(records)
+    Converts records to an Arrow table, in the schema of `ParquetSink`.
+SqliteSink
+    Writes records to a SQLite database, in normalized tables.
+
+`ParquetSink` requires `pyarrow`, which is an optional dependency
+(installed with `pip install articleparser[parquet]`), imported only when
+used.
+"""
+
+# Python 3.7 onwards, for annotations with standard collections
+from __future__ import annotations
+
+import gzip
+import io
+import json
+import logging
+import os
+from pathlib import Path
+import queue
+import sqlite3
+import threading
+import time
+from typing import Any, IO, Iterable, Optional, Union
+
+from articleparser.journal import JOURNAL_SYNC_INTERVAL, JOURNAL_SYNC_RECORDS, Journal
+
+LOGGER = logging.getLogger(__name__)
+
+# Size of the write buffer of output files
+WRITE_BUFFER_SIZE = 1 << 20
+# Compression level of gzipped output; lower levels are much faster, with
+# little loss in ratio for JSON
+GZIP_COMPRESSLEVEL = 6
+
+# Columns of `ParquetSink`, besides "uuid", "error_type" and "error_message",
+# mapping each field of `Article.CONTENT_FIELDS` to its type: "string", a
+# list of a type, or a dict of field names to types (a struct).
+CONTENT_COLUMNS = {
+    "record_categories_list": ["string"],
+    "author_list": [{"name": "string", "url": "string", "image_url": "string"}],
+    "record_title": "string",
+    "record_url": "string",
+    "record_published_isotimestamp": "string",
+    "record_modified_isotimestamp": "string",
+    "site": [{"name": "string", "url": "string"}],
+    "record_language": "string",
+    "record_content": ["string"],
+    "record_description": "string",
+    "record_images_list": [{"url": "string", "alt_text": "string"}],
+    "record_links_list": [{"url": "string", "text": "string"}],
+    "record_videos_list": [{"url": "string", "alt_text": "string"}],
+    "record_documents_list": [{"url": "string", "alt_text": "string"}],
+    "record_keywords_list": ["string"],
+    "record_comment_areas_list": [{"url": "string", "text": "string"}],
+}
+# Number of rows of each row group of Parquet files
+PARQUET_ROW_GROUP_SIZE = 10000
+
+# Number of records written by `SqliteSink` in each transaction
+SQLITE_BATCH_SIZE = 2000
+# Seconds to wait for a lock on the database of `SqliteSink`
+SQLITE_TIMEOUT = 30.0
+# Columns of the "records" table of `SqliteSink`, besides "uuid": fields of
+# `Article.content` with string values, fields with other values (stored
+# as JSON), and then the error of the record and the time it was written
+SQLITE_TEXT_COLUMNS = [
+    "record_url",
+    "record_title",
+    "record_published_isotimestamp",
+    "record_modified_isotimestamp",
+    "record_language",
+    "record_description",
+]
+SQLITE_JSON_COLUMNS = [
+    "record_content",
+    "record_categories_list",
+    "site",
+    "record_videos_list",
+    "record_documents_list",
+    "record_comment_areas_list",
+]
+SQLITE_RECORD_COLUMNS = (
+    SQLITE_TEXT_COLUMNS + SQLITE_JSON_COLUMNS + ["error_type", "error_message", "written_at"]
+)
+# Encodes the JSON columns of `SqliteSink`, keeping non-ASCII characters;
+# created once, since `json.dumps()` creates an encoder per call otherwise
+_SQLITE_JSON_ENCODER = json.JSONEncoder(ensure_ascii=False)
+# Tables of `SqliteSink` with a row per item of a list of `Article.content`,
+# mapped to the field and the columns (keys of its dicts, or "keyword" for
+# strings), besides "uuid" and "position" (the index of the item)
+SQLITE_ITEM_TABLES = {
+    "authors": ("author_list", ["name", "url", "image_url"]),
+    "images": ("record_images_list", ["url", "alt_text"]),
+    "links": ("record_links_list", ["url", "text"]),
+    "keywords": ("record_keywords_list", ["keyword"]),
+}
+# Indexes of `SqliteSink`, by name, on columns of its tables
+SQLITE_INDEXES = {
+    "records_url": ("records", "record_url"),
+    "records_published": ("records", "record_published_isotimestamp"),
+    "authors_name": ("authors", "name"),
+    "links_url": ("links", "url"),
+    "keywords_keyword": ("keywords", "keyword"),
+}
+
+
+class _Flush(object):
+    # Queued by `JsonlSink.flush()`; `event` is set once records queued
+    # before it have been written and flushed.
+    def __init__(self):
+        self.event = threading.Event()
+
+
+class JsonlSink(object):
+    """Writes records as JSON lines, on a background thread.
+
+    Records passed to `write()` are put on a bounded queue, and serialized
+    with `json.dumps()`, compressed (if writing to a ".gz" file) and
+    written by a writer thread, so that the caller only pays for queueing.
+    If the writer falls behind by `queue_size` records, `write()` blocks
+    until it catches up (backpressure). Streams are flushed whenever the
+    writer has caught up, so that records are passed on as they are written.
+
+    Output files can be rotated by size or record count: the index of each
+    file is then formatted into `path` if it contains "{index}" (e.g.
+    "out-{index:05d}.jsonl.gz"), and otherwise inserted before its suffixes
+    (e.g. "out.jsonl.gz" gives "out-00000.jsonl.gz", "out-00001.jsonl.gz",
+    and so on).
+
+    With a `journal` (see `articleparser.journal`), the uuid of each record
+    and the size of the output after it are added to the journal, and the
+    output and then the journal are fsynced in batches. Existing output is
+    truncated to the size recorded by the journal, and appended to, so that
+    an interrupted batch can be resumed.
+
+    Errors of the writer thread are raised by the next call to `write()`
+    or `close()`.
+
+    Parameters
+    ----------
+    path : str or Path or IO[str]
+        The output file, gzipped if ending with ".gz"; or a text stream,
+        such as `sys.stdout`, which is flushed but not closed by `close()`.
+    queue_size : int, default 1024
+        The maximum number of records waiting to be written.
+    rotate_bytes : int, optional
+        The size of (uncompressed) output after which to begin a new file.
+    rotate_records : int, optional
+        The number of records after which to begin a new file.
+    ensure_ascii : bool, default True
+        Passed to `json.dumps()`.
+    journal : articleparser.journal.Journal, optional
+        A journal of the records written, for resuming. Only supported for
+        uncompressed files, without rotation.
+
+    Attributes
+    ----------
+    paths : list[str]
+        The files written so far.
+    records_written : int
+        The number of records written so far.
+
+    Raises
+    ------
+    ValueError
+        if rotation is requested when writing to a stream, or a journal is
+        given when writing to a stream, a ".gz" file or with rotation, or
+        the output is shorter than recorded by the journal.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path, IO[str]],
+        queue_size: int = 1024,
+        rotate_bytes: int = None,
+        rotate_records: int = None,
+        ensure_ascii: bool = True,
+        journal: Journal = None,
+    ):
+        self.rotate_bytes = rotate_bytes
+        self.rotate_records = rotate_records
+        self.ensure_ascii = ensure_ascii
+        self.paths = []
+        self.records_written = 0
+
+        if hasattr(path, "write"):
+            if rotate_bytes is not None or rotate_records is not None:
+                raise ValueError("Cannot rotate output written to a stream.")
+            self._stream = path
+            self._path = None
+        else:
+            self._stream = None
+            self._path = str(path)
+        self._file = None
+        self._file_bytes = 0
+        self._file_records = 0
+
+        self._journal = journal
+        if journal is not None:
+            if (
+                self._path is None
+                or self._path.endswith(".gz")
+                or rotate_bytes is not None
+                or rotate_records is not None
+            ):
+                raise ValueError(
+                    "A journal is only supported for uncompressed files, without rotation."
+                )
+            self._file = self._open_journaled()
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._error = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="JsonlSink", daemon=True)
+        self._thread.start()
+
+    def __enter__(self) -> JsonlSink:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _rotated_path(self, index: int) -> str:
+        # Returns the path of the output file of index `index`.
+        if "{index" in self._path:
+            return self._path.format(index=index)
+        if self.rotate_bytes is None and self.rotate_records is None:
+            return self._path
+        directory, filename = os.path.split(self._path)
+        stem, dot, suffixes = filename.partition(".")
+        return os.path.join(directory, "{}-{:05d}{}{}".format(stem, index, dot, suffixes))
+
+    def _open(self) -> IO[str]:
+        # Opens the next output file.
+        path = self._rotated_path(len(self.paths))
+        if path.endswith(".gz"):
+            raw = gzip.open(path, "wb", compresslevel=GZIP_COMPRESSLEVEL)
+            f = io.TextIOWrapper(
+                io.BufferedWriter(raw, buffer_size=WRITE_BUFFER_SIZE), encoding="utf-8"
+            )
+        else:
+            f = open(path, "w", encoding="utf-8", buffering=WRITE_BUFFER_SIZE)
+        self.paths.append(path)
+        self._file_bytes = 0
+        self._file_records = 0
+        LOGGER.debug("Writing records to: {}".format(path))
+        return f
+
+    def _open_journaled(self) -> IO[str]:
+        # Opens the output file for appending, truncated to the size
+        # recorded by the journal.
+        size = os.path.getsize(self._path) if os.path.exists(self._path) else 0
+        if size < self._journal.offset:
+            raise ValueError(
+                "Output {} is shorter than recorded by the journal.".format(self._path)
+            )
+        if size > self._journal.offset:
+            LOGGER.info(
+                "Truncating {} bytes not in the journal from: {}".format(
+                    size - self._journal.offset, self._path
+                )
+            )
+            os.truncate(self._path, self._journal.offset)
+        f = open(
+            self._path, "a", encoding="utf-8", newline="", buffering=WRITE_BUFFER_SIZE
+        )
+        self.paths.append(self._path)
+        self._file_bytes = self._journal.offset
+        return f
+
+    def _sync(self) -> None:
+        # Fsyncs the output, and then the journal.
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._journal.sync()
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def _flush_output(self) -> None:
+        # Flushes the output, fsyncing files (and syncing the journal).
+        if self._journal is not None:
+            self._sync()
+        elif self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        elif self._stream is not None:
+            self._stream.flush()
+
+    def _run(self) -> None:
+        # Main loop of the writer thread. On an error, records are consumed
+        # and discarded, so that `write()` does not block forever.
+        while True:
+            record = self._queue.get()
+            if record is None:
+                break
+            if isinstance(record, _Flush):
+                if self._error is None:
+                    try:
+                        self._flush_output()
+                    except Exception as e:
+                        LOGGER.exception("Flushing output failed.")
+                        self._error = e
+                record.event.set()
+                continue
+            if self._error is not None:
+                continue
+            try:
+                self._write_line(json.dumps(record, ensure_ascii=self.ensure_ascii) + "\n")
+                if self._stream is not None and self._queue.empty():
+                    # caught up: pass records on to a consumer (e.g. the next
+                    # process of a pipe) rather than holding them in a buffer
+                    self._stream.flush()
+                if self._journal is not None:
+                    if record.get("uuid") is not None:
+                        self._journal.add(record["uuid"], self._file_bytes)
+                    self._unsynced += 1
+                    if (
+                        self._unsynced >= JOURNAL_SYNC_RECORDS
+                        or time.monotonic() - self._last_sync >= JOURNAL_SYNC_INTERVAL
+                    ):
+                        self._sync()
+            except BrokenPipeError as e:
+                LOGGER.warning("Output was closed by its reader.")
+                self._error = e
+            except Exception as e:
+                LOGGER.exception("Writing records failed.")
+                self._error = e
+        try:
+            if self._journal is not None and self._error is None:
+                self._sync()
+            if self._file is not None:
+                self._file.close()
+            elif self._stream is not None:
+                self._stream.flush()
+        except Exception as e:
+            LOGGER.exception("Closing output failed.")
+            self._error = self._error or e
+
+    def _write_line(self, line: str) -> None:
+        # Writes `line`, opening or rotating the output file as needed.
+        if self._stream is not None:
+            self._stream.write(line)
+        else:
+            if self._file is not None and (
+                (self.rotate_bytes is not None and self._file_bytes >= self.rotate_bytes)
+                or (self.rotate_records is not None and self._file_records >= self.rotate_records)
+            ):
+                self._file.close()
+                self._file = None
+            if self._file is None:
+                self._file = self._open()
+            self._file.write(line)
+            # in bytes; with `ensure_ascii`, lines are ASCII
+            self._file_bytes += len(line) if self.ensure_ascii else len(line.encode("utf-8"))
+            self._file_records += 1
+        self.records_written += 1
+
+    def write(self, record: dict[str, Any]) -> None:
+        """Queues `record` to be written.
+
+        Blocks while `queue_size` records are waiting to be written.
+
+        Raises
+        ------
+        ValueError
+            if the sink is closed.
+        Exception
+            any error of the writer thread, e.g. `OSError` or `TypeError`
+            (for records which are not JSON serializable).
+        """
+        if self._closed:
+            raise ValueError("Sink is closed.")
+        if self._error is not None:
+            raise self._error
+        self._queue.put(record)
+
+    def flush(self) -> None:
+        """Waits until all queued records are written, and flushes the
+        output; files are fsynced, so that the records are durable.
+
+        Raises
+        ------
+        ValueError
+            if the sink is closed.
+        Exception
+            any error of the writer thread.
+        """
+        if self._closed:
+            raise ValueError("Sink is closed.")
+        if self._error is not None:
+            raise self._error
+        marker = _Flush()
+        self._queue.put(marker)
+        marker.event.wait()
+        if self._error is not None:
+            raise self._error
+
+    def close(self) -> None:
+        """Writes all queued records, and closes the output.
+
+        Raises
+        ------
+        Exception
+            any error of the writer thread.
+        """
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+
+def _import_pyarrow():
+    # Imports pyarrow, which is an optional dependency.
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError(
+            "Writing Parquet requires pyarrow; "
+            "install it with `pip install articleparser[parquet]`."
+        ) from e
+    return pyarrow
+
+
+def _arrow_type(pa, column_type: Union[str, list, dict]):
+    # Returns the Arrow type of a type in `CONTENT_COLUMNS`.
+    if isinstance(column_type, list):
+        return pa.list_(_arrow_type(pa, column_type[0]))
+    if isinstance(column_type, dict):
+        return pa.struct(
+            [(name, _arrow_type(pa, field_type)) for name, field_type in column_type.items()]
+        )
+    return pa.string()
+
+
+def get_arrow_schema():
+    """Returns the Arrow schema of records written by `ParquetSink`.
+
+    The schema has a column "uuid", a column for each field of
+    `Article.CONTENT_FIELDS` with the types of `CONTENT_COLUMNS` (lists of
+    dicts, such as "author_list", as lists of structs), and columns
+    "error_type" and "error_message". All columns are nullable.
+
+    Returns
+    -------
+    pyarrow.Schema
+
+    Raises
+    ------
+    ImportError
+        if pyarrow is not installed.
+    """
+    pa = _import_pyarrow()
+    return pa.schema(
+        [("uuid", pa.string())]
+        + [(field, _arrow_type(pa, column_type)) for field, column_type in CONTENT_COLUMNS.items()]
+        + [("error_type", pa.string()), ("error_message", pa.string())]
+    )
+
+
+def _to_row(record: dict[str, Any]) -> dict[str, Any]:
+    # Flattens a record (or `Article.content` dict) into a row of the schema
+    # of `get_arrow_schema()`.
+    if "content" in record:
+        row = dict(record["content"] or {})
+        row["uuid"] = record.get("uuid")
+        error = record.get("error") or {}
+        row["error_type"] = error.get("type")
+        row["error_message"] = error.get("message")
+    else:
+        row = dict(record)
+    for field, column_type in CONTENT_COLUMNS.items():
+        # a single string where a list of strings is expected
+        if column_type == ["string"] and isinstance(row.get(field), str):
+            row[field] = [row[field]]
+    return row
+
+
+def records_to_table(records: Iterable[dict[str, Any]]):
+    """Converts records to an Arrow table, in the schema of `ParquetSink`.
+
+    Parameters
+    ----------
+    records : Iterable[dict[str, Any]]
+        Records of `articleparser.batch`, or `Article.content` dicts.
+
+    Returns
+    -------
+    pyarrow.Table
+        A table with the schema of `get_arrow_schema()`.
+
+    Raises
+    ------
+    ImportError
+        if pyarrow is not installed.
+    """
+    pa = _import_pyarrow()
+    return pa.Table.from_pylist([_to_row(record) for record in records], schema=get_arrow_schema())
+
+
+class ParquetSink(object):
+    """Writes records as Parquet files, in a fixed columnar schema.
+
+    Records are mapped to the schema of `get_arrow_schema()`: one column per
+    field of `Article.CONTENT_FIELDS`, with lists of dicts (such as
+    "author_list" and "record_images_list") as lists of structs, so that
+    they can be loaded into columnar stores without re-parsing JSON.
+    Failed records of `articleparser.batch` give rows with only "uuid",
+    "error_type" and "error_message" set.
+
+    Records are buffered, and written as one row group per
+    `row_group_size` records.
+
+    Parameters
+    ----------
+    path : str or Path
+        The output file.
+    row_group_size : int, default PARQUET_ROW_GROUP_SIZE
+        The number of records of each row group.
+    compression : str, default "zstd"
+        Passed to `pyarrow.parquet.ParquetWriter`.
+
+    Attributes
+    ----------
+    paths : list[str]
+        The files written, i.e. `[path]`.
+    records_written : int
+        The number of records written so far, including those buffered.
+
+    Raises
+    ------
+    ImportError
+        if pyarrow is not installed.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        row_group_size: int = PARQUET_ROW_GROUP_SIZE,
+        compression: str = "zstd",
+    ):
+        pa = _import_pyarrow()
+        self.row_group_size = row_group_size
+        self.paths = [str(path)]
+        self.records_written = 0
+        self._schema = get_arrow_schema()
+        self._writer = pa.parquet.ParquetWriter(str(path), self._schema, compression=compression)
+        self._rows = []
+        self._closed = False
+        LOGGER.debug("Writing records to: {}".format(path))
+
+    def __enter__(self) -> ParquetSink:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _flush(self) -> None:
+        # Writes buffered rows as a row group.
+        if self._rows:
+            table = _import_pyarrow().Table.from_pylist(self._rows, schema=self._schema)
+            self._writer.write_table(table, row_group_size=self.row_group_size)
+            self._rows = []
+
+    def write(self, record: dict[str, Any]) -> None:
+        """Writes `record`, once `row_group_size` records are buffered.
+
+        Raises
+        ------
+        ValueError
+            if the sink is closed.
+        pyarrow.ArrowException
+            for records not matching the schema.
+        """
+        if self._closed:
+            raise ValueError("Sink is closed.")
+        self._rows.append(_to_row(record))
+        self.records_written += 1
+        if len(self._rows) >= self.row_group_size:
+            self._flush()
+
+    def flush(self) -> None:
+        """Writes buffered records as a row group.
+
+        The file is only readable once closed, since the footer of a
+        Parquet file is written last.
+        """
+        if self._closed:
+            raise ValueError("Sink is closed.")
+        self._flush()
+
+    def close(self) -> None:
+        """Writes buffered records, and closes the output."""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._flush()
+        finally:
+            self._writer.close()
+
+
+def _sqlite_key(record: dict[str, Any]) -> Optional[str]:
+    # Returns the key of a record (or `Article.content` dict) in the tables
+    # of `SqliteSink`: its uuid, or else its record_url.
+    if "content" in record:
+        return record.get("uuid") or (record["content"] or {}).get("record_url")
+    return record.get("record_url")
+
+
+def _sqlite_value(value: Any, name: str) -> Union[str, int, float, None]:
+    # Returns `value`, to be stored in column `name`; raises ValueError for
+    # values which SQLite cannot store.
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    raise ValueError("{} is of type {}, not a string.".format(name, type(value).__name__))
+
+
+def _to_sqlite_rows(
+    record: dict[str, Any],
+    written_at: float,
+) -> tuple[tuple, dict[str, list[tuple]]]:
+    # Returns the row of a record (or `Article.content` dict) in the
+    # "records" table of `SqliteSink`, and its rows in each of
+    # `SQLITE_ITEM_TABLES`; raises ValueError if these cannot be stored.
+    uuid = _sqlite_key(record)
+    if uuid is None:
+        raise ValueError("Record has neither a uuid nor a record_url.")
+    if "content" in record:
+        content = record["content"] or {}
+        error = record.get("error") or {}
+    else:
+        content = record
+        error = {}
+    if not isinstance(content, dict) or not isinstance(error, dict):
+        raise ValueError("Record content and error must be dicts.")
+
+    try:
+        json_values = tuple(
+            None if content.get(column) is None else _SQLITE_JSON_ENCODER.encode(content[column])
+            for column in SQLITE_JSON_COLUMNS
+        )
+    except TypeError as e:
+        raise ValueError("Record content is not JSON serializable: {}".format(e))
+    row = (
+        (_sqlite_value(uuid, "uuid"),)
+        + tuple(_sqlite_value(content.get(column), column) for column in SQLITE_TEXT_COLUMNS)
+        + json_values
+        + (
+            _sqlite_value(error.get("type"), "error type"),
+            _sqlite_value(error.get("message"), "error message"),
+            written_at,
+        )
+    )
+    item_rows = {}
+    for table, (field, columns) in SQLITE_ITEM_TABLES.items():
+        items = content.get(field) or []
+        # a single string where a list of strings is expected
+        if isinstance(items, str):
+            items = [items]
+        if not isinstance(items, list):
+            raise ValueError("{} is of type {}, not a list.".format(field, type(items).__name__))
+        if columns == ["keyword"]:
+            item_rows[table] = [
+                (uuid, i, _sqlite_value(item, field)) for i, item in enumerate(items)
+            ]
+            continue
+        rows = []
+        for i, item in enumerate(items):
+            if not isinstance(item, dict):
+                raise ValueError(
+                    "Item of {} is of type {}, not a dict.".format(field, type(item).__name__)
+                )
+            rows.append(
+                (uuid, i)
+                + tuple(_sqlite_value(item.get(column), field) for column in columns)
+            )
+        item_rows[table] = rows
+    return row, item_rows
+
+
+class SqliteSink(object):
+    """Writes records to a SQLite database, in normalized tables.
+
+    Records are stored in the following tables, so that they can be
+    queried by URL, author, keyword or date without loading JSON:
+    - "records", with a row per document, keyed by "uuid" (or
+      "record_url", for records without a uuid), with the string fields
+      of `Article.content` and the other fields (such as "record_content",
+      a list of paragraphs) as JSON; and "error_type", "error_message" and
+      "written_at" (a Unix timestamp);
+    - "authors", "images", "links" and "keywords", with a row per item of
+      "author_list", "record_images_list", "record_links_list" and
+      "record_keywords_list", keyed by "uuid" and "position".
+    Records are indexed by "record_url" and
+    "record_published_isotimestamp", authors by "name", links by "url" and
+    keywords by "keyword".
+
+    A record with the uuid of a record already in the database replaces
+    it, along with its items, so that documents can be parsed again.
+
+    Records passed to `write()` are buffered, and batches of `batch_size`
+    records are written by a writer thread, each in one transaction, with
+    one prepared statement per table; the database is in WAL mode, so that
+    it can be read while written. If the writer falls behind by two
+    batches, `write()` blocks until it catches up. Errors of the writer
+    thread are raised by the next call to `write()`, `flush()` or
+    `close()`.
+
+    Parameters
+    ----------
+    path : str or Path
+        The database, created if it does not exist.
+    batch_size : int, default SQLITE_BATCH_SIZE
+        The number of records written in each transaction.
+
+    Attributes
+    ----------
+    paths : list[str]
+        The files written, i.e. `[path]`.
+    records_written : int
+        The number of records written so far, including those buffered.
+    """
+
+    def __init__(self, path: Union[str, Path], batch_size: int = SQLITE_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.paths = [str(path)]
+        self.records_written = 0
+        self._conn = sqlite3.connect(
+            str(path),
+            timeout=SQLITE_TIMEOUT,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS records (uuid TEXT PRIMARY KEY, {})".format(
+                ", ".join(
+                    "{} {}".format(column, "REAL" if column == "written_at" else "TEXT")
+                    for column in SQLITE_RECORD_COLUMNS
+                )
+            )
+        )
+        for table, (_, columns) in SQLITE_ITEM_TABLES.items():
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS {} (uuid TEXT NOT NULL, position INTEGER NOT NULL, "
+                "{}, PRIMARY KEY (uuid, position)) WITHOUT ROWID".format(
+                    table, ", ".join(column + " TEXT" for column in columns)
+                )
+            )
+        for index, (table, column) in SQLITE_INDEXES.items():
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS {} ON {} ({})".format(index, table, column)
+            )
+
+        # statements of each batch: the "records" table is upserted with
+        # INSERT OR REPLACE (a row replaces the whole previous row), and
+        # items are deleted before being inserted again
+        self._records_sql = "INSERT OR REPLACE INTO records (uuid, {}) VALUES (?{})".format(
+            ", ".join(SQLITE_RECORD_COLUMNS), ", ?" * len(SQLITE_RECORD_COLUMNS)
+        )
+        self._item_sql = {
+            table: (
+                "DELETE FROM {} WHERE uuid = ?".format(table),
+                "INSERT INTO {} (uuid, position, {}) VALUES (?, ?{})".format(
+                    table, ", ".join(columns), ", ?" * len(columns)
+                ),
+            )
+            for table, (_, columns) in SQLITE_ITEM_TABLES.items()
+        }
+
+        self._batch = []
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=2)
+        self._error = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="SqliteSink", daemon=True)
+        self._thread.start()
+        LOGGER.debug("Writing records to: {}".format(path))
+
+    def __enter__(self) -> SqliteSink:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _write_batch(self, batch: list[tuple[tuple, dict[str, list[tuple]]]]) -> None:
+        # Writes a batch of rows of records, from `_to_sqlite_rows()`, in a
+        # transaction.
+        rows = {}
+        item_rows = {table: [] for table in SQLITE_ITEM_TABLES}
+        for row, record_item_rows in batch:
+            # the last of records with the same uuid replaces the others
+            rows[row[0]] = (row, record_item_rows)
+        for _, record_item_rows in rows.values():
+            for table, table_rows in record_item_rows.items():
+                item_rows[table].extend(table_rows)
+        keys = [(key,) for key in rows]
+
+        self._conn.execute("BEGIN")
+        try:
+            self._conn.executemany(self._records_sql, [row for row, _ in rows.values()])
+            for table, (delete_sql, insert_sql) in self._item_sql.items():
+                self._conn.executemany(delete_sql, keys)
+                self._conn.executemany(insert_sql, item_rows[table])
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def _run(self) -> None:
+        # Main loop of the writer thread. On an error, batches are consumed
+        # and discarded, so that `write()` does not block forever.
+        while True:
+            batch = self._queue.get()
+            if batch is None:
+                break
+            if isinstance(batch, _Flush):
+                batch.event.set()
+                continue
+            if self._error is not None:
+                continue
+            try:
+                self._write_batch(batch)
+            except Exception as e:
+                LOGGER.exception("Writing records failed.")
+                self._error = e
+        try:
+            self._conn.close()
+        except Exception as e:
+            LOGGER.exception("Closing output failed.")
+            self._error = self._error or e
+
+    def _queue_batch(self) -> None:
+        # Queues the buffered records to be written; the lock must be held.
+        if self._batch:
+            self._queue.put(self._batch)
+            self._batch = []
+
+    def write(self, record: dict[str, Any]) -> None:
+        """Buffers `record`, to be written once `batch_size` records are
+        buffered.
+
+        The rows of the record are made in the calling thread, so that
+        records which cannot be stored are rejected here, one at a time,
+        rather than failing the batch they would be written in.
+
+        Raises
+        ------
+        ValueError
+            if the sink is closed, or for records which cannot be stored
+            and are not written: records with neither a uuid nor a
+            record_url, or with fields of the wrong type (e.g. items of
+            "author_list" which are not dicts).
+        Exception
+            any error of the writer thread, e.g. `sqlite3.Error`.
+        """
+        if self._closed:
+            raise ValueError("Sink is closed.")
+        if self._error is not None:
+            raise self._error
+        rows = _to_sqlite_rows(record, time.time())
+        with self._lock:
+            self._batch.append(rows)
+            self.records_written += 1
+            if len(self._batch) >= self.batch_size:
+                self._queue_batch()
+
+    def flush(self) -> None:
+        """Writes buffered records, and waits until all records are
+        committed. May be called from another thread than `write()`.
+
+        Raises
+        ------
+        ValueError
+            if the sink is closed.
+        Exception
+            any error of the writer thread.
+        """
+        if self._closed:
+            raise ValueError("Sink is closed.")
+        marker = _Flush()
+        with self._lock:
+            self._queue_batch()
+            self._queue.put(marker)
+        marker.event.wait()
+        if self._error is not None:
+            raise self._error
+
+    def close(self) -> None:
+        """Writes buffered records, and closes the database.
+
+        Raises
+        ------
+        Exception
+            any error of the writer thread.
+        """
+        if not self._closed:
+            self._closed = True
+            with self._lock:
+                self._queue_batch()
+            self._queue.put(None)
+            self._thread.join()
+        if self._error is not None:
+            raise self._error
@@ -6,46 +6,216 @@ Written January 2021.
 # Python 3.7 onwards, for annotations with standard collections
 from __future__ import annotations
 
+import bz2
+import codecs
+import gzip
+import io
 import itertools
-import tempfile
+import lzma
 import logging
 from pathlib import Path
-from typing import Any, Union, IO, AnyStr
+from typing import Any, Optional, Union, IO
 import re
+import time
+import zlib
 
 import bs4
 import dateutil.parser
 from django.core.validators import URLValidator
 from django.core.exceptions import ValidationError
 
+from articleparser.exceptions import BudgetExceededError, DeadlineExceededError
+from articleparser.settings import EMPTY_TAGS, HEAD_REMOVE_TAGS
+
 
 LOGGER = logging.getLogger(__name__)
 
+PARSERS = ["html.parser", "lxml", "html5lib", "adaptive"]
+
+# Used in `remove_tags_in_head()` and `find_head_end()`
+HEAD_START_REGEX = re.compile(r"<head(?=[\s/>])", flags=re.IGNORECASE)
+# <head> ends at </head>, or at the first start tag of an element which
+# cannot appear in <head> (such as <body>, or <p> when <body> is omitted);
+# <iframe> elements are wrongly placed in the <head> of many documents
+HEAD_TOKEN_REGEX = re.compile(
+    r"""
+        (?P<comment><!--)                               # start of comment
+        | <(?P<name>iframe|noscript|script|style|title)(?=[\s/>])  # start tag
+        | (?P<end>
+            </head\s*>
+            | <(?!(?:base|basefont|bgsound|command|head|html|link|meta|template)
+                 (?=[\s/>]))
+              [a-zA-Z][a-zA-Z0-9-]*(?=[\s/>])
+        )                                               # end of <head>
+    """,
+    flags=re.VERBOSE | re.IGNORECASE,
+)
+# Used in `extract_head()`
+JSON_LD_SCRIPT_REGEX = re.compile(
+    r"""<script\s[^>]*type\s*=\s*["']?application/ld\+json(?=["'\s>])[^>]*>""",
+    flags=re.IGNORECASE,
+)
+CLOSING_TAG_REGEXES = {
+    name: re.compile(r"</{}\s*>".format(name), flags=re.IGNORECASE)
+    for name in ["h1", "iframe", "noscript", "script", "style", "time", "title"]
+}
+# end tags of other elements, matched by name in `_find_closing_tag()`
+END_TAG_REGEX = re.compile(r"</(?P<name>[a-zA-Z][a-zA-Z0-9-]*)\s*>")
+# start tags of the elements in <body> read by `ArticleExtractor.extract_title()`
+# and `extract_timestamps()`: <h1> elements, and elements whose itemprop
+# contains "headline", "datePublished" or "dateModified"
+SHORT_FIELD_TAG_REGEX = re.compile(
+    r"""
+        <(?P<name>
+            h1
+            | [a-zA-Z][a-zA-Z0-9]*
+              (?=[^>]*\sitemprop\s*=\s*["']?[^"'>]*?
+                 \b(?:headline|datePublished|dateModified)\b)
+        )(?=[\s/>])[^>]*>
+    """,
+    flags=re.VERBOSE | re.IGNORECASE,
+)
+# Used in `check_soup_structure()`
+TRAILING_COMMENT_REGEX = re.compile(r"<!--.*?-->", flags=re.DOTALL)
+# Used in `check_document_size()`
+TAG_TOKEN_REGEX = re.compile(
+    r"""
+        (?P<comment><!--)                               # start of comment
+        | <(?P<end>/)?(?P<name>[a-zA-Z][a-zA-Z0-9-]*)(?=[\s/>])  # start or end tag
+    """,
+    flags=re.VERBOSE,
+)
+RAW_TEXT_REGEXES = {
+    name: re.compile(r"</{}\s*>".format(name), flags=re.IGNORECASE)
+    for name in ["script", "style", "textarea", "title"]
+}
+# https://html.spec.whatwg.org/multipage/syntax.html#optional-tags
+OPTIONAL_END_TAGS = {
+    "html",
+    "head",
+    "body",
+    "p",
+    "li",
+    "dt",
+    "dd",
+    "option",
+    "optgroup",
+    "colgroup",
+    "caption",
+    "thead",
+    "tbody",
+    "tfoot",
+    "tr",
+    "td",
+    "th",
+    "rb",
+    "rt",
+    "rp",
+    "rtc",
+}
+
+# Used in `read_html()`: suffixes and magic bytes of compressed documents,
+# with the stdlib modules that decompress them
+COMPRESSION_SUFFIXES = {
+    ".gz": gzip,
+    ".bz2": bz2,
+    ".xz": lzma,
+}
+COMPRESSION_MAGIC_BYTES = [
+    (b"\x1f\x8b", ".gz"),
+    (b"BZh", ".bz2"),
+    (b"\xfd7zXZ\x00", ".xz"),
+]
+MAGIC_BYTES_LENGTH = 6
+# errors raised by the modules above for corrupt or truncated data
+DECOMPRESSION_ERRORS = (EOFError, OSError, ValueError, lzma.LZMAError, zlib.error)
+
+# Used in `decode_html()`
+BOMS = [
+    (codecs.BOM_UTF8, "utf-8"),
+    (codecs.BOM_UTF16_BE, "utf-16-be"),
+    (codecs.BOM_UTF16_LE, "utf-16-le"),
+]
+META_PRESCAN_BYTES = 1024
+META_CHARSET_REGEX = re.compile(
+    rb"""<meta\s[^>]*?charset\s*=\s*["']?\s*(?P<charset>[a-zA-Z0-9_.:-]+)""",
+    flags=re.IGNORECASE,
+)
+ENCODING_REPLACEMENTS = {
+    "ascii": "cp1252",
+    "us-ascii": "cp1252",
+    "iso-8859-1": "cp1252",
+    "iso8859-1": "cp1252",
+    "latin1": "cp1252",
+    "latin-1": "cp1252",
+    "gb2312": "gbk",
+    "x-gbk": "gbk",
+    "tis-620": "cp874",
+    "iso-8859-9": "cp1254",
+    "shift-jis": "cp932",
+    "shift_jis": "cp932",
+    "x-sjis": "cp932",
+    "euc-kr": "cp949",
+}
+
 
 def make_soup(
-    f: Union[AnyStr, Path, IO],
+    f: Union[str, Path, bytes, bytearray, memoryview, IO],
     *,
     parser: str = None,  # keyword-only argument
+    remove_in_head: list[str] = None,
+    encoding: str = None,
+    head_only: bool = False,
+    max_bytes: int = None,
+    max_nodes: int = None,
+    max_depth: int = None,
 ) -> bs4.BeautifulSoup:
     """Make soup object.
 
-    Reads from either a filepath, or an object of type `IO`, with encoding
-    "utf-8".
+    Reads the HTML document from `f` with `read_html()`: `f` can be a
+    filepath (`Path`), a HTML string, raw bytes, or a readable file-like
+    object. Strings are always the document itself, never filepaths.
+
+    If `head_only`, the document is first truncated to its <head> (and any
+    JSON-LD blocks, titles and timestamps in <body>) with `extract_head()`,
+    so that the rest of the <body> of the document is never parsed.
 
-    Thereafter, performs regular expression operations to remove certain
-    malformed HTML sequences.
+    Thereafter, removes elements in `remove_in_head` from <head> with
+    `remove_tags_in_head()`, since these cause malformed HTML sequences.
+    If `max_nodes` or `max_depth` is given, the document is then checked
+    with `check_document_size()` before it is parsed.
 
     Lastly, creates `bs4.BeautifulSoup` object with `parser` as specified,
     defaulting to "html5lib".
+    With `parser="adaptive"`, the document is parsed with "lxml", and
+    re-parsed with "html5lib" only if the result fails
+    `check_soup_structure()`. The parser used can be read from
+    `soup.builder.NAME`.
 
     Written February 2021.
 
     Parameters
     ----------
-    f: AnyStr or Path or IO
-        filepath pointing to HTML file.
-    parser: {"html.parser", "lxml", "html5lib"}
+    f: str or Path or bytes or bytearray or memoryview or IO
+        The HTML document, or filepath pointing to HTML file;
+        see `read_html()`.
+    parser: {"html.parser", "lxml", "html5lib", "adaptive"}
         see https://www.crummy.com/software/BeautifulSoup/bs4/doc/#differences-between-parsers
+    remove_in_head: list[str], optional
+        Tag names of elements to remove from <head> before parsing,
+        defaulting to `HEAD_REMOVE_TAGS` (<iframe> and <noscript>).
+    encoding: str, optional
+        The encoding of the document, if known (for example, from the
+        Content-Type header of a HTTP response). Used unless the document
+        begins with a byte order mark.
+    head_only: bool, default False
+        Whether to parse only the <head> of the document.
+    max_bytes: int, optional
+        The maximum size of the document; see `read_html()`.
+    max_nodes: int, optional
+        The maximum number of elements; see `check_document_size()`.
+    max_depth: int, optional
+        The maximum nesting depth of elements; see `check_document_size()`.
 
     Returns
     -------
@@ -55,161 +225,713 @@ def make_soup(
     Raises
     ------
     ValueError
-        if `f` is of type `AnyStr` or `Path` and does not end with ".html".
+        if `f` is a filepath and does not end with ".html".
     ValueError
         if `parser` is not from the allowed list.
     FileNotFoundError
         if a filepath is provided but no file exists at that filepath.
     TypeError
-        if `f` is not of type `AnyStr`, `Path`, or `IO`.
+        if `f` is not of type `str`, `Path`, bytes-like, or `IO`.
+    articleparser.exceptions.BudgetExceededError
+        if the document exceeds `max_bytes`, `max_nodes` or `max_depth`.
     """
     if parser is not None:
-        if parser not in ["html.parser", "lxml", "html5lib"]:
+        if parser not in PARSERS:
             raise ValueError("Wrong parser format specified.")
 
-    if isinstance(f, (str, bytes, Path)):
+    html_doc = _prepare_html_doc(
+        f, remove_in_head, encoding, head_only, max_bytes, max_nodes, max_depth
+    )
+
+    if parser == "adaptive":
+        soup = bs4.BeautifulSoup(html_doc, "lxml")
+        if not check_soup_structure(soup, html_doc):
+            LOGGER.debug("Structural check failed for lxml; re-parsing with html5lib.")
+            soup = bs4.BeautifulSoup(html_doc, "html5lib")
+    elif parser:
+        soup = bs4.BeautifulSoup(html_doc, parser)
+    else:
+        soup = bs4.BeautifulSoup(html_doc, "html5lib")
+    return soup
+
+
+def _prepare_html_doc(
+    f: Union[str, Path, bytes, bytearray, memoryview, IO],
+    remove_in_head: list[str],
+    encoding: str,
+    head_only: bool,
+    max_bytes: int,
+    max_nodes: int,
+    max_depth: int,
+) -> str:
+    # Reads and prepares the HTML document for parsing; see `make_soup()`.
+    html_doc = read_html(f, encoding, max_bytes)
+    if head_only:
+        html_doc = extract_head(html_doc)
+
+    # <iframe> tags in <head> have to be removed before parsing
+    # this is because parsers (even the lxml parser) will interpret <iframe>
+    # tags in <head> to be belonging to <body>, and begin <body> prematurely
+    # similarly, while <noscript> tags in <head> are legal,
+    # <noscript> tags can contain flow content when in <body> but not in <head>;
+    # easier to just remove all of these (especially in the head)
+    html_doc = remove_tags_in_head(html_doc, remove_in_head)
+    check_document_size(html_doc, max_nodes, max_depth)
+    return html_doc
+
+
+def read_html(
+    f: Union[str, Path, bytes, bytearray, memoryview, IO],
+    encoding: str = None,
+    max_bytes: int = None,
+) -> str:
+    """Reads a HTML document into a string.
+
+    `f` is interpreted as follows:
+    - `Path`: a filepath ending with ".html", optionally followed by a
+      suffix from `COMPRESSION_SUFFIXES`;
+    - `str`: the HTML document itself (never a filepath, so that documents
+      from untrusted sources are never read as files);
+    - bytes-like: the raw bytes of the HTML document;
+    - any object with a `read()` method: a binary or text stream, read from
+      its current position. The contents of `io.BytesIO` objects are
+      decoded in-place, without being copied.
+
+    Compressed documents (gzip, bz2 or xz) are detected by their suffix or
+    by their magic bytes, and decompressed in memory. Files are decompressed
+    as they are read, without holding the compressed file in memory.
+
+    Raw bytes are decoded with `decode_html()`, which detects the encoding
+    from a byte order mark, a <meta> charset declaration, or `encoding`.
+
+    If `max_bytes` is given, at most `max_bytes + 1` bytes of the
+    (decompressed) document are read, so oversized documents are never held
+    in memory in full.
+
+    Parameters
+    ----------
+    f: str or Path or bytes or bytearray or memoryview or IO
+        The HTML document, or filepath pointing to HTML file.
+    encoding: str, optional
+        The encoding of the document, if known.
+    max_bytes: int, optional
+        The maximum size of the (decompressed) document, in bytes;
+        for strings and text streams, in characters.
+
+    Returns
+    -------
+    html_doc : str
+        The HTML document.
+
+    Raises
+    ------
+    ValueError
+        if `f` is a filepath and does not end with ".html" (or ".html"
+        followed by a compression suffix), or if a compressed document is
+        corrupt or truncated.
+    FileNotFoundError
+        if a filepath is provided but no file exists at that filepath.
+    TypeError
+        if `f` is not of type `str`, `Path`, bytes-like, or `IO`.
+    articleparser.exceptions.BudgetExceededError
+        if the document is larger than `max_bytes`. The exception holds the
+        document, truncated to `max_bytes`.
+    """
+    # number of bytes (or characters, for text) to read; -1 reads everything
+    limit = -1 if max_bytes is None else max_bytes + 1
+    exceeded = None
+    if isinstance(f, str):
+        html_doc = f
+    elif isinstance(f, Path):
         filepath = str(f)
-        if not filepath.endswith(".html"):
+        suffix = None
+        for compression_suffix in COMPRESSION_SUFFIXES:
+            if filepath.endswith(".html" + compression_suffix):
+                suffix = compression_suffix
+        if suffix is None and not filepath.endswith(".html"):
             LOGGER.error("filepath {} of wrong suffix".format(filepath))
             raise ValueError("filepath {} of wrong suffix".format(filepath))
         try:
-            with open(str(filepath), "r", encoding="utf-8") as f:
-                html_doc = f.read()
+            with open(filepath, "rb") as f:
+                if suffix is None:
+                    suffix = get_compression_suffix(f.peek(MAGIC_BYTES_LENGTH))
+                if suffix is None:
+                    html_doc = f.read(limit)
+                else:
+                    html_doc = _read_decompressed(f, suffix, limit)
         except FileNotFoundError:
-            LOGGER.error("No such file: {}".format(str(filepath)))
-            raise FileNotFoundError
-    elif isinstance(f, tempfile.SpooledTemporaryFile):
-        html_doc = f.read()
-        html_doc = str(html_doc, "utf-8")
+            LOGGER.error("No such file: {}".format(filepath))
+            raise FileNotFoundError("No such file: {}".format(filepath))
+    elif isinstance(f, (bytes, bytearray, memoryview)):
+        html_doc = decompress_html(f, max_bytes)
+    elif isinstance(f, io.BytesIO):
+        # the buffer must be decoded before it is released
+        with f.getbuffer() as buffer:
+            html_doc, exceeded = _decode_limited(
+                decompress_html(buffer[f.tell() :], max_bytes), encoding, max_bytes
+            )
+        f.seek(0, io.SEEK_END)
+    elif hasattr(f, "read"):
+        html_doc = f.read(limit)
+        if not isinstance(html_doc, str):  # binary stream
+            html_doc = decompress_html(html_doc, max_bytes)
     else:
         LOGGER.error("Wrong input type: {}".format(type(f)))
         raise TypeError("Wrong input type: {}".format(type(f)))
 
-    # <iframe> tags in <head> have to be removed via regex
-    # this is because parsers (even the lxml parser) will interpret <iframe>
-    # tags in <head> to be belonging to <body>, and begin <body> prematurely
-    html_doc = remove_iframes_in_head(html_doc)
-    # similarly, while <noscript> tags in <head> are legal,
-    # <noscript> tags can contain flow content when in <body> but not in <head>;
-    # easier to just remove all of these (especially in the head)
-    html_doc = remove_noscripts_in_head(html_doc)
-    # html_doc = remove_scripts_in_head(html_doc)
+    if exceeded is None:
+        html_doc, exceeded = _decode_limited(html_doc, encoding, max_bytes)
+    if exceeded:
+        LOGGER.warning("Document exceeds MAX_INPUT_BYTES of {}.".format(max_bytes))
+        raise BudgetExceededError("MAX_INPUT_BYTES", max_bytes, len(html_doc), html_doc)
+    return html_doc
 
-    if parser:
-        soup = bs4.BeautifulSoup(html_doc, parser)
-    else:
-        soup = bs4.BeautifulSoup(html_doc, "html5lib")
-    return soup
 
+def is_filepath(f: Any) -> bool:
+    """Whether `f` is taken as a filepath by `read_html()`, rather than as
+    a HTML document.
 
-def remove_iframes_in_head(html_doc: str) -> str:
-    """Removes `iframe` tags in `head`.
+    Only `Path` objects are filepaths: strings are always documents.
+
+    Parameters
+    ----------
+    f : Any
+        The source of a HTML document.
+
+    Returns
+    -------
+    bool
+    """
+    return isinstance(f, Path)
+
+
+def _decode_limited(
+    data: Union[str, bytes, bytearray, memoryview],
+    encoding: str,
+    max_bytes: int,
+) -> (str, bool):
+    # Decodes `data` with `decode_html()` if not a string, keeping at most
+    # `max_bytes` bytes (or characters, for a string).
+    # Returns the document, and whether `data` was longer than `max_bytes`.
+    exceeded = max_bytes is not None and len(data) > max_bytes
+    if exceeded:
+        data = data[:max_bytes]
+    if not isinstance(data, str):
+        data = decode_html(data, encoding)
+    return data, exceeded
+
+
+def get_compression_suffix(data: Union[bytes, bytearray, memoryview]) -> str:
+    """Returns the suffix in `COMPRESSION_SUFFIXES` matching the magic bytes
+    at the start of `data`, or None if `data` is not compressed."""
+    for magic, suffix in COMPRESSION_MAGIC_BYTES:
+        if data[: len(magic)] == magic:
+            return suffix
+    return None
+
+
+def decompress_html(
+    data: Union[bytes, bytearray, memoryview],
+    max_bytes: int = None,
+) -> Union[bytes, bytearray, memoryview]:
+    """Decompresses `data` if compressed with gzip, bz2 or xz.
+
+    The compression format is detected from the magic bytes at the start of
+    `data`. If `data` is not compressed, it is returned unchanged.
+    If `max_bytes` is given, at most `max_bytes + 1` bytes are decompressed.
+    Raises ValueError if `data` is corrupt or truncated.
+    """
+    suffix = get_compression_suffix(data)
+    if suffix is None:
+        return data
+    LOGGER.debug("Decompressing document with {} compression.".format(suffix))
+    if max_bytes is None:
+        try:
+            return COMPRESSION_SUFFIXES[suffix].decompress(data)
+        except DECOMPRESSION_ERRORS as e:
+            LOGGER.error("Corrupt {} compressed document: {}".format(suffix, e))
+            raise ValueError("Corrupt {} compressed document: {}".format(suffix, e)) from e
+    # decompress at most `max_bytes + 1` bytes, to detect oversized documents
+    return _read_decompressed(io.BytesIO(data), suffix, max_bytes + 1)
+
+
+def _read_decompressed(f: IO[bytes], suffix: str, limit: int) -> bytes:
+    # Reads at most `limit` bytes (all if -1) of the document compressed in
+    # `f` with the compression of `suffix`.
+    try:
+        with COMPRESSION_SUFFIXES[suffix].open(f) as decompressed_f:
+            return decompressed_f.read(limit)
+    except DECOMPRESSION_ERRORS as e:
+        LOGGER.error("Corrupt {} compressed document: {}".format(suffix, e))
+        raise ValueError("Corrupt {} compressed document: {}".format(suffix, e)) from e
+
+
+def decode_html(
+    data: Union[bytes, bytearray, memoryview],
+    encoding: str = None,
+) -> str:
+    """Decodes the raw bytes of a HTML document.
+
+    The encoding is determined in the following order of priority, following
+    https://html.spec.whatwg.org/multipage/parsing.html#encoding-sniffing-algorithm
+    - a byte order mark (BOM) at the start of `data`;
+    - `encoding`, as supplied by the caller;
+    - a <meta charset> or <meta http-equiv="Content-Type"> declaration within
+      the first `META_PRESCAN_BYTES` bytes of `data`;
+    - "utf-8", falling back to "windows-1252" if `data` is not valid UTF-8.
+
+    Apart from the prescan, `data` is not copied before decoding, and
+    (except for the final fallback) is decoded once. Undecodable bytes are
+    replaced with U+FFFD.
+
+    Parameters
+    ----------
+    data : bytes or bytearray or memoryview
+        The raw bytes of the HTML document.
+    encoding : str, optional
+        The encoding of the document, if known.
+
+    Returns
+    -------
+    html_doc : str
+        The HTML document.
+    """
+    data = memoryview(data).cast("B")
+
+    for bom, bom_encoding in BOMS:
+        if data[: len(bom)] == bom:
+            return str(data[len(bom) :], bom_encoding, "replace")
+
+    encoding = normalize_encoding(encoding)
+    if encoding is None:
+        match = META_CHARSET_REGEX.search(bytes(data[:META_PRESCAN_BYTES]))
+        if match is not None:
+            encoding = normalize_encoding(match.group("charset").decode("ascii"))
+            # a <meta> declaration of UTF-16 must be wrong, since it was
+            # read as ASCII-compatible bytes
+            if encoding in ("utf-16", "utf-16-le", "utf-16-be"):
+                encoding = "utf-8"
+    if encoding is not None:
+        return str(data, encoding, "replace")
+
+    try:
+        return str(data, "utf-8")
+    except UnicodeDecodeError:
+        LOGGER.debug("Document is not valid UTF-8; decoding as windows-1252.")
+        return str(data, "cp1252", "replace")
+
+
+def normalize_encoding(encoding: str) -> str:
+    """Returns the Python codec name for `encoding`, or None if unknown.
+
+    Applies the replacements of https://encoding.spec.whatwg.org/#names-and-labels
+    where these differ from Python's codecs, e.g. "iso-8859-1" and "ascii"
+    are decoded as "windows-1252".
+    """
+    if not encoding:
+        return None
+    encoding = encoding.strip().strip("\"'").lower()
+    encoding = ENCODING_REPLACEMENTS.get(encoding, encoding)
+    try:
+        return codecs.lookup(encoding).name
+    except LookupError:
+        LOGGER.debug("Unknown encoding: {}".format(encoding))
+        return None
+
+
+def check_soup_structure(
+    soup: bs4.BeautifulSoup,
+    html_doc: str,
+) -> bool:
+    """Checks that `soup` has the head/body structure of `html_doc`.
+
+    Used to detect documents for which a lenient parser (such as "lxml")
+    disagrees with "html5lib" on the document structure. The check fails if:
+    - `soup` is missing any of <html>, <head> or <body>;
+    - the <head> of `soup` contains fewer metadata tags (<meta>, <link>,
+      <title>, <base>) than appear before <body> (or </head>) in `html_doc`,
+      indicating that <body> began prematurely;
+    - markup other than comments follows </html> in `html_doc`, which
+      "lxml" discards.
+
+    Only the part of `html_doc` before <body> and after </html> is scanned.
+
+    Parameters
+    ----------
+    soup : bs4.BeautifulSoup
+        The HTML document, as parsed.
+    html_doc : str
+        The HTML document that `soup` was parsed from.
+
+    Returns
+    -------
+    bool
+        True if `soup` passes the check, False otherwise.
+    """
+    if soup.html is None or soup.head is None or soup.body is None:
+        return False
 
-    Iteratively removes all `iframe` tags in `head` until none remain,
-    since in HTML5 these `iframe` elements are not allowed and
-    will cause the "html5lib" parser to start the `body` tag prematurely:
+    HEAD_END_REGEX = re.compile(r"<body[\s>]|</head\s*>", flags=re.IGNORECASE)
+    HEAD_TAG_REGEX = re.compile(r"<(?:meta|link|title|base)[\s/>]", flags=re.IGNORECASE)
+    head_end = HEAD_END_REGEX.search(html_doc)
+    if head_end is not None:
+        head_count = len(HEAD_TAG_REGEX.findall(html_doc, 0, head_end.start()))
+        soup_head_count = len(soup.head.find_all(["meta", "link", "title", "base"]))
+        if soup_head_count < head_count:
+            return False
+
+    html_end = max(html_doc.rfind("</html"), html_doc.rfind("</HTML"))
+    if html_end >= 0:
+        html_end = html_doc.find(">", html_end)
+        if html_end >= 0:
+            # comments and whitespace after </html> are common, and harmless
+            trailer = TRAILING_COMMENT_REGEX.sub("", html_doc[html_end + 1 :])
+            if "<" in trailer:
+                return False
+    return True
+
+
+def remove_tags_in_head(
+    html_doc: str,
+    tag_names: list[str] = None,
+) -> str:
+    """Removes tags with names in `tag_names` from `head`.
+
+    In HTML5, elements such as `iframe` are not allowed in `head`, and
+    will cause parsers to start the `body` tag prematurely:
     https://www.w3.org/TR/html52/document-metadata.html#the-head-element
 
-    Returns the resulting string.
+    Performs a single forward scan of `html_doc`: the first <head> start tag
+    is located, and every element from `tag_names` after it (up to the end
+    of <head>, as found by `find_head_end()`) is dropped, along with its
+    content. Comments, and the content of <title>, <script> and <style>
+    elements that are kept, are skipped over, so that markup inside them is
+    not mistaken for tags.
+    Tag names are matched case-insensitively.
 
-    Written February 2021.
+    Each character of `html_doc` is visited a bounded number of times, so
+    the running time is linear in the length of `html_doc`.
+
+    Parameters
+    ----------
+    html_doc : str
+        The HTML document.
+    tag_names : list[str], optional
+        Tag names of elements to remove, defaulting to `HEAD_REMOVE_TAGS`.
+        Chosen from "iframe", "noscript", "script" and "style".
+
+    Returns
+    -------
+    str
+        The HTML document, with elements removed from its `head`.
+
+    Raises
+    ------
+    ValueError
+        if `tag_names` contains an unsupported tag name.
     """
-    IFRAME_IN_HEAD_REGEX = re.compile(
-        r"""
-            (?P<before>                 # "before" capturing group, 
-                <head(?:\s[^>]+)?>          # "<head ...>" or "<head>"
-                (?:.*?)                     # non-capturing, 0 or more chars
-            )
-            (                           # "iframe" capturing group
-                <iframe[^>]*                # "<iframe..."
-                (?:\/>|>.*?<\/iframe>)      # "/>" or ">...</iframe>"
-            )
-            (?P<after>                  # "after" capturing group
-                (?:.*?)                     # non-capturing, 0 or more chars
-                <\/head>                    # "</head>"
-            )
-        """,
-        flags=re.VERBOSE | re.DOTALL,
-    )
+    if tag_names is None:
+        tag_names = HEAD_REMOVE_TAGS
+    tag_names = set(x.lower() for x in tag_names)
+    if not tag_names.issubset(["iframe", "noscript", "script", "style"]):
+        raise ValueError("Unsupported tag names: {}".format(tag_names))
+    if not tag_names:
+        return html_doc
+
+    head_start = HEAD_START_REGEX.search(html_doc)
+    if head_start is None:
+        return html_doc
+    pos = html_doc.find(">", head_start.end())
+    if pos < 0:
+        return html_doc
+    pos += 1
+
+    parts = []
+    last = 0  # start of the part of `html_doc` not yet copied into `parts`
     while True:
-        new_html_doc = re.sub(IFRAME_IN_HEAD_REGEX, r"\g<before>\g<after>", html_doc)
-        if new_html_doc == html_doc:
-            return new_html_doc
-        html_doc = new_html_doc
+        match = HEAD_TOKEN_REGEX.search(html_doc, pos)
+        if match is None or match.group("end"):
+            break
+        if match.group("comment"):
+            pos = html_doc.find("-->", match.end())
+            if pos < 0:
+                break
+            pos += 3
+            continue
 
+        name = match.group("name").lower()
+        tag_end = html_doc.find(">", match.end())
+        if tag_end < 0:
+            break
+        tag_end += 1
+        if html_doc[tag_end - 2] == "/" and name not in ("script", "style", "title"):
+            # self-closing tag, e.g. "<iframe ... />"
+            element_end = tag_end
+        else:
+            close = CLOSING_TAG_REGEXES[name].search(html_doc, tag_end)
+            if close is None:
+                break
+            element_end = close.end()
 
-def remove_noscripts_in_head(html_doc: str) -> str:
-    """Removes `noscript` tags in `head`.
+        if name in tag_names:
+            parts.append(html_doc[last : match.start()])
+            last = element_end
+        pos = element_end
 
-    Iteratively removes all `noscript` tags in `head` until none remain,
-    since in HTML5 these `noscript` elements are not allowed and
-    will cause the "html5lib" parser to start the `body` tag prematurely:
-    https://www.w3.org/TR/html52/document-metadata.html#the-head-element
+    if last == 0:
+        return html_doc
+    parts.append(html_doc[last:])
+    return "".join(parts)
 
-    Returns the resulting string.
 
-    Written February 2021.
+def find_head_end(html_doc: str) -> int:
+    """Returns the index in `html_doc` at which <head> ends.
+
+    This is the index of the first </head> end tag, or start tag of an
+    element which cannot appear in <head> (e.g. <body>, or <p> where
+    </head> and <body> are omitted), not counting those within comments,
+    or within <title>, <script>, <style>, <iframe> and <noscript> elements.
+    If none is found, returns `len(html_doc)`.
+
+    Performs a single forward scan, which stops at the end of <head>.
     """
-    NOSCRIPT_IN_HEAD_REGEX = re.compile(
-        r"""
-            (?P<before>                 # "before" capturing group, 
-                <head(?:\s[^>]+)?>          # "<head ...>" or "<head>"
-                (?:.*?)                     # non-capturing, 0 or more chars
-            )
-            (                           # "iframe" capturing group
-                <noscript[^>]*                # "<iframe..."
-                (?:\/>|>.*?<\/noscript>)      # "/>" or ">...</iframe>"
-            )
-            (?P<after>                  # "after" capturing group
-                (?:.*?)                     # non-capturing, 0 or more chars
-                <\/head>                    # "</head>"
-            )
-        """,
-        flags=re.VERBOSE | re.DOTALL,
-    )
+    pos = 0
+    while True:
+        match = HEAD_TOKEN_REGEX.search(html_doc, pos)
+        if match is None:
+            return len(html_doc)
+        if match.group("end"):
+            return match.start()
+        if match.group("comment"):
+            pos = html_doc.find("-->", match.end())
+            if pos < 0:
+                return len(html_doc)
+            pos += 3
+            continue
+        tag_end = html_doc.find(">", match.end())
+        if tag_end < 0:
+            return len(html_doc)
+        close = CLOSING_TAG_REGEXES[match.group("name").lower()].search(html_doc, tag_end)
+        if close is None:
+            return len(html_doc)
+        pos = close.end()
+
+
+def extract_head(
+    html_doc: str,
+    json_ld_in_body: bool = True,
+    short_fields_in_body: bool = True,
+) -> str:
+    """Truncates a HTML document to its <head>.
+
+    Returns the part of `html_doc` before the end of <head> (as found by
+    `find_head_end()`), which includes the <html> start tag and its
+    attributes. If `json_ld_in_body`, the JSON-LD <script> elements in the
+    rest of the document are found with a regular expression scan (without
+    parsing the <body>) and appended, since many documents place their
+    JSON-LD metadata in <body>.
+
+    A <body> is appended, holding, if `short_fields_in_body`, the elements
+    of the rest of the document from which titles and timestamps are
+    extracted when metadata lacks them (<h1> elements, and elements with
+    itemprop "headline", "datePublished" or "dateModified"), found with a
+    similar scan. Elements nested in these are kept, up to the first end
+    tag of the same name.
+
+    These scans cover the whole document, not just <head>: without them,
+    the title and timestamps of a metadata-only parse would differ from
+    those of a full parse for documents which only have them in <body>.
+    Each scan is a single forward pass of a regular expression, which is
+    far cheaper than parsing (and cleaning) the <body> into a tree; both
+    can be disabled to read no further than the end of <head>.
+
+    Parameters
+    ----------
+    html_doc : str
+        The HTML document.
+    json_ld_in_body : bool, default True
+        Whether to keep JSON-LD <script> elements from <body>.
+    short_fields_in_body : bool, default True
+        Whether to keep elements of titles and timestamps from <body>.
+
+    Returns
+    -------
+    str
+        The truncated HTML document.
+    """
+    head_end = find_head_end(html_doc)
+    parts = [html_doc[:head_end]]
+    if json_ld_in_body:
+        pos = head_end
+        while True:
+            match = JSON_LD_SCRIPT_REGEX.search(html_doc, pos)
+            if match is None:
+                break
+            close = CLOSING_TAG_REGEXES["script"].search(html_doc, match.end())
+            if close is None:
+                break
+            parts.append(html_doc[match.start() : close.end()])
+            pos = close.end()
+    parts.append("</head><body>")
+    if short_fields_in_body:
+        pos = head_end
+        while True:
+            match = SHORT_FIELD_TAG_REGEX.search(html_doc, pos)
+            if match is None:
+                break
+            name = match.group("name").lower()
+            pos = match.end()
+            if name in EMPTY_TAGS or match.group().endswith("/>"):
+                parts.append(match.group())
+                continue
+            close = _find_closing_tag(html_doc, name, pos)
+            if close is None:
+                break
+            parts.append(html_doc[match.start() : close.end()])
+            pos = close.end()
+    parts.append("</body></html>")
+    return "".join(parts)
+
+
+def _find_closing_tag(html_doc: str, name: str, pos: int) -> Optional[re.Match]:
+    # Finds the first end tag of the element `name` (in lowercase) in
+    # `html_doc` from `pos`, with the precompiled regular expressions.
+    if name in CLOSING_TAG_REGEXES:
+        return CLOSING_TAG_REGEXES[name].search(html_doc, pos)
+    for match in END_TAG_REGEX.finditer(html_doc, pos):
+        if match.group("name").lower() == name:
+            return match
+    return None
+
+
+def check_document_size(
+    html_doc: str,
+    max_nodes: int = None,
+    max_depth: int = None,
+) -> None:
+    """Checks the number of elements and nesting depth of a HTML document.
+
+    Performs a single forward scan of the tags in `html_doc`, before it is
+    parsed, so that oversized documents are rejected before a tree is built.
+    Comments, and the content of raw text elements (<script>, <style>,
+    <textarea> and <title>), are skipped over.
+
+    Every start tag counts as one element. The depth is an estimate: start
+    tags of elements in `OPTIONAL_END_TAGS` (whose end tags are commonly
+    omitted) and void elements in `EMPTY_TAGS` do not nest, and unmatched
+    end tags never bring the depth below zero.
+
+    Parameters
+    ----------
+    html_doc : str
+        The HTML document.
+    max_nodes : int, optional
+        The maximum number of elements.
+    max_depth : int, optional
+        The maximum nesting depth of elements.
 
+    Raises
+    ------
+    articleparser.exceptions.BudgetExceededError
+        if `html_doc` exceeds `max_nodes` or `max_depth`. The exception holds
+        `html_doc`, and the index of the start tag exceeding the budget.
+    """
+    if max_nodes is None and max_depth is None:
+        return
+    nodes = 0
+    depth = 0
+    pos = 0
     while True:
-        new_html_doc = re.sub(NOSCRIPT_IN_HEAD_REGEX, r"\g<before>\g<after>", html_doc)
-        if new_html_doc == html_doc:
-            return new_html_doc
-        html_doc = new_html_doc
+        match = TAG_TOKEN_REGEX.search(html_doc, pos)
+        if match is None:
+            return
+        pos = match.end()
+        if match.group("comment"):
+            pos = html_doc.find("-->", pos)
+            if pos < 0:
+                return
+            pos += 3
+            continue
+
+        name = match.group("name").lower()
+        if match.group("end"):
+            if name not in OPTIONAL_END_TAGS:
+                depth = max(depth - 1, 0)
+            continue
+
+        nodes += 1
+        if max_nodes is not None and nodes > max_nodes:
+            LOGGER.warning("Document exceeds MAX_NODES of {}.".format(max_nodes))
+            raise BudgetExceededError("MAX_NODES", max_nodes, match.start(), html_doc)
+        if name in RAW_TEXT_REGEXES:
+            close = RAW_TEXT_REGEXES[name].search(html_doc, pos)
+            if close is None:
+                return
+            pos = close.end()
+        elif name not in EMPTY_TAGS and name not in OPTIONAL_END_TAGS:
+            tag_end = html_doc.find(">", pos)
+            if tag_end > 0 and html_doc[tag_end - 1] == "/":
+                # self-closing tag, e.g. "<path ... />" in <svg>
+                continue
+            depth += 1
+            if max_depth is not None and depth > max_depth:
+                LOGGER.warning("Document exceeds MAX_DEPTH of {}.".format(max_depth))
+                raise BudgetExceededError("MAX_DEPTH", max_depth, match.start(), html_doc)
+
+
+def remove_iframes_in_head(html_doc: str) -> str:
+    """Removes `iframe` tags in `head`.
+
+    Returns the resulting string.
+
+    See Also
+    --------
+    remove_tags_in_head
+    """
+    return remove_tags_in_head(html_doc, ["iframe"])
+
+
+def remove_noscripts_in_head(html_doc: str) -> str:
+    """Removes `noscript` tags in `head`.
+
+    Returns the resulting string.
+
+    See Also
+    --------
+    remove_tags_in_head
+    """
+    return remove_tags_in_head(html_doc, ["noscript"])
 
 
 def remove_scripts_in_head(html_doc: str) -> str:
     """Removes `script` tags in `head`.
 
-    Iteratively removes all `script` tags in `head` until none remain,
-    since in HTML5 these `script` elements are not allowed and
-    will cause the "html5lib" parser to start the `body` tag prematurely:
-    https://www.w3.org/TR/html52/document-metadata.html#the-head-element
-
     Returns the resulting string.
 
-    Written February 2021.
+    See Also
+    --------
+    remove_tags_in_head
     """
-    SCRIPT_IN_HEAD_REGEX = re.compile(
-        r"""
-            (?P<before>                 # "before" capturing group, 
-                <head(?:\s[^>]+)?>          # "<head ...>" or "<head>"
-                (?:.*?)                     # non-capturing, 0 or more chars
-            )
-            (                           # "iframe" capturing group
-                <script[^>]*                # "<iframe..."
-                (?:\/>|>.*?<\/script>)      # "/>" or ">...</iframe>"
-            )
-            (?P<after>                  # "after" capturing group
-                (?:.*?)                     # non-capturing, 0 or more chars
-                <\/head>                    # "</head>"
-            )
-        """,
-        flags=re.VERBOSE | re.DOTALL,
-    )
+    return remove_tags_in_head(html_doc, ["script"])
 
-    while True:
-        new_html_doc = re.sub(SCRIPT_IN_HEAD_REGEX, r"\g<before>\g<after>", html_doc)
-        if new_html_doc == html_doc:
-            return new_html_doc
-        html_doc = new_html_doc
+
+def check_deadline(deadline: float, stage: str) -> None:
+    """Checks whether `deadline` has passed.
+
+    Parameters
+    ----------
+    deadline : float
+        The deadline, as a value of `time.monotonic()`; None for no deadline.
+    stage : str
+        The current stage of the pipeline, reported in the exception.
+
+    Raises
+    ------
+    articleparser.exceptions.DeadlineExceededError
+        if `deadline` has passed.
+    """
+    if deadline is not None and time.monotonic() > deadline:
+        raise DeadlineExceededError(stage)
 
 
 def extend_config(config, config_items):
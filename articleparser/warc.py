@@ -0,0 +1,363 @@
+"""Reading of HTML documents from web archive files.
+
+This module contains functions iterating over the records of WARC
+(https://iipc.github.io/warc-specifications/) and ARC
+(https://archive.org/web/researcher/ArcFileFormat.php) files, and parsing
+the HTML documents they contain with `Article`.
+
+Archives may be uncompressed, or compressed with gzip (including one gzip
+member per record, as in ".warc.gz" files). Records are read one at a time,
+so archives of any size are processed in constant memory; records whose
+payload is not HTML are skipped without being read into memory.
+
+Routine Listings
+----------------
+iter_records(source, html_only=True)
+    Iterate over the records of a WARC or ARC file.
+parse_records(source, config=None, **kwargs)
+    Parse the HTML documents in a WARC or ARC file with `Article`.
+"""
+
+# Python 3.7 onwards, for annotations with standard collections
+from __future__ import annotations
+
+from collections import namedtuple
+import gzip
+import io
+import logging
+from pathlib import Path
+import re
+from typing import IO, Iterator, Optional, Union
+
+from articleparser.article import Article
+from articleparser.config import Config
+
+LOGGER = logging.getLogger(__name__)
+
+ArchiveRecord = namedtuple(
+    "ArchiveRecord",
+    [
+        "uri",  # WARC-Target-URI (WARC) or URL (ARC) of the record
+        "record_type",  # e.g. "response", "resource"; "response" for ARC
+        "content_type",  # MIME type of the payload, lowercased, or None
+        "encoding",  # charset of the payload, from the Content-Type, or None
+        "payload",  # bytes; None if the record was skipped
+    ],
+)
+
+# MIME types of payloads treated as HTML documents
+HTML_CONTENT_TYPES = [
+    "text/html",
+    "application/xhtml+xml",
+]
+# WARC record types which contain documents
+WARC_RECORD_TYPES = [
+    "response",
+    "resource",
+]
+# Maximum length of a header line; longer lines are truncated
+MAX_LINE_LENGTH = 65536
+# Size of chunks read when skipping payloads of unseekable streams
+SKIP_CHUNK_SIZE = 1 << 20
+
+CHARSET_REGEX = re.compile(r"""charset\s*=\s*["']?([^\s;"']+)""", flags=re.IGNORECASE)
+
+
+def _open_archive(f: IO[bytes]) -> IO[bytes]:
+    # Wraps the binary stream `f`, decompressing gzip transparently.
+    # Concatenated gzip members (one per record) are read as a single stream.
+    if not hasattr(f, "peek"):
+        f = io.BufferedReader(f)
+    if f.peek(2)[:2] == b"\x1f\x8b":
+        return gzip.open(f, "rb")
+    return f
+
+
+def _skip(f: IO[bytes], length: int) -> None:
+    # Skips `length` bytes of `f`, without holding them in memory.
+    if f.seekable():
+        f.seek(length, io.SEEK_CUR)
+        return
+    while length > 0:
+        chunk = f.read(min(length, SKIP_CHUNK_SIZE))
+        if not chunk:
+            return
+        length -= len(chunk)
+
+
+def _read_headers(f: IO[bytes], limit: int = None) -> (dict[str, str], int):
+    # Reads "Name: value" header lines up to and including an empty line,
+    # reading at most `limit` bytes if given.
+    # Returns the headers, with lowercased names, and the bytes read.
+    headers = {}
+    name = None
+    consumed = 0
+    while limit is None or consumed < limit:
+        max_length = MAX_LINE_LENGTH
+        if limit is not None:
+            max_length = min(max_length, limit - consumed)
+        line = f.readline(max_length)
+        consumed += len(line)
+        if not line or line in (b"\r\n", b"\n"):
+            break
+        line = line.decode("latin-1").rstrip("\r\n")
+        if line[:1] in (" ", "\t") and name is not None:
+            # folded continuation of the previous header line
+            headers[name] += " " + line.strip()
+            continue
+        if ":" not in line:
+            continue
+        name, value = line.split(":", maxsplit=1)
+        name = name.strip().lower()
+        headers[name] = value.strip()
+    return headers, consumed
+
+
+def _parse_content_type(content_type: str) -> (Optional[str], Optional[str]):
+    # Splits a Content-Type header value into its MIME type and charset.
+    if not content_type:
+        return None, None
+    mime_type = content_type.split(";", maxsplit=1)[0].strip().lower()
+    match = CHARSET_REGEX.search(content_type)
+    charset = match.group(1) if match else None
+    return mime_type or None, charset
+
+
+def _dechunk(data: bytes) -> bytes:
+    # Decodes a HTTP body with "Transfer-Encoding: chunked".
+    # https://tools.ietf.org/html/rfc7230#section-4.1
+    chunks = []
+    pos = 0
+    while pos < len(data):
+        line_end = data.find(b"\n", pos)
+        if line_end < 0:
+            break
+        size_str = data[pos:line_end].split(b";", maxsplit=1)[0].strip()
+        try:
+            size = int(size_str, 16)
+        except ValueError:
+            LOGGER.debug("Malformed chunked payload; using payload as is.")
+            return data
+        if size == 0:
+            break
+        pos = line_end + 1
+        chunks.append(data[pos : pos + size])
+        pos += size
+        # skip CRLF following the chunk
+        if data[pos : pos + 2] == b"\r\n":
+            pos += 2
+        elif data[pos : pos + 1] == b"\n":
+            pos += 1
+    return b"".join(chunks)
+
+
+def _read_http_payload(
+    f: IO[bytes],
+    length: int,
+    html_only: bool,
+    content_type: str = None,
+) -> (Optional[str], Optional[str], Optional[bytes]):
+    # Reads a block of `length` bytes of `f` containing a HTTP response.
+    # Returns the MIME type, charset, and payload (None if skipped).
+    # If `content_type` is given, the HTTP headers are not consulted for it.
+    status_line = f.readline(min(MAX_LINE_LENGTH, length))
+    length -= len(status_line)
+    if not status_line.startswith(b"HTTP/"):
+        # not a HTTP response, e.g. "dns:" records; treat as raw payload
+        mime_type, charset = _parse_content_type(content_type)
+        if html_only and mime_type not in HTML_CONTENT_TYPES:
+            _skip(f, length)
+            return mime_type, charset, None
+        return mime_type, charset, status_line + f.read(length)
+
+    http_headers, consumed = _read_headers(f, length)
+    length -= consumed
+    mime_type, charset = _parse_content_type(
+        content_type or http_headers.get("content-type")
+    )
+    if html_only and mime_type not in HTML_CONTENT_TYPES:
+        _skip(f, length)
+        return mime_type, charset, None
+
+    payload = f.read(length)
+    if "chunked" in http_headers.get("transfer-encoding", "").lower():
+        payload = _dechunk(payload)
+    # gzip, bz2 and xz Content-Encodings are detected by `read_html()`
+    return mime_type, charset, payload
+
+
+def _iter_warc_records(
+    f: IO[bytes],
+    first_line: bytes,
+    html_only: bool,
+) -> Iterator[ArchiveRecord]:
+    # Iterates over WARC records, with `first_line` the version line of the
+    # first record.
+    line = first_line
+    while line:
+        if not line.startswith(b"WARC/"):
+            if line.strip():
+                LOGGER.debug("Skipping unexpected line in WARC file: {}".format(line[:80]))
+            line = f.readline(MAX_LINE_LENGTH)
+            continue
+
+        headers, _ = _read_headers(f)
+        try:
+            length = int(headers.get("content-length", "0"))
+        except ValueError:
+            LOGGER.error("Invalid WARC Content-Length: {}".format(headers.get("content-length")))
+            return
+        record_type = headers.get("warc-type")
+        uri = headers.get("warc-target-uri")
+        if uri is not None:
+            # WARC/1.0 permits angle brackets around the URI
+            uri = uri.strip("<>")
+
+        if record_type == "response" and headers.get("content-type", "").startswith(
+            "application/http"
+        ):
+            mime_type, charset, payload = _read_http_payload(f, length, html_only)
+        elif record_type in WARC_RECORD_TYPES:
+            mime_type, charset = _parse_content_type(headers.get("content-type"))
+            if html_only and mime_type not in HTML_CONTENT_TYPES:
+                _skip(f, length)
+                payload = None
+            else:
+                payload = f.read(length)
+        else:
+            # e.g. "warcinfo", "request", "metadata" records
+            _skip(f, length)
+            mime_type, charset, payload = None, None, None
+
+        if payload is not None or not html_only:
+            yield ArchiveRecord(uri, record_type, mime_type, charset, payload)
+        line = f.readline(MAX_LINE_LENGTH)
+
+
+def _iter_arc_records(
+    f: IO[bytes],
+    first_line: bytes,
+    html_only: bool,
+) -> Iterator[ArchiveRecord]:
+    # Iterates over ARC records, with `first_line` the header line of the
+    # first (version) record.
+    # Each record has a header line of space-separated fields, the first
+    # being the URL, the fourth the Content-Type and the last the length.
+    line = first_line
+    while line:
+        fields = line.decode("latin-1").split()
+        if len(fields) < 5:
+            line = f.readline(MAX_LINE_LENGTH)
+            continue
+        uri, content_type = fields[0], fields[3]
+        try:
+            length = int(fields[-1])
+        except ValueError:
+            LOGGER.error("Invalid ARC record length: {}".format(fields[-1]))
+            return
+
+        if uri.startswith("filedesc:"):
+            _skip(f, length)
+        elif html_only and _parse_content_type(content_type)[0] not in HTML_CONTENT_TYPES:
+            _skip(f, length)
+        else:
+            mime_type, charset, payload = _read_http_payload(
+                f, length, html_only, content_type=content_type
+            )
+            if payload is not None or not html_only:
+                yield ArchiveRecord(uri, "response", mime_type, charset, payload)
+        line = f.readline(MAX_LINE_LENGTH)
+        while line in (b"\r\n", b"\n"):
+            line = f.readline(MAX_LINE_LENGTH)
+
+
+def iter_records(
+    source: Union[str, Path, IO[bytes]],
+    html_only: bool = True,
+) -> Iterator[ArchiveRecord]:
+    """Iterate over the records of a WARC or ARC file.
+
+    The format is detected from the first line of the (decompressed) file.
+    For WARC files, "response" records containing HTTP responses, and
+    "resource" records, are read; other record types are skipped.
+    HTTP headers are removed from payloads, and chunked transfer encoding
+    is decoded.
+
+    Parameters
+    ----------
+    source : str or Path or IO[bytes]
+        The filepath of the archive, or a binary stream.
+        May be compressed with gzip, as a whole or per record.
+    html_only : bool, default True
+        Whether to skip records with a payload that is not HTML, as judged by
+        its Content-Type. Skipped payloads are never read into memory.
+
+    Yields
+    ------
+    ArchiveRecord
+        A namedtuple with fields "uri", "record_type", "content_type",
+        "encoding" and "payload".
+        If `html_only` is False, "payload" is None for skipped records.
+    """
+    if isinstance(source, (str, Path)):
+        raw_f = open(source, "rb")
+    else:
+        raw_f = source
+    f = _open_archive(raw_f)
+    try:
+        line = f.readline(MAX_LINE_LENGTH)
+        while line in (b"\r\n", b"\n"):
+            line = f.readline(MAX_LINE_LENGTH)
+        if line.startswith(b"WARC/"):
+            yield from _iter_warc_records(f, line, html_only)
+        elif line.startswith(b"filedesc:"):
+            yield from _iter_arc_records(f, line, html_only)
+        elif line:
+            LOGGER.error("Unrecognized archive format: {}".format(source))
+            raise ValueError("Unrecognized archive format: {}".format(source))
+    finally:
+        if raw_f is not source:
+            f.close()
+            raw_f.close()
+
+
+def parse_records(
+    source: Union[str, Path, IO[bytes]],
+    config: Config = None,
+    **kwargs,
+) -> Iterator[Article]:
+    """Parse the HTML documents in a WARC or ARC file with `Article`.
+
+    Each HTML record from `iter_records()` is passed to `Article` directly
+    from memory, with the record URI as `uuid` and the charset of its
+    Content-Type as `encoding`, and then parsed.
+    Records which fail to parse are logged and skipped.
+
+    Parameters
+    ----------
+    source : str or Path or IO[bytes]
+        The filepath of the archive, or a binary stream.
+    config : articleparser.config.Config, optional
+        A Config object consisting optional settings.
+    **kwargs : optional
+        Extra optional arguments to extend `config`.
+
+    Yields
+    ------
+    article : articleparser.article.Article
+        The parsed article; see `article.content` and `article.methods`.
+    """
+    for record in iter_records(source, html_only=True):
+        try:
+            article = Article(
+                html=record.payload,
+                uuid=record.uri,
+                encoding=record.encoding,
+                config=config,
+                **kwargs,
+            )
+            article.parse()
+        except Exception:
+            LOGGER.exception("Parsing failed for record: {}".format(record.uri))
+            continue
+        yield article
@@ -0,0 +1,443 @@
+"""Watching of a spool directory for new HTML documents.
+
+`DirectoryWatcher` yields the files of a directory as they appear, for
+continuous ingestion (e.g. by `articleparser.batch.parse_many()`, as with
+`articleparser --watch`). On Linux, it waits for inotify events, so that a
+file is picked up as soon as its writer closes it. Elsewhere, or on network
+filesystems (where inotify does not see changes made by other machines),
+it polls the modification time of the directory, which changes whenever a
+file is added, listing the directory only then.
+
+Files are only picked up once complete: when closed after writing, or
+renamed into the directory (with inotify); or when unmodified for a few
+seconds (when polling, and for files present on startup). Writers should
+preferably write to a temporary name without an HTML suffix, and rename
+the file once written.
+
+`ProcessedMarker` then moves or renames files once their records have been
+flushed, so that each file is processed at least once: after a crash,
+files processed but not yet marked are processed again.
+
+Routine Listings
+----------------
+inotify_available()
+    Whether inotify can be used.
+mark_processed(filepath, processed_dir=None)
+    Moves or renames a processed file.
+DirectoryWatcher
+    Yields new files of a directory as they appear.
+ProcessedMarker
+    Marks processed files once their records have been flushed.
+"""
+
+# Python 3.7 onwards, for annotations with standard collections
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import logging
+import os
+from pathlib import Path
+import select
+import struct
+import sys
+import threading
+import time
+from typing import Callable, Iterator, Optional, Union
+
+LOGGER = logging.getLogger(__name__)
+
+# Interval in seconds between checks of the directory when polling, and of
+# files which were still being written
+POLL_INTERVAL = 1.0
+# Seconds since their last modification after which files are considered
+# completely written, unless their writer is known to have closed them
+SETTLE_SECONDS = 2.0
+# Resolution in seconds of directory modification times assumed when
+# polling: a directory modified more recently is listed again, since files
+# added within the same tick would not change its modification time
+MTIME_RESOLUTION = 2.0
+# Suffix appended to processed files by `mark_processed()`, unless they are
+# moved to another directory
+PROCESSED_SUFFIX = ".done"
+# Interval in seconds between flushes of `ProcessedMarker`
+MARK_INTERVAL = 1.0
+
+# inotify(7) event masks
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+# Header of each event read from an inotify file descriptor: wd, mask,
+# cookie and the length of the name which follows
+INOTIFY_EVENT = struct.Struct("iIII")
+# Size of the buffer reading inotify events
+INOTIFY_BUFFER_SIZE = 1 << 16
+
+_LIBC = None
+
+
+def _get_libc() -> Optional[ctypes.CDLL]:
+    # Loads the C library, if it provides inotify.
+    global _LIBC
+    if _LIBC is None:
+        _LIBC = False
+        if sys.platform.startswith("linux"):
+            try:
+                libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+                libc.inotify_init1
+                libc.inotify_add_watch
+            except (OSError, AttributeError):
+                LOGGER.debug("inotify is not available.")
+            else:
+                _LIBC = libc
+    return _LIBC or None
+
+
+def inotify_available() -> bool:
+    """Whether inotify can be used (on Linux, with a C library providing it)."""
+    return _get_libc() is not None
+
+
+def mark_processed(
+    filepath: Union[str, Path],
+    processed_dir: Union[str, Path] = None,
+) -> Optional[str]:
+    """Moves a processed file to `processed_dir`, or else renames it with
+    `PROCESSED_SUFFIX` appended, so that it is not processed again.
+
+    Parameters
+    ----------
+    filepath : str or Path
+        The processed file.
+    processed_dir : str or Path, optional
+        The directory to move the file to, replacing any file of the same
+        name. Must be on the same filesystem.
+
+    Returns
+    -------
+    str or None
+        The new filepath, or None if `filepath` no longer exists.
+    """
+    filepath = str(filepath)
+    if processed_dir is None:
+        new_filepath = filepath + PROCESSED_SUFFIX
+    else:
+        new_filepath = os.path.join(str(processed_dir), os.path.basename(filepath))
+    try:
+        os.replace(filepath, new_filepath)
+    except FileNotFoundError:
+        LOGGER.warning("Processed file no longer exists: {}".format(filepath))
+        return None
+    return new_filepath
+
+
+class DirectoryWatcher(object):
+    """Yields new files of a directory as they appear.
+
+    The watcher can be iterated over once: it first yields the files in
+    `directory`, in sorted order, and then each new file as it is
+    completely written, until the watcher is closed (from another thread).
+    Only files directly in `directory` with a name ending with one of
+    `suffixes` are yielded, each once while it exists (a file which is
+    removed, and then added again, is yielded again).
+
+    Parameters
+    ----------
+    directory : str or Path
+        The directory to watch.
+    suffixes : tuple[str, ...], default (".html",)
+        The suffixes of the files to yield.
+    use_inotify : bool, optional
+        Whether to use inotify, or else poll the directory. Defaults to
+        `inotify_available()`.
+    poll_interval : float, default POLL_INTERVAL
+        The interval in seconds between checks of the directory when
+        polling, and of files which were still being written.
+    settle_seconds : float, default SETTLE_SECONDS
+        The time in seconds since their last modification after which
+        files not known to be closed are considered completely written.
+
+    Attributes
+    ----------
+    directory : str
+    use_inotify : bool
+
+    Raises
+    ------
+    NotADirectoryError
+        if `directory` is not a directory.
+    OSError
+        if inotify is requested, and fails (e.g. if out of watches).
+    """
+
+    def __init__(
+        self,
+        directory: Union[str, Path],
+        suffixes: tuple[str, ...] = (".html",),
+        use_inotify: bool = None,
+        poll_interval: float = POLL_INTERVAL,
+        settle_seconds: float = SETTLE_SECONDS,
+    ):
+        self._fd = None
+        self.directory = str(directory)
+        if not os.path.isdir(self.directory):
+            raise NotADirectoryError("Not a directory: {}".format(self.directory))
+        self.suffixes = tuple(suffixes)
+        self.use_inotify = inotify_available() if use_inotify is None else use_inotify
+        self.poll_interval = poll_interval
+        self.settle_seconds = settle_seconds
+
+        # names of the files yielded which still exist, and of files not
+        # yet known to be completely written
+        self._seen = set()
+        self._unsettled = set()
+        self._mtime = None
+        self._closed = threading.Event()
+        if self.use_inotify:
+            self._fd = self._add_watch()
+        LOGGER.info(
+            "Watching {} with {}.".format(
+                self.directory, "inotify" if self.use_inotify else "polling"
+            )
+        )
+
+    def __enter__(self) -> DirectoryWatcher:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _add_watch(self) -> int:
+        # Returns an inotify file descriptor watching the directory.
+        libc = _get_libc()
+        if libc is None:
+            raise OSError("inotify is not available.")
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, "inotify_init1: {}".format(os.strerror(errno)))
+        mask = (
+            IN_CLOSE_WRITE
+            | IN_MOVED_FROM
+            | IN_MOVED_TO
+            | IN_DELETE
+            | IN_DELETE_SELF
+            | IN_MOVE_SELF
+            | IN_ONLYDIR
+        )
+        if libc.inotify_add_watch(fd, os.fsencode(self.directory), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(fd)
+            raise OSError(errno, "inotify_add_watch: {}".format(os.strerror(errno)), self.directory)
+        return fd
+
+    def _matches(self, name: str) -> bool:
+        return name.endswith(self.suffixes) and not name.startswith(".")
+
+    def _scan(self) -> list[str]:
+        # Lists the directory, returning the names of new files, and
+        # forgetting files which no longer exist.
+        names = set()
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if self._matches(entry.name) and entry.is_file():
+                    names.add(entry.name)
+        self._seen &= names
+        self._unsettled &= names
+        return sorted(names - self._seen)
+
+    def _settled(self, name: str) -> bool:
+        # Whether the file `name` was not modified for `settle_seconds`;
+        # files which no longer exist are forgotten.
+        try:
+            mtime = os.stat(os.path.join(self.directory, name)).st_mtime
+        except FileNotFoundError:
+            self._unsettled.discard(name)
+            return False
+        return time.time() - mtime >= self.settle_seconds
+
+    def _ready(self, names: list[str]) -> list[str]:
+        # Returns those of `names` (and of files found unsettled before)
+        # which are completely written, in order; the others are kept
+        # to be checked again.
+        self._unsettled.update(names)
+        ready = sorted(name for name in self._unsettled if self._settled(name))
+        self._unsettled.difference_update(ready)
+        return ready
+
+    def _read_events(self) -> tuple[list[str], bool]:
+        # Reads pending inotify events, returning the names of files closed
+        # after writing or moved in, and whether events were lost.
+        try:
+            data = os.read(self._fd, INOTIFY_BUFFER_SIZE)
+        except BlockingIOError:
+            return [], False
+        names = []
+        overflow = False
+        offset = 0
+        while offset < len(data):
+            _, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                overflow = True
+            elif mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+                raise FileNotFoundError("Watched directory was removed: {}".format(self.directory))
+            elif mask & (IN_MOVED_FROM | IN_DELETE):
+                self._seen.discard(name)
+                self._unsettled.discard(name)
+            elif self._matches(name) and name not in self._seen:
+                names.append(name)
+        return names, overflow
+
+    def _wait_inotify(self) -> list[str]:
+        # Waits for files to be written, returning their names; wakes up
+        # at least every second to notice `close()`.
+        readable, _, _ = select.select([self._fd], [], [], min(self.poll_interval, 1.0))
+        if not readable:
+            return self._ready([])
+        names, overflow = self._read_events()
+        if overflow:
+            LOGGER.warning("inotify events were lost; listing {} again.".format(self.directory))
+            return self._ready(self._scan())
+        self._unsettled.difference_update(names)
+        return names + self._ready([])
+
+    def _wait_polling(self) -> list[str]:
+        # Waits for the directory to change, returning the names of the
+        # files completely written.
+        if self._closed.wait(self.poll_interval):
+            return []
+        mtime = os.stat(self.directory).st_mtime
+        if mtime != self._mtime or time.time() - mtime < MTIME_RESOLUTION:
+            self._mtime = mtime
+            return self._ready(self._scan())
+        return self._ready([])
+
+    def __iter__(self) -> Iterator[str]:
+        if not self.use_inotify:
+            self._mtime = os.stat(self.directory).st_mtime
+        try:
+            # files present before watching began may still be being written
+            names = self._ready(self._scan())
+            while True:
+                for name in names:
+                    if name in self._seen:
+                        continue
+                    self._seen.add(name)
+                    yield os.path.join(self.directory, name)
+                if self._closed.is_set():
+                    return
+                names = self._wait_inotify() if self.use_inotify else self._wait_polling()
+        finally:
+            self._close_fd()
+
+    def _close_fd(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def close(self) -> None:
+        """Stops watching: iteration ends within a second. The watcher
+        cannot be iterated over again."""
+        self._closed.set()
+
+    def __del__(self):
+        self._close_fd()
+
+
+class ProcessedMarker(object):
+    """Marks processed files once their records have been flushed.
+
+    Filepaths added with `add()` (once their records have been written)
+    are marked with `mark_processed()` by a background thread, every
+    `interval` seconds, after calling `flush` (e.g. `JsonlSink.flush()`),
+    so that no file is marked before its record is durable.
+
+    Parameters
+    ----------
+    flush : Callable[[], None]
+        Flushes the records written so far. Called from the background
+        thread.
+    processed_dir : str or Path, optional
+        Passed to `mark_processed()`.
+    interval : float, default MARK_INTERVAL
+        The interval in seconds between flushes.
+
+    Attributes
+    ----------
+    files_marked : int
+        The number of files marked so far.
+    """
+
+    def __init__(
+        self,
+        flush: Callable[[], None],
+        processed_dir: Union[str, Path] = None,
+        interval: float = MARK_INTERVAL,
+    ):
+        self.flush = flush
+        self.processed_dir = None if processed_dir is None else str(processed_dir)
+        if self.processed_dir is not None:
+            os.makedirs(self.processed_dir, exist_ok=True)
+        self.interval = interval
+        self.files_marked = 0
+        self._pending = []
+        self._lock = threading.Lock()
+        self._error = None
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="ProcessedMarker", daemon=True)
+        self._thread.start()
+
+    def __enter__(self) -> ProcessedMarker:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def add(self, filepath: str) -> None:
+        """Adds a file whose record has been written, to be marked.
+
+        Raises the error of the background thread, if any.
+        """
+        if self._error is not None:
+            raise self._error
+        with self._lock:
+            self._pending.append(filepath)
+
+    def _mark_pending(self) -> None:
+        # Flushes records, and marks the files added before.
+        with self._lock:
+            filepaths = self._pending
+            self._pending = []
+        if not filepaths:
+            return
+        self.flush()
+        for filepath in filepaths:
+            if mark_processed(filepath, self.processed_dir) is not None:
+                self.files_marked += 1
+
+    def _run(self) -> None:
+        # Main loop of the background thread.
+        while not self._closed.wait(self.interval):
+            try:
+                self._mark_pending()
+            except Exception as e:
+                LOGGER.exception("Marking processed files failed.")
+                self._error = e
+                return
+
+    def close(self) -> None:
+        """Marks the files added so far, and stops the background thread.
+        The records written must still be able to be flushed."""
+        self._closed.set()
+        self._thread.join()
+        if self._error is None:
+            self._mark_pending()
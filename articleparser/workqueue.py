@@ -0,0 +1,448 @@
+"""Distribution of batches over many nodes, without an external broker.
+
+Two ways of splitting a corpus over nodes (machines, or processes) are
+provided:
+- static sharding: `in_shard()` partitions documents by a stable hash of
+  their uuid, so that each of N nodes given the same inputs parses a
+  disjoint 1/N of them;
+- a work queue: `SpoolQueue` splits the inputs into chunks, stored as files
+  in a spool directory (e.g. on a volume shared over NFS), which nodes
+  lease one at a time. Leases are renewed by a heartbeat while a node is
+  alive, and leases which are not renewed (e.g. of a node which died)
+  expire, and are taken over by idle nodes.
+
+The queue relies only on the atomicity of `os.rename()` within a
+directory, which also holds on NFS. Chunks are processed at least
+once: records of a chunk whose lease expired, or of a node interrupted
+before completing its chunk, may be written twice.
+
+Routine Listings
+----------------
+shard_of(key, count)
+    Returns the shard of `key`, out of `count` shards.
+in_shard(key, index, count)
+    Whether `key` belongs to shard `index` of `count`.
+parse_shard(shard)
+    Parses a shard specification "i/N".
+Lease
+    A chunk of items leased from a `SpoolQueue`.
+SpoolQueue
+    A lease-based queue of chunks of items, in a spool directory.
+"""
+
+# Python 3.7 onwards, for annotations with standard collections
+from __future__ import annotations
+
+import logging
+import os
+from pathlib import Path
+import re
+import shutil
+import socket
+import threading
+import time
+from typing import Callable, Iterable, Iterator, Optional, Union
+import zlib
+
+LOGGER = logging.getLogger(__name__)
+
+# Number of items of each chunk of a `SpoolQueue`
+CHUNK_SIZE = 1000
+# Seconds after which a lease which is not renewed expires
+LEASE_SECONDS = 300.0
+# Interval in seconds between checks for chunks, while waiting for chunks
+# leased by other nodes to be completed or to expire
+POLL_INTERVAL = 5.0
+
+# Directories of a `SpoolQueue`
+PENDING_DIR = "pending"
+LEASED_DIR = "leased"
+DONE_DIR = "done"
+# Kept in "pending/" once a `SpoolQueue` is populated, so that the directory
+# is never empty, and cannot be replaced by another node populating it
+POPULATED_MARKER = ".populated"
+# Separates the chunk name from the owner in the filenames of leases
+LEASE_SEPARATOR = "@"
+
+
+def shard_of(key: str, count: int) -> int:
+    """Returns the shard of `key`, out of `count` shards.
+
+    The shard is the CRC-32 of `key` (as UTF-8) modulo `count`, which is
+    the same on every machine and Python process (unlike `hash()`).
+    """
+    return zlib.crc32(key.encode("utf-8")) % count
+
+
+def in_shard(key: str, index: int, count: int) -> bool:
+    """Whether `key` belongs to shard `index` of `count`; see `shard_of()`."""
+    return shard_of(key, count) == index
+
+
+def parse_shard(shard: str) -> tuple[int, int]:
+    """Parses a shard specification "i/N", with 0 <= i < N.
+
+    Returns
+    -------
+    tuple[int, int]
+        The index `i` and count `N` of shards.
+
+    Raises
+    ------
+    ValueError
+        if `shard` is not of the form "i/N", with 0 <= i < N.
+    """
+    match = re.fullmatch(r"(\d+)/(\d+)", shard.strip())
+    if match is None:
+        raise ValueError("Wrong shard specified: {}".format(shard))
+    index, count = int(match.group(1)), int(match.group(2))
+    if not 0 <= index < count:
+        raise ValueError("Wrong shard specified: {}".format(shard))
+    return index, count
+
+
+def _default_owner() -> str:
+    # An identifier of this process, unique across nodes.
+    host = re.sub(r"[^A-Za-z0-9_-]", "-", socket.gethostname())
+    return "{}-{}".format(host, os.getpid())
+
+
+class Lease(object):
+    """A chunk of items leased from a `SpoolQueue`.
+
+    Attributes
+    ----------
+    chunk : str
+        The name of the chunk.
+    items : list[str]
+        The items of the chunk.
+    path : str
+        The path of the lease file, in the "leased" directory.
+    """
+
+    def __init__(self, chunk: str, items: list[str], path: str):
+        self.chunk = chunk
+        self.items = items
+        self.path = path
+        # number of items yielded by `SpoolQueue.iter_items()` and not yet
+        # marked done, and whether all items have been yielded
+        self._remaining = 0
+        self._exhausted = False
+
+
+class SpoolQueue(object):
+    """A lease-based queue of chunks of items, in a spool directory.
+
+    The directory holds a file per chunk of items (e.g. filepaths), one per
+    line, which moves from "pending/" to "leased/" (renamed with its owner)
+    when leased, and to "done/" when completed. A heartbeat thread renews
+    the leases held by this object every quarter of `lease_seconds`, by
+    touching their files; a lease whose file was not touched for
+    `lease_seconds` is expired, and can be taken over by another owner.
+
+    Use `create()` to populate the queue (once, across all nodes), and then
+    `iter_items()` and `item_done()` to process it item by item; or
+    `acquire()` and `complete()` for chunks at a time. Nodes wait in
+    `acquire()` until the queue is populated, and while chunks remain
+    leased by other nodes. Close the queue (or use it as a context manager)
+    to stop the heartbeat; leases still held are left to expire.
+
+    Parameters
+    ----------
+    directory : str or Path
+        The spool directory, created if it does not exist.
+    lease_seconds : float, default LEASE_SECONDS
+        The time after which leases which are not renewed expire. This
+        should allow for the difference in clocks between nodes.
+    owner : str, optional
+        An identifier of this node, defaulting to the hostname and PID.
+
+    Attributes
+    ----------
+    directory : str
+    lease_seconds : float
+    owner : str
+    """
+
+    def __init__(
+        self,
+        directory: Union[str, Path],
+        lease_seconds: float = LEASE_SECONDS,
+        owner: str = None,
+    ):
+        self.directory = str(directory)
+        self.lease_seconds = lease_seconds
+        self.owner = owner or _default_owner()
+        if LEASE_SEPARATOR in self.owner:
+            raise ValueError("owner must not contain {!r}.".format(LEASE_SEPARATOR))
+        self._pending_dir = os.path.join(self.directory, PENDING_DIR)
+        self._leased_dir = os.path.join(self.directory, LEASED_DIR)
+        self._done_dir = os.path.join(self.directory, DONE_DIR)
+        os.makedirs(self._leased_dir, exist_ok=True)
+        os.makedirs(self._done_dir, exist_ok=True)
+
+        # leases held, by chunk name
+        self._leases = {}
+        self._lock = threading.Lock()
+        # in `iter_items()`, the lease of each item yielded, by index, and
+        # notified as items are done
+        self._item_leases = {}
+        self._item_done = threading.Condition(self._lock)
+        self._before_complete = None
+        self._closed = threading.Event()
+        self._heartbeat = threading.Thread(
+            target=self._run_heartbeat, name="SpoolQueue", daemon=True
+        )
+        self._heartbeat.start()
+
+    def __enter__(self) -> SpoolQueue:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def create(self, items: Iterable[str], chunk_size: int = CHUNK_SIZE) -> bool:
+        """Populates the queue with `items`, unless already populated.
+
+        Chunks are written to a temporary directory of this node, which is
+        then renamed to "pending/", so that nodes never see a partially
+        populated queue. Every node calling this populates its own
+        directory (stopping early once the queue is populated), and only
+        the first to rename it populates the queue; the others discard
+        theirs. A node dying while populating the queue thus leaves others
+        to populate it.
+
+        Parameters
+        ----------
+        items : Iterable[str]
+            The items, which must not contain newlines.
+        chunk_size : int, default CHUNK_SIZE
+            The number of items of each chunk.
+
+        Returns
+        -------
+        bool
+            Whether this call populated the queue.
+        """
+        if os.path.isdir(self._pending_dir):
+            return False
+        tmp_dir = os.path.join(self.directory, ".tmp-{}".format(self.owner))
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        open(os.path.join(tmp_dir, POPULATED_MARKER), "w").close()
+        chunk = []
+        count = 0
+        for item in items:
+            chunk.append(item)
+            if len(chunk) >= chunk_size:
+                if os.path.isdir(self._pending_dir):
+                    break
+                self._write_chunk(tmp_dir, count, chunk)
+                chunk = []
+                count += 1
+        else:
+            if chunk:
+                self._write_chunk(tmp_dir, count, chunk)
+                count += 1
+        try:
+            if os.path.isdir(self._pending_dir):
+                raise FileExistsError(self._pending_dir)
+            # fails if "pending/" exists, since it holds `POPULATED_MARKER`
+            os.rename(tmp_dir, self._pending_dir)
+        except OSError:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            if not os.path.isdir(self._pending_dir):
+                raise
+            return False
+        LOGGER.info("Created {} chunks in: {}".format(count, self.directory))
+        return True
+
+    @staticmethod
+    def _write_chunk(directory: str, number: int, items: list[str]) -> None:
+        # Writes a chunk of items to `directory`.
+        path = os.path.join(directory, "chunk-{:06d}".format(number))
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("".join(item + "\n" for item in items))
+
+    def _read_lease(self, chunk: str, path: str) -> Lease:
+        # Reads the items of a chunk just leased, and records the lease.
+        with open(path, encoding="utf-8") as f:
+            items = f.read().splitlines()
+        lease = Lease(chunk, items, path)
+        with self._lock:
+            self._leases[chunk] = lease
+        LOGGER.debug("Leased chunk: {}".format(chunk))
+        return lease
+
+    def _lease_path(self, chunk: str) -> str:
+        return os.path.join(self._leased_dir, chunk + LEASE_SEPARATOR + self.owner)
+
+    def acquire(self, wait: bool = True) -> Optional[Lease]:
+        """Leases a chunk: a pending one, or else one whose lease expired.
+
+        Parameters
+        ----------
+        wait : bool, default True
+            Whether to wait while there is no chunk to lease but chunks
+            remain leased by other owners (which may yet expire), or the
+            queue is not yet populated.
+
+        Returns
+        -------
+        Lease or None
+            None if there are no chunks left for this owner.
+        """
+        while not self._closed.is_set():
+            if os.path.isdir(self._pending_dir):
+                for chunk in sorted(os.listdir(self._pending_dir)):
+                    if chunk.startswith("."):
+                        continue
+                    path = self._lease_path(chunk)
+                    try:
+                        os.rename(os.path.join(self._pending_dir, chunk), path)
+                    except FileNotFoundError:
+                        # leased by another owner first
+                        continue
+                    os.utime(path)
+                    return self._read_lease(chunk, path)
+
+            others_leased = False
+            now = time.time()
+            for filename in sorted(os.listdir(self._leased_dir)):
+                chunk, _, owner = filename.partition(LEASE_SEPARATOR)
+                if owner == self.owner:
+                    continue
+                others_leased = True
+                old_path = os.path.join(self._leased_dir, filename)
+                try:
+                    expired = now - os.stat(old_path).st_mtime > self.lease_seconds
+                except FileNotFoundError:
+                    continue
+                if not expired:
+                    continue
+                path = self._lease_path(chunk)
+                try:
+                    os.rename(old_path, path)
+                except FileNotFoundError:
+                    continue
+                os.utime(path)
+                LOGGER.warning("Took over expired lease of {} from: {}".format(chunk, owner))
+                return self._read_lease(chunk, path)
+
+            populated = os.path.isdir(self._pending_dir)
+            if not wait or (populated and not others_leased):
+                return None
+            self._closed.wait(POLL_INTERVAL)
+        return None
+
+    def complete(self, lease: Lease) -> None:
+        """Marks the chunk of `lease` as done.
+
+        If the lease was lost (it expired and was taken over), a warning is
+        logged, since its items may be processed twice.
+        """
+        with self._lock:
+            self._leases.pop(lease.chunk, None)
+        try:
+            os.rename(lease.path, os.path.join(self._done_dir, lease.chunk))
+        except FileNotFoundError:
+            LOGGER.warning("Lease of {} was lost before completion.".format(lease.chunk))
+        else:
+            LOGGER.debug("Completed chunk: {}".format(lease.chunk))
+
+    def iter_items(
+        self,
+        before_complete: Callable[[], None] = None,
+        skip: Callable[[str], bool] = None,
+        max_outstanding: int = 0,
+        wait: bool = True,
+    ) -> Iterator[str]:
+        """Iterates over the items of chunks leased one after another.
+
+        Items are counted from 0 as they are yielded; once every item of
+        a chunk has been yielded and marked done with `item_done()`, the
+        chunk is completed. Items may be marked done from another thread
+        than the one iterating (e.g. when iterated by `multiprocessing.Pool`).
+
+        A new chunk is only leased once at most `max_outstanding` items are
+        yielded and not yet done, so that consumers reading ahead (such as
+        `multiprocessing.Pool.imap()`) do not lease every chunk at once,
+        leaving none for other nodes.
+
+        Parameters
+        ----------
+        before_complete : Callable[[], None], optional
+            Called before completing each chunk, e.g. to flush output.
+        skip : Callable[[str], bool], optional
+            Items for which this returns True are skipped (e.g. items
+            already done), and not counted.
+        max_outstanding : int, default 0
+            The maximum number of items not yet done when leasing a new
+            chunk. Must be 0 if items are marked done by the thread
+            iterating.
+        wait : bool, default True
+            Passed to `acquire()`.
+
+        Yields
+        ------
+        item : str
+        """
+        self._before_complete = before_complete
+        index = 0
+        while True:
+            with self._item_done:
+                self._item_done.wait_for(lambda: len(self._item_leases) <= max_outstanding)
+            lease = self.acquire(wait=wait)
+            if lease is None:
+                return
+            for item in lease.items:
+                if skip is not None and skip(item):
+                    continue
+                with self._lock:
+                    lease._remaining += 1
+                    self._item_leases[index] = lease
+                index += 1
+                yield item
+            with self._lock:
+                lease._exhausted = True
+                finished = lease._remaining == 0
+            if finished:
+                self._complete_items(lease)
+
+    def item_done(self, index: int) -> None:
+        """Marks the item `index` of `iter_items()` as done, completing its
+        chunk if all of its items are done."""
+        with self._lock:
+            lease = self._item_leases.pop(index)
+            lease._remaining -= 1
+            finished = lease._exhausted and lease._remaining == 0
+            self._item_done.notify_all()
+        if finished:
+            self._complete_items(lease)
+
+    def _complete_items(self, lease: Lease) -> None:
+        # Completes a chunk of `iter_items()`.
+        if self._before_complete is not None:
+            self._before_complete()
+        self.complete(lease)
+
+    def _run_heartbeat(self) -> None:
+        # Renews the leases held, until closed.
+        while not self._closed.wait(self.lease_seconds / 4):
+            with self._lock:
+                leases = list(self._leases.values())
+            for lease in leases:
+                try:
+                    os.utime(lease.path)
+                except FileNotFoundError:
+                    LOGGER.warning("Lease of {} was lost.".format(lease.chunk))
+                    with self._lock:
+                        self._leases.pop(lease.chunk, None)
+                except OSError:
+                    LOGGER.exception("Renewing lease of {} failed.".format(lease.chunk))
+
+    def close(self) -> None:
+        """Stops the heartbeat; leases still held are left to expire."""
+        self._closed.set()
+        self._heartbeat.join()
+        shutil.rmtree(os.path.join(self.directory, ".tmp-{}".format(self.owner)), ignore_errors=True)
@@ -28,6 +28,17 @@ setuptools.setup(
         "Operating System :: OS Independent",
     ],
     install_requires=requirements,
+    extras_require={
+        "parquet": ["pyarrow>=7.0"],
+    },
+    entry_points={
+        "console_scripts": [
+            "articleparser=articleparser.cli:main",
+            "articleparser-client=articleparser.client:main",
+            "articleparser-daemon=articleparser.daemon:main",
+            "articleparser-server=articleparser.server:main",
+        ],
+    },
     python_requires=">=3.8",
 )
 
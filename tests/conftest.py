@@ -0,0 +1,15 @@
+from pathlib import Path
+
+import pytest
+
+DATA_DIR = Path(__file__).parent / "data"
+
+
+@pytest.fixture
+def article_path() -> Path:
+    return DATA_DIR / "article.html"
+
+
+@pytest.fixture
+def article_html(article_path) -> str:
+    return article_path.read_text(encoding="utf-8")
@@ -0,0 +1,112 @@
+import asyncio
+import concurrent.futures
+import threading
+
+import pytest
+
+from articleparser.aio import AsyncParser
+
+
+class BlockingStream(object):
+    # A binary stream whose first read blocks until `event` is set.
+
+    def __init__(self):
+        self.event = threading.Event()
+        self._data = b"<html><body><p>Text</p></body></html>"
+
+    def seekable(self):
+        return False
+
+    def read(self, size=-1):
+        self.event.wait(10)
+        data, self._data = self._data, b""
+        return data
+
+
+def test_created_outside_event_loop(article_html):
+    parser = AsyncParser(executor="thread", workers=2)
+
+    async def main():
+        async with parser:
+            return await parser.parse(article_html, uuid="a")
+
+    assert asyncio.run(main())["uuid"] == "a"
+    # and usable from another event loop
+    with concurrent.futures.ThreadPoolExecutor(1) as executor:
+        parser = AsyncParser(executor=executor)
+        assert asyncio.run(parser.parse("<p>x</p>"))["error"] is None
+
+
+def test_cancelled_parse_keeps_slot():
+    async def main():
+        executor = concurrent.futures.ThreadPoolExecutor(2)
+        parser = AsyncParser(executor=executor, max_in_flight=1)
+        stream = BlockingStream()
+        first = asyncio.ensure_future(parser.parse(stream))
+        await asyncio.sleep(0.1)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        second = asyncio.ensure_future(parser.parse("<p>x</p>"))
+        await asyncio.sleep(0.3)
+        # the first document is still being parsed
+        assert not second.done()
+        stream.event.set()
+        record = await asyncio.wait_for(second, 10)
+        executor.shutdown()
+        return record
+
+    assert asyncio.run(main())["error"] is None
+
+
+@pytest.mark.parametrize("ordered", [True, False])
+def test_parse_many(article_html, ordered):
+    async def main():
+        async with AsyncParser(executor="thread", workers=2, max_in_flight=2) as parser:
+            inputs = [(str(i), article_html) for i in range(6)]
+            return [record async for record in parser.parse_many(inputs, ordered=ordered)]
+
+    records = asyncio.run(main())
+    if ordered:
+        assert [record["index"] for record in records] == list(range(6))
+    assert sorted(record["uuid"] for record in records) == [str(i) for i in range(6)]
+
+
+def test_parse_many_bounds_records_not_consumed():
+    async def main():
+        drawn = []
+
+        async def inputs():
+            for i in range(20):
+                drawn.append(i)
+                yield "<p>{}</p>".format(i)
+
+        async with AsyncParser(executor="thread", workers=2, max_in_flight=3) as parser:
+            records = parser.parse_many(inputs())
+            await records.__anext__()
+            await asyncio.sleep(0.3)
+            count = len(drawn)
+            await records.aclose()
+        return count
+
+    # the record yielded, and at most 3 waiting
+    assert asyncio.run(main()) <= 4
+
+
+def test_broken_process_pool_is_replaced(article_html):
+    async def main():
+        async with AsyncParser(executor="process", workers=1) as parser:
+            assert (await parser.parse("<p>x</p>"))["error"] is None
+            for process in list(parser.executor._processes.values()):
+                process.kill()
+                process.join()
+            try:
+                await parser.parse("<p>x</p>")
+            except concurrent.futures.process.BrokenProcessPool:
+                # submitted before the pool was found to be broken
+                pass
+            return await parser.parse(article_html, uuid="a")
+
+    record = asyncio.run(main())
+    assert record["uuid"] == "a"
+    assert record["error"] is None
@@ -0,0 +1,172 @@
+import pytest
+
+import articleparser.article
+from articleparser.article import Article
+from articleparser.config import Config
+from articleparser.exceptions import BudgetExceededError, DeadlineExceededError
+
+NESTED_HTML = (
+    "<html><head><title>Nested</title></head><body>"
+    + "<div>" * 4000
+    + "x"
+    + "</div>" * 4000
+    + "</body></html>"
+)
+# title and timestamp found in <body> only
+BODY_FIELDS_HTML = """<!DOCTYPE html>
+<html lang="en"><head><meta charset="utf-8"><title>The Site</title>
+</head><body><article>
+<h1>The headline of the article</h1>
+<p>By <a rel="author" href="/jane">Jane Doe</a>,
+<time itemprop="datePublished" datetime="2020-01-02T00:00:00Z">2 January 2020</time></p>
+<p>This is the first paragraph of the article, which is long enough to be kept.</p>
+</article></body></html>"""
+
+
+def _config(**settings):
+    config = Config()
+    for key, value in settings.items():
+        setattr(config, key, value)
+    return config
+
+
+def _depth(tag):
+    # The depth of the last descendant of `tag` on its last branch.
+    depth = 0
+    while getattr(tag, "contents", None):
+        tag = tag.contents[-1]
+        depth += 1
+    return depth
+
+
+def test_parse(article_path):
+    article = Article(filepath=article_path)
+    article.parse()
+    assert article.content["record_title"] == "Big news today"
+    assert [author["name"] for author in article.content["author_list"]] == ["Jane Doe"]
+    assert article.content["record_content"][0].startswith("This is the first paragraph")
+
+
+def test_uuid(article_path, article_html):
+    assert Article(filepath=str(article_path)).uuid == str(article_path)
+    assert Article(html=article_html).uuid is None
+    assert Article(html=article_html, uuid="a").uuid == "a"
+
+
+def test_html_str_is_never_filepath(article_path):
+    article = Article(html=str(article_path))
+    assert article.uuid is None
+    assert str(article_path) in article.soup.get_text()
+
+
+@pytest.mark.parametrize("source", ["filepath", "html", "soup"])
+def test_lazy_backup_loaded_once(article_path, article_html, monkeypatch, source):
+    calls = []
+    make_soup = articleparser.article.make_soup
+
+    def counting_make_soup(*args, **kwargs):
+        calls.append(args)
+        return make_soup(*args, **kwargs)
+
+    monkeypatch.setattr("articleparser.article.make_soup", counting_make_soup)
+    if source == "soup":
+        article = Article(soup=make_soup(article_path))
+    else:
+        article = Article(**{source: article_path if source == "filepath" else article_html})
+    article.parse()
+    assert len(calls) == (0 if source == "soup" else 1)
+
+    # the backup is an unmodified tree, independent of `soup`
+    backup = article.backup_soup
+    assert backup is not article.soup
+    assert backup.title.string == "Big news today | The Paper"
+    assert backup.find("script") is not None
+    backup.title.string = "Changed"
+    assert article.soup.title is None or article.soup.title.string != "Changed"
+    assert article.backup_soup is backup
+
+
+def test_budget_reject(article_html):
+    with pytest.raises(BudgetExceededError):
+        Article(html=article_html, config=_config(MAX_INPUT_BYTES=1000))
+
+
+def test_budget_truncate_keeps_head(article_html):
+    body_start = article_html.index("<body>")
+    config = _config(MAX_INPUT_BYTES=body_start + 400, budget_action="truncate")
+    article = Article(html=article_html, config=config)
+    article.parse()
+    assert article.methods["budget_exceeded"] == "MAX_INPUT_BYTES"
+    assert not article.metadata_only
+    assert article.content["record_title"] == "Big news today"
+    assert article.content["record_content"]
+
+
+def test_budget_truncate_in_head_is_metadata_only(article_html):
+    config = _config(MAX_INPUT_BYTES=article_html.index("<script"), budget_action="truncate")
+    article = Article(html=article_html, config=config)
+    article.parse()
+    assert article.metadata_only
+    assert article.content["record_title"] == "Big news today"
+    assert article.content["record_content"] is None
+
+
+def test_budget_truncate_to_nothing():
+    config = _config(MAX_INPUT_BYTES=0, budget_action="truncate")
+    article = Article(html=NESTED_HTML, config=config)
+    article.parse()
+    assert article.metadata_only
+    assert article.methods["budget_exceeded"] == "MAX_INPUT_BYTES"
+
+
+@pytest.mark.parametrize("budget_action", ["truncate", "metadata_only"])
+def test_budget_limits_kept_after_truncation(budget_action):
+    config = _config(MAX_INPUT_BYTES=30000, MAX_DEPTH=256, budget_action=budget_action)
+    article = Article(html=NESTED_HTML, config=config)
+    # <html> and <body> are above the <div> elements
+    assert _depth(article.soup) <= 256 + 3
+    assert article.methods["budget_exceeded"] == "MAX_INPUT_BYTES"
+
+
+def test_budget_truncate_max_nodes():
+    html = "<html><head><title>T</title></head><body>" + "<p>x</p>" * 100 + "</body></html>"
+    config = _config(MAX_NODES=50, budget_action="truncate")
+    article = Article(html=html, config=config)
+    assert len(article.soup.find_all("p")) < 50
+
+
+def test_deadline_in_article_text_keeps_partial_results(article_path, monkeypatch):
+    calls = []
+
+    def check_deadline(deadline, stage):
+        # the deadline passes after the first paragraph
+        if stage == "get_article_text":
+            calls.append(stage)
+            if len(calls) > 1:
+                raise DeadlineExceededError(stage)
+
+    monkeypatch.setattr("articleparser.extractor.check_deadline", check_deadline)
+    article = Article(filepath=article_path)
+    article.parse()
+    assert article.methods["timed_out"] == "get_article_text"
+    assert [author["name"] for author in article.content["author_list"]] == ["Jane Doe"]
+    assert len(article.content["record_content"]) == 1
+
+
+def test_metadata_only_same_short_fields():
+    full = Article(html=BODY_FIELDS_HTML)
+    full.parse()
+    article = Article(html=BODY_FIELDS_HTML, config=_config(metadata_only=True))
+    article.parse()
+    assert article.content["record_title"] == "The headline of the article"
+    assert article.content["record_published_isotimestamp"].startswith("2020-01-02")
+    for key in [
+        "record_url",
+        "record_title",
+        "record_published_isotimestamp",
+        "record_modified_isotimestamp",
+        "record_language",
+        "site",
+    ]:
+        assert article.content[key] == full.content[key], key
+        assert article.methods.get(key) == full.methods.get(key), key
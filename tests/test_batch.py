@@ -0,0 +1,104 @@
+import os
+import threading
+import time
+
+import pytest
+
+from articleparser.batch import _get_worker_context, parse_many, parse_one
+
+
+def test_parse_one(article_path, article_html):
+    record = parse_one(article_path)
+    assert record["uuid"] == str(article_path)
+    assert record["error"] is None
+    assert record["content"]["record_title"] == "Big news today"
+    assert parse_one(article_html)["content"] == record["content"]
+    assert parse_one(article_html)["uuid"] is None
+    assert parse_one(("a", article_html.encode("utf-8")))["uuid"] == "a"
+
+
+def test_parse_one_error(tmp_path):
+    record = parse_one(tmp_path / "missing.html")
+    assert record["content"] is None
+    assert record["error"]["type"] == "FileNotFoundError"
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+@pytest.mark.parametrize("ordered", [True, False])
+def test_parse_many(article_path, tmp_path, workers, ordered):
+    inputs = [article_path, tmp_path / "missing.html", ("c", "<p>Text</p>")] * 3
+    records = list(parse_many(inputs, workers=workers, ordered=ordered))
+    if ordered:
+        assert [record["index"] for record in records] == list(range(9))
+    records.sort(key=lambda record: record["index"])
+    assert [record["uuid"] for record in records] == [
+        str(article_path),
+        str(tmp_path / "missing.html"),
+        "c",
+    ] * 3
+    assert [record["error"] is None for record in records] == [True, False, True] * 3
+
+
+def test_parse_many_str_is_document(article_path):
+    # strings are documents, even if they look like filepaths
+    records = list(parse_many([str(article_path), article_path], workers=1))
+    assert [record["uuid"] for record in records] == [None, str(article_path)]
+    assert records[0]["content"]["record_title"] != "Big news today"
+    assert records[1]["content"]["record_title"] == "Big news today"
+
+
+def test_parse_many_supervised(article_path):
+    inputs = [article_path] * 4
+    records = list(parse_many(inputs, workers=2, task_timeout=60.0, max_tasks_per_child=1))
+    assert [record["index"] for record in records] == list(range(4))
+    assert all(record["error"] is None for record in records)
+
+
+def test_parse_many_supervised_while_inputs_block(article_path):
+    # records are yielded, and timeouts enforced, while reading blocks
+    resume = threading.Event()
+    timer = threading.Timer(30.0, resume.set)
+    timer.start()
+
+    def inputs():
+        yield article_path
+        resume.wait()
+        yield article_path
+
+    start = time.monotonic()
+    records = parse_many(inputs(), workers=2, task_timeout=60.0)
+    try:
+        assert next(records)["index"] == 0
+        assert time.monotonic() - start < 20.0
+        resume.set()
+        assert [record["index"] for record in records] == [1]
+    finally:
+        timer.cancel()
+
+
+def test_parse_many_supervised_inputs_error(article_path):
+    def inputs():
+        yield article_path
+        raise OSError("Read failed.")
+
+    records = parse_many(inputs(), workers=2, task_timeout=60.0)
+    assert next(records)["index"] == 0
+    with pytest.raises(OSError):
+        next(records)
+
+
+def test_supervised_workers_not_forked():
+    # workers are started while the input reader thread runs
+    assert _get_worker_context().get_start_method() != "fork"
+
+
+@pytest.mark.skipif(not hasattr(os, "mkfifo"), reason="requires named pipes")
+def test_parse_many_supervised_timeout_with_max_rss(article_path, tmp_path):
+    # opening a named pipe without a writer blocks the worker
+    fifo = tmp_path / "stuck.html"
+    os.mkfifo(fifo)
+    records = list(
+        parse_many([fifo, article_path], workers=2, task_timeout=1.0, max_rss=1 << 40)
+    )
+    assert records[0]["error"]["type"] == "WorkerTimeout"
+    assert records[1]["error"] is None
@@ -0,0 +1,117 @@
+import os
+
+import pytest
+
+from articleparser.article import Article
+from articleparser.cache import (
+    ResultCache,
+    config_fingerprint,
+    hash_source,
+    make_cache_key,
+)
+from articleparser.config import Config
+from articleparser.exceptions import BudgetExceededError
+
+
+def _cached_config(path, **settings):
+    config = Config()
+    config.cache_path = str(path)
+    for key, value in settings.items():
+        setattr(config, key, value)
+    return config
+
+
+def test_fingerprint_ignores_timeout():
+    config = Config()
+    other = Config()
+    other.timeout = 1.5
+    assert config_fingerprint(other) == config_fingerprint(config)
+    other.parser = "lxml"
+    assert config_fingerprint(other) != config_fingerprint(config)
+
+
+def test_hash_source(article_path, article_html):
+    assert hash_source(article_path) != hash_source(str(article_path))
+    assert hash_source(article_path) == hash_source(article_html.encode("utf-8"))
+    assert hash_source(article_html) == hash_source(article_html.encode("utf-8"))
+    assert hash_source("<p>a</p>") != hash_source("<p>b</p>")
+
+
+def test_make_cache_key():
+    config = Config()
+    key = make_cache_key("a", config)
+    assert make_cache_key("a", Config()) == key
+    assert make_cache_key("b", config) != key
+    assert make_cache_key("a", config, encoding="latin-1") != key
+
+
+def test_put_get(tmp_path):
+    with ResultCache(tmp_path / "cache.db") as cache:
+        assert cache.get("k") is None
+        cache.put("k", {"record_title": "T"}, {"record_title": "title"})
+        assert cache.get("k") == ({"record_title": "T"}, {"record_title": "title"})
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+        assert cache.stats()["entries"] == 1
+        cache.clear()
+        assert cache.get("k") is None
+
+
+def test_eviction(tmp_path):
+    with ResultCache(tmp_path / "cache.db", max_bytes=64 * 1024) as cache:
+        for i in range(200):
+            # incompressible, so that results take space
+            cache.put(str(i), {"record_content": [os.urandom(1000).hex()]}, {})
+        stats = cache.stats()
+        assert stats["evictions"] > 0
+        assert stats["bytes"] <= 64 * 1024
+        assert stats["entries"] < 200
+
+
+def test_article_uses_cache(tmp_path, article_path):
+    config = _cached_config(tmp_path / "cache.db")
+    article = Article(filepath=article_path, config=config)
+    assert not article.from_cache
+    article.parse()
+
+    cached = Article(filepath=article_path, config=config)
+    assert cached.from_cache
+    assert cached.soup is None
+    assert Article(filepath=article_path, config=config, lazy_backup=False)._backup_soup is None
+    cached.parse()
+    assert cached.content == article.content
+    assert cached.methods == article.methods
+
+    # a setting changing results misses the cache; a timeout does not
+    config = _cached_config(tmp_path / "cache.db", metadata_only=True)
+    assert not Article(filepath=article_path, config=config).from_cache
+    config = _cached_config(tmp_path / "cache.db", timeout=30.0)
+    assert Article(filepath=article_path, config=config).from_cache
+
+
+def test_article_stream_read_within_budget(tmp_path, article_html):
+    class Stream(object):
+        # A non-seekable binary stream recording the sizes read.
+        def __init__(self, data):
+            self.data = data
+            self.sizes = []
+
+        def read(self, size=-1):
+            self.sizes.append(size)
+            return self.data if size < 0 else self.data[:size]
+
+        def seekable(self):
+            return False
+
+    stream = Stream(article_html.encode("utf-8"))
+    config = _cached_config(tmp_path / "cache.db", MAX_INPUT_BYTES=1500)
+    with pytest.raises(BudgetExceededError):
+        Article(html=stream, config=config)
+    assert stream.sizes == [1501]
+
+    config = _cached_config(tmp_path / "cache.db", MAX_INPUT_BYTES=1500, budget_action="truncate")
+    article = Article(html=Stream(article_html.encode("utf-8")), config=config)
+    article.parse()
+    assert article.methods["budget_exceeded"] == "MAX_INPUT_BYTES"
+    # oversized documents are not cached
+    assert not Article(html=Stream(article_html.encode("utf-8")), config=config).from_cache
@@ -0,0 +1,129 @@
+import json
+from pathlib import Path
+import subprocess
+import sys
+
+import pytest
+
+from articleparser.cli import iter_filepaths, main
+
+ROOT = Path(__file__).parent.parent
+
+
+def _read_records(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def _run(args, stdin):
+    process = subprocess.run(
+        [sys.executable, "-m", "articleparser"] + args,
+        input=stdin,
+        stdout=subprocess.PIPE,
+        cwd=ROOT,
+        timeout=120,
+    )
+    return process.returncode, [json.loads(line) for line in process.stdout.splitlines()]
+
+
+@pytest.fixture
+def corpus(tmp_path, article_html):
+    directory = tmp_path / "corpus"
+    (directory / "sub").mkdir(parents=True)
+    for name in ["a.html", "sub/b.html", "sub/c.txt"]:
+        (directory / name).write_text(article_html, encoding="utf-8")
+    return directory
+
+
+def test_iter_filepaths(corpus, tmp_path):
+    manifest = tmp_path / "manifest.txt"
+    manifest.write_text("# comment\nx.html\n\n", encoding="utf-8")
+    with open(manifest, encoding="utf-8") as f:
+        filepaths = list(iter_filepaths([str(corpus), str(corpus / "*.html")], f))
+    assert filepaths == [
+        str(corpus / "a.html"),
+        str(corpus / "sub" / "b.html"),
+        str(corpus / "a.html"),
+        "x.html",
+    ]
+
+
+def test_paths(corpus, tmp_path):
+    output = tmp_path / "out.jsonl"
+    assert main(["-q", "-j", "1", "--ordered", "-o", str(output), str(corpus)]) == 0
+    records = _read_records(output)
+    assert [record["uuid"] for record in records] == [
+        str(corpus / "a.html"),
+        str(corpus / "sub" / "b.html"),
+    ]
+    assert all(record["content"]["record_title"] == "Big news today" for record in records)
+
+
+def test_no_documents():
+    assert main([]) == 2
+
+
+def test_journal_skips_completed(corpus, tmp_path):
+    output = tmp_path / "out.jsonl"
+    args = ["-q", "-j", "1", "-o", str(output), "--journal", str(tmp_path / "out.journal")]
+    assert main(args + [str(corpus / "a.html")]) == 0
+    assert main(args + [str(corpus)]) == 0
+    assert [record["uuid"] for record in _read_records(output)] == [
+        str(corpus / "a.html"),
+        str(corpus / "sub" / "b.html"),
+    ]
+
+
+def test_shards(corpus, tmp_path):
+    uuids = []
+    for i in range(3):
+        output = tmp_path / "out-{}.jsonl".format(i)
+        args = ["-q", "-j", "1", "--shard", "{}/3".format(i), "-o", str(output)]
+        assert main(args + [str(corpus)]) == 0
+        # no output file is created for an empty shard
+        if output.exists():
+            uuids += [record["uuid"] for record in _read_records(output)]
+    assert sorted(uuids) == [str(corpus / "a.html"), str(corpus / "sub" / "b.html")]
+
+
+def test_queue_with_parquet_output(tmp_path, article_path):
+    with pytest.raises(SystemExit) as excinfo:
+        main(
+            [
+                "--queue",
+                str(tmp_path / "spool"),
+                "-o",
+                str(tmp_path / "out.parquet"),
+                str(article_path),
+            ]
+        )
+    assert excinfo.value.code == 2
+    assert not (tmp_path / "spool").exists()
+
+
+def test_ndjson(article_path, article_html):
+    requests = [
+        {"html": article_html, "url": "https://example.com/a"},
+        {"path": str(article_path), "uuid": "b"},
+        # a document, although it looks like a filepath
+        {"html": "page.html", "uuid": "c"},
+        {"html": "<p>x</p>", "path": "x.html"},
+        "not an object",
+    ]
+    stdin = "".join(json.dumps(request) + "\n" for request in requests) + "{broken\n"
+    status, records = _run(["--ndjson", "-j", "1", "-q"], stdin.encode("utf-8"))
+    assert status == 0
+    assert [(record["uuid"], record["url"]) for record in records[:3]] == [
+        ("https://example.com/a", "https://example.com/a"),
+        ("b", None),
+        ("c", None),
+    ]
+    assert records[0]["content"]["record_title"] == "Big news today"
+    assert records[1]["content"]["record_title"] == "Big news today"
+    assert records[2]["error"] is None
+    assert [record["error"]["type"] for record in records[3:]] == ["RequestError"] * 3
+
+
+def test_ndjson_with_paths(article_path):
+    with pytest.raises(SystemExit):
+        main(["--ndjson", str(article_path)])
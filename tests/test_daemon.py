@@ -0,0 +1,97 @@
+import io
+import json
+import os
+from pathlib import Path
+import stat
+import subprocess
+import sys
+import time
+
+import pytest
+
+from articleparser.client import DaemonClient, main
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="requires Unix sockets")
+
+
+def _children(pid):
+    with open("/proc/{0}/task/{0}/children".format(pid)) as f:
+        return [int(child) for child in f.read().split()]
+
+
+@pytest.fixture
+def daemon(tmp_path):
+    socket_path = str(tmp_path / "daemon.sock")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "articleparser.daemon", "--socket", socket_path, "-j", "1"],
+        cwd=Path(__file__).parent.parent,
+    )
+    deadline = time.monotonic() + 60
+    while not os.path.exists(socket_path):
+        assert process.poll() is None and time.monotonic() < deadline
+        time.sleep(0.1)
+    yield process, socket_path
+    process.terminate()
+    process.wait(30)
+
+
+def test_socket_private(daemon):
+    _, socket_path = daemon
+    assert stat.S_IMODE(os.stat(socket_path).st_mode) == 0o600
+
+
+def test_parse(daemon, article_path):
+    _, socket_path = daemon
+    with DaemonClient(socket_path, timeout=30) as client:
+        record = client.parse(path=str(article_path))
+    assert record["uuid"] == str(article_path)
+    assert record["content"]["record_title"] == "Big news today"
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="requires /proc")
+def test_worker_killed(daemon, article_path):
+    process, socket_path = daemon
+    for pid in _children(process.pid):
+        os.kill(pid, 9)
+    time.sleep(0.5)
+    with DaemonClient(socket_path, timeout=30) as client:
+        records = [client.parse(path=str(article_path)) for _ in range(3)]
+    # documents parsed while the pool is found to be broken may fail
+    assert records[-1]["error"] is None
+    assert records[-1]["content"]["record_title"] == "Big news today"
+
+
+def test_pipelined_requests(daemon, article_html):
+    _, socket_path = daemon
+    with DaemonClient(socket_path, timeout=30) as client:
+        for i in range(5):
+            client.send(html=article_html, uuid=str(i))
+        records = [client.receive() for _ in range(5)]
+    assert [record["uuid"] for record in records] == [str(i) for i in range(5)]
+    assert all(record["content"]["record_title"] == "Big news today" for record in records)
+
+
+def test_malformed_request_closes_connection(daemon):
+    _, socket_path = daemon
+    with DaemonClient(socket_path, timeout=30) as client:
+        client.send(path="/missing.html")
+        # paths are made absolute by `send()`
+        client._socket.sendall(b'{"path": "relative.html"}\n')
+        assert client.receive()["error"]["type"] == "FileNotFoundError"
+        assert client.receive()["error"]["type"] == "ProtocolError"
+        with pytest.raises(ConnectionError):
+            client.receive()
+
+
+def test_client_main(daemon, article_path, monkeypatch, capsys):
+    _, socket_path = daemon
+    monkeypatch.setattr(sys, "stdin", io.TextIOWrapper(io.BytesIO(b"<p>Text</p>")))
+    status = main(["-s", socket_path, "--uuid", "stdin", str(article_path), "-"])
+    records = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert status == 0
+    assert [record["uuid"] for record in records] == [str(article_path), "stdin"]
+
+
+def test_client_main_without_daemon(tmp_path, capsys):
+    assert main(["-s", str(tmp_path / "missing.sock"), "page.html"]) == 1
+    assert "cannot connect" in capsys.readouterr().err
@@ -0,0 +1,87 @@
+import json
+from pathlib import Path
+import subprocess
+import sys
+
+import pytest
+
+from articleparser.journal import Journal
+from articleparser.sinks import JsonlSink
+
+# Writes records 0 to 299 with a journal, flushing every 50 records, and is
+# killed with SIGKILL after queueing record 129
+WRITER_SCRIPT = """
+import os, signal, sys
+from articleparser.journal import Journal
+from articleparser.sinks import JsonlSink
+
+output, journal = sys.argv[1:]
+sink = JsonlSink(output, journal=Journal(journal))
+for i in range(300):
+    sink.write({"uuid": str(i), "content": "x" * 1000})
+    if i % 50 == 49:
+        sink.flush()
+    if i == 129:
+        os.kill(os.getpid(), signal.SIGKILL)
+"""
+
+
+def _resume(output, journal_path, count):
+    with Journal(journal_path) as journal:
+        with JsonlSink(output, journal=journal) as sink:
+            for i in range(count):
+                if str(i) not in journal:
+                    sink.write({"uuid": str(i), "content": "x" * 1000})
+
+
+def _uuids(output):
+    with open(output, encoding="utf-8") as f:
+        return [json.loads(line)["uuid"] for line in f]
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="requires SIGKILL")
+def test_resume_after_kill(tmp_path):
+    output = tmp_path / "out.jsonl"
+    journal_path = tmp_path / "out.journal"
+    process = subprocess.run(
+        [sys.executable, "-c", WRITER_SCRIPT, str(output), str(journal_path)],
+        cwd=Path(__file__).parent.parent,
+    )
+    assert process.returncode == -9
+
+    journal = Journal(journal_path)
+    # records flushed before the kill are journaled
+    assert len(journal) >= 100
+    journal.close()
+
+    _resume(output, journal_path, 300)
+    assert _uuids(output) == [str(i) for i in range(300)]
+
+
+def test_resume_discards_unjournaled_records(tmp_path):
+    output = tmp_path / "out.jsonl"
+    journal_path = tmp_path / "out.journal"
+    _resume(output, journal_path, 10)
+    # a record written after the last journal entry, and a torn entry
+    with open(output, "a", encoding="utf-8") as f:
+        f.write('{"uuid": "10", "content": "partial"}\n{"uuid": "11", "con')
+    with open(journal_path, "a", encoding="utf-8") as f:
+        f.write('["10", 99')
+
+    journal = Journal(journal_path)
+    assert len(journal) == 10
+    assert "10" not in journal
+    journal.close()
+
+    _resume(output, journal_path, 12)
+    assert _uuids(output) == [str(i) for i in range(12)]
+
+
+def test_output_shorter_than_journal(tmp_path):
+    output = tmp_path / "out.jsonl"
+    journal_path = tmp_path / "out.journal"
+    _resume(output, journal_path, 3)
+    output.write_text("")
+    with Journal(journal_path) as journal:
+        with pytest.raises(ValueError):
+            JsonlSink(output, journal=journal)
@@ -0,0 +1,40 @@
+import pytest
+
+from articleparser.metadata import extract_metadata
+from articleparser.util import make_soup
+
+# OpenGraph images and videos, and JSON-LD in <body> and in a named graph
+EXTRA_HTML = """<!DOCTYPE html>
+<html><head>
+<meta property="og:image" content="https://example.com/a.jpg">
+<meta property="og:image:width" content="640">
+<meta property="og:image" content="/b.jpg">
+<meta property="og:video" content="https://example.com/v.mp4">
+<meta property="og:url" content="https://example.com/story">
+<meta property="article:author" content="Ann Other">
+<script type="APPLICATION/LD+JSON">{"@context": "https://schema.org", "@graph": [
+  {"@type": "WebPage", "name": "A page"},
+  {"@type": "NewsArticle", "headline": "A story", "image": ["https://example.com/c.jpg"]}
+]}</script>
+</head><body>
+<p>Text</p>
+<script type="application/ld+json">{"@type": "Person", "name": "Jo Bloggs"}</script>
+<script type="application/ld+json">not json</script>
+</body></html>
+"""
+
+
+@pytest.fixture(params=["article", "extra"])
+def document(request, article_html):
+    return article_html if request.param == "article" else EXTRA_HTML
+
+
+@pytest.mark.parametrize("parser", ["lxml", "html.parser"])
+def test_metadata_same_with_parsers(document, parser):
+    soup = make_soup(document)
+    assert extract_metadata(make_soup(document, parser=parser)) == extract_metadata(soup)
+
+
+def test_metadata_same_on_head_only_soup(document):
+    soup = make_soup(document)
+    assert extract_metadata(make_soup(document, head_only=True)) == extract_metadata(soup)
@@ -0,0 +1,208 @@
+import gzip
+import http.client
+import json
+import os
+import socket
+import threading
+
+import pytest
+
+from articleparser.server import CONFIG_OVERRIDES, ParseService, make_server
+
+
+@pytest.fixture
+def idle_service():
+    # A service accepting requests, without a dispatcher or workers, so
+    # that requests stay in their lanes
+    service = ParseService(workers=1, max_waiting={"interactive": 2, "backfill": 2})
+    service._running = True
+    return service
+
+
+def test_interactive_lane_first(idle_service):
+    backfill = idle_service.submit(b"<p>1</p>", "1", lane="backfill")
+    interactive = idle_service.submit(b"<p>2</p>", "2", lane="interactive")
+    assert idle_service._next_request() is interactive
+    assert idle_service._next_request() is backfill
+
+
+def test_full_lane_rejected(idle_service):
+    requests = [idle_service.submit(b"<p></p>", str(i), lane="backfill") for i in range(3)]
+    assert [request.done.is_set() for request in requests] == [False, False, True]
+    assert requests[2].status == 503
+    # the other lane is not full
+    assert not idle_service.submit(b"<p></p>", "x").done.is_set()
+
+
+def test_deadline_passed_while_waiting(idle_service):
+    late = idle_service.submit(b"<p></p>", "late", timeout=0.0)
+    waiting = idle_service.submit(b"<p></p>", "waiting", timeout=60.0)
+    assert idle_service._next_request() is waiting
+    assert late.status == 504
+    assert 'articleparser_requests_total{lane="interactive",status="504"} 1' in (
+        idle_service.metrics()
+    )
+
+
+def test_failed_restart_fails_request_only():
+    service = ParseService(workers=1)
+    service.start()
+    start_worker = service._start_worker
+    failures = [OSError("Starting failed.")]
+
+    def flaky_start_worker(warm_up=True):
+        if failures:
+            raise failures.pop()
+        return start_worker(warm_up)
+
+    service._start_worker = flaky_start_worker
+    try:
+        # the worker dies while idle, and its first restart fails
+        service._pool[0].process.kill()
+        service._pool[0].process.join()
+        first = service.submit(b"<p>1</p>", "1")
+        assert first.done.wait(30)
+        assert first.status == 500
+        second = service.submit(b"<p>2</p>", "2")
+        assert second.done.wait(30)
+        assert second.status == 200
+        assert second.record["uuid"] == "2"
+    finally:
+        service.stop()
+
+
+@pytest.mark.skipif(not hasattr(os, "mkfifo"), reason="requires named pipes")
+def test_overdue_worker_replaced(tmp_path, monkeypatch):
+    monkeypatch.setattr("articleparser.server.DEADLINE_GRACE", 0.5)
+    # opening a named pipe without a writer blocks the worker
+    fifo = tmp_path / "stuck.html"
+    os.mkfifo(fifo)
+    service = ParseService(workers=1)
+    service.start()
+    try:
+        stuck = service.submit(fifo, "stuck", timeout=0.5)
+        waiting = service.submit(b"<p>Text</p>", "waiting", timeout=60.0)
+        assert stuck.done.wait(30)
+        assert stuck.status == 504
+        # the only worker is free again
+        assert waiting.done.wait(30)
+        assert waiting.status == 200
+        metrics = service.metrics()
+        assert "articleparser_worker_restarts_total 1" in metrics
+        assert "articleparser_in_flight 0" in metrics
+    finally:
+        service.stop()
+
+
+def test_document_size_capped():
+    # a small compressed body must not be decompressed without bound
+    body = gzip.compress(b"<html><body><p>" + b"x" * (1 << 22) + b"</p></body></html>")
+    assert "MAX_INPUT_BYTES" not in CONFIG_OVERRIDES
+    service = ParseService(workers=1, max_document_bytes=1000)
+    service.start()
+    try:
+        for overrides in [None, {"MAX_INPUT_BYTES": 1 << 30}]:
+            request = service.submit(body, "bomb", overrides=overrides)
+            assert request.done.wait(30)
+            assert request.status == 200
+            assert request.record["error"]["type"] == "BudgetExceededError"
+        request = service.submit(body, "bomb", overrides={"budget_action": "truncate"})
+        assert request.done.wait(30)
+        assert request.record["error"] is None
+        assert request.record["methods"]["budget_exceeded"] == "MAX_INPUT_BYTES"
+    finally:
+        service.stop()
+
+
+def test_stop_rejects_waiting(idle_service):
+    request = idle_service.submit(b"<p></p>", "1")
+    idle_service.stop()
+    assert request.status == 503
+
+
+@pytest.fixture(scope="module")
+def server():
+    service = ParseService(workers=1, max_waiting={"backfill": 0})
+    service.start()
+    httpd = make_server(service, port=0)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+    service.stop()
+
+
+def _post(server, path, body, headers=None):
+    conn = http.client.HTTPConnection(*server.server_address[:2], timeout=30)
+    conn.request("POST", path, body=body, headers=headers or {})
+    response = conn.getresponse()
+    result = response.status, dict(response.getheaders()), json.loads(response.read())
+    conn.close()
+    return result
+
+
+def test_parse(server, article_html):
+    status, _, record = _post(server, "/parse?url=a", article_html.encode("utf-8"))
+    assert status == 200
+    assert record["uuid"] == "a"
+    assert record["content"]["record_title"] == "Big news today"
+    assert "queue" in record["timings"]
+
+
+def test_lane_full(server):
+    status, headers, _ = _post(server, "/parse?priority=backfill", b"<p></p>")
+    assert status == 503
+    assert headers["Retry-After"] == "1"
+
+
+def test_deadline(server):
+    status, _, _ = _post(server, "/parse?timeout=1e-9", b"<p></p>")
+    assert status == 504
+
+
+@pytest.mark.parametrize(
+    "path, status",
+    [
+        ("/other", 404),
+        ("/parse?priority=urgent", 400),
+        ("/parse?timeout=soon", 400),
+        ("/parse?timeout=inf", 400),
+        ("/parse?timeout=nan", 400),
+        ("/parse?timeout=-1", 400),
+        ("/parse?timeout=0", 400),
+    ],
+)
+def test_bad_requests(server, path, status):
+    assert _post(server, path, b"<p></p>")[0] == status
+
+
+def test_bad_request_closes_connection(server, article_html):
+    # the body of a rejected request must not be read as another request
+    body = b"GET /health HTTP/1.1\r\nHost: x\r\n\r\n"
+    with socket.create_connection(server.server_address[:2], timeout=30) as sock:
+        sock.sendall(
+            b"POST /other HTTP/1.1\r\nHost: x\r\nContent-Length: "
+            + str(len(body)).encode("ascii")
+            + b"\r\n\r\n"
+            + body
+        )
+        response = b""
+        while True:
+            data = sock.recv(65536)
+            if not data:
+                break
+            response += data
+    assert response.startswith(b"HTTP/1.1 404")
+    assert b"Connection: close" in response
+    assert response.count(b"HTTP/1.1") == 1
+
+
+def test_keep_alive(server):
+    conn = http.client.HTTPConnection(*server.server_address[:2], timeout=30)
+    for _ in range(2):
+        conn.request("POST", "/parse?url=a", body=b"<p>Text</p>")
+        response = conn.getresponse()
+        assert response.status == 200
+        json.loads(response.read())
+    conn.close()
@@ -0,0 +1,200 @@
+import gzip
+import json
+import sqlite3
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from articleparser.sinks import (
+    JsonlSink,
+    ParquetSink,
+    SqliteSink,
+    get_arrow_schema,
+    records_to_table,
+)
+
+
+def _read_jsonl(path):
+    opener = gzip.open if str(path).endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+class TestJsonlSink:
+    def test_write(self, tmp_path):
+        path = tmp_path / "out.jsonl.gz"
+        with JsonlSink(path) as sink:
+            for i in range(5):
+                sink.write({"uuid": str(i)})
+        assert sink.paths == [str(path)]
+        assert sink.records_written == 5
+        assert _read_jsonl(path) == [{"uuid": str(i)} for i in range(5)]
+
+    def test_rotate_records(self, tmp_path):
+        with JsonlSink(tmp_path / "out.jsonl.gz", rotate_records=2) as sink:
+            for i in range(5):
+                sink.write({"uuid": str(i)})
+        assert sink.paths == [str(tmp_path / "out-{:05d}.jsonl.gz".format(i)) for i in range(3)]
+        assert [[r["uuid"] for r in _read_jsonl(path)] for path in sink.paths] == [
+            ["0", "1"],
+            ["2", "3"],
+            ["4"],
+        ]
+
+    def test_rotate_bytes(self, tmp_path):
+        record = {"uuid": "x" * 10}
+        size = len(json.dumps(record)) + 1
+        with JsonlSink(tmp_path / "part-{index}.jsonl", rotate_bytes=2 * size) as sink:
+            for _ in range(5):
+                sink.write(record)
+        assert sink.paths == [str(tmp_path / "part-{}.jsonl".format(i)) for i in range(3)]
+        assert [len(_read_jsonl(path)) for path in sink.paths] == [2, 2, 1]
+
+    def test_rotate_stream(self, tmp_path):
+        with pytest.raises(ValueError):
+            JsonlSink(open(tmp_path / "out.jsonl", "w"), rotate_records=1)
+
+    def test_error_raised_by_write(self, tmp_path):
+        sink = JsonlSink(tmp_path / "out.jsonl")
+        sink.write({"uuid": object()})
+        with pytest.raises(TypeError):
+            sink.flush()
+        with pytest.raises(TypeError):
+            sink.close()
+
+
+def _record(uuid, title, authors, error=None):
+    return {
+        "uuid": uuid,
+        "content": {
+            "record_title": title,
+            "record_content": ["a", "b"],
+            "author_list": [{"name": name, "url": None, "image_url": None} for name in authors],
+            "record_keywords_list": ["news"],
+        },
+        "methods": {},
+        "error": error,
+        "timings": {},
+    }
+
+
+class TestSqliteSink:
+    def test_upsert(self, tmp_path):
+        path = tmp_path / "out.db"
+        with SqliteSink(path, batch_size=2) as sink:
+            sink.write(_record("a", "First", ["Ann", "Bob"]))
+            sink.write(_record("b", "Other", ["Cat"]))
+            sink.write(_record("a", "Second", ["Dan"]))
+        with SqliteSink(path) as sink:
+            sink.write(_record("b", "Again", []))
+
+        conn = sqlite3.connect(str(path))
+        assert conn.execute("SELECT uuid, record_title FROM records ORDER BY uuid").fetchall() == [
+            ("a", "Second"),
+            ("b", "Again"),
+        ]
+        assert conn.execute("SELECT uuid, position, name FROM authors ORDER BY uuid").fetchall() == [
+            ("a", 0, "Dan"),
+        ]
+        assert conn.execute("SELECT record_content FROM records WHERE uuid = 'a'").fetchone() == (
+            '["a", "b"]',
+        )
+        assert conn.execute("SELECT count(*) FROM keywords").fetchone() == (2,)
+        conn.close()
+
+    def test_error_record(self, tmp_path):
+        path = tmp_path / "out.db"
+        record = _record("a", None, [], error={"type": "ValueError", "message": "bad"})
+        record["content"] = None
+        with SqliteSink(path) as sink:
+            sink.write(record)
+        conn = sqlite3.connect(str(path))
+        assert conn.execute("SELECT error_type, error_message FROM records").fetchall() == [
+            ("ValueError", "bad"),
+        ]
+        conn.close()
+
+    def test_record_without_key(self, tmp_path):
+        with SqliteSink(tmp_path / "out.db") as sink:
+            with pytest.raises(ValueError):
+                sink.write(_record(None, "Title", []))
+
+    def test_invalid_record_rejected_by_write(self, tmp_path):
+        path = tmp_path / "out.db"
+        invalid = _record("b", "Title", [])
+        invalid["content"]["author_list"] = ["Ann"]
+        with SqliteSink(path, batch_size=1) as sink:
+            sink.write(_record("a", "First", ["Ann"]))
+            with pytest.raises(ValueError):
+                sink.write(invalid)
+            sink.write(_record("c", "Third", ["Bob"]))
+        conn = sqlite3.connect(str(path))
+        assert conn.execute("SELECT uuid FROM records ORDER BY uuid").fetchall() == [("a",), ("c",)]
+        conn.close()
+
+
+class TestParquetSink:
+    def test_round_trip(self, tmp_path):
+        pa = pytest.importorskip("pyarrow")
+        import pyarrow.parquet
+
+        path = tmp_path / "out.parquet"
+        records = [
+            _record("a", "First", ["Ann", "Bob"]),
+            _record("b", None, [], error={"type": "ValueError", "message": "bad"}),
+            {"uuid": "c", "content": {"record_content": "text", "author_list": [{"name": "Cat"}]}},
+        ]
+        records[1]["content"] = None
+        with ParquetSink(path, row_group_size=2) as sink:
+            for record in records:
+                sink.write(record)
+        assert sink.records_written == 3
+
+        table = pyarrow.parquet.read_table(str(path))
+        assert table.schema.equals(get_arrow_schema())
+        assert table.schema.field("author_list").type == pa.list_(
+            pa.struct([("name", pa.string()), ("url", pa.string()), ("image_url", pa.string())])
+        )
+        assert table.schema.field("record_content").type == pa.list_(pa.string())
+        assert table.equals(records_to_table(records))
+
+        rows = table.to_pylist()
+        assert [row["uuid"] for row in rows] == ["a", "b", "c"]
+        assert rows[0]["record_title"] == "First"
+        assert [author["name"] for author in rows[0]["author_list"]] == ["Ann", "Bob"]
+        assert rows[0]["record_keywords_list"] == ["news"]
+        # missing fields are null
+        assert rows[0]["record_images_list"] is None
+        assert rows[0]["error_type"] is None
+        assert rows[1]["record_title"] is None
+        assert rows[1]["author_list"] is None
+        assert (rows[1]["error_type"], rows[1]["error_message"]) == ("ValueError", "bad")
+        # a single string where a list is expected, and a struct missing fields
+        assert rows[2]["record_content"] == ["text"]
+        assert rows[2]["author_list"] == [{"name": "Cat", "url": None, "image_url": None}]
+
+    def test_write_after_close(self, tmp_path):
+        pytest.importorskip("pyarrow")
+        sink = ParquetSink(tmp_path / "out.parquet")
+        sink.close()
+        with pytest.raises(ValueError):
+            sink.write(_record("a", "First", []))
+
+
+def test_cli_skips_records_without_key(tmp_path, article_path):
+    path = tmp_path / "out.db"
+    lines = ["not json", json.dumps({"path": str(article_path), "uuid": "a"})]
+    result = subprocess.run(
+        [sys.executable, "-m", "articleparser", "--ndjson", "-o", str(path), "-j", "1"],
+        input="\n".join(lines) + "\n",
+        capture_output=True,
+        text=True,
+        cwd=Path(__file__).parent.parent,
+    )
+    assert result.returncode == 0, result.stderr
+    assert "Skipping record" in result.stderr
+    conn = sqlite3.connect(str(path))
+    assert conn.execute("SELECT uuid FROM records").fetchall() == [("a",)]
+    conn.close()
@@ -0,0 +1,245 @@
+import bz2
+import gzip
+import io
+import lzma
+
+import pytest
+
+from articleparser.exceptions import BudgetExceededError
+from articleparser.util import (
+    check_document_size,
+    check_soup_structure,
+    decode_html,
+    extract_head,
+    make_soup,
+    read_html,
+    remove_tags_in_head,
+)
+
+
+class TestDecodeHtml:
+    def test_utf8_by_default(self):
+        assert decode_html("<p>café</p>".encode("utf-8")) == "<p>café</p>"
+
+    def test_byte_order_mark_wins(self):
+        data = b"\xff\xfe" + '<meta charset="latin-1"><p>é</p>'.encode("utf-16-le")
+        assert decode_html(data, encoding="ascii") == '<meta charset="latin-1"><p>é</p>'
+
+    def test_encoding_given(self):
+        assert decode_html("<p>é</p>".encode("latin-1"), encoding="latin-1") == "<p>é</p>"
+
+    def test_meta_charset(self):
+        doc = '<meta charset="shift_jis"><p>日本</p>'
+        assert decode_html(doc.encode("shift_jis")) == doc
+
+    def test_meta_http_equiv(self):
+        doc = '<meta http-equiv="Content-Type" content="text/html; charset=koi8-r"><p>да</p>'
+        assert decode_html(doc.encode("koi8-r")) == doc
+
+    def test_meta_utf16_taken_as_utf8(self):
+        doc = '<meta charset="utf-16"><p>é</p>'
+        assert decode_html(doc.encode("utf-8")) == doc
+
+    def test_invalid_utf8_falls_back_to_windows_1252(self):
+        assert decode_html("<p>“é”</p>".encode("windows-1252")) == "<p>“é”</p>"
+
+    def test_memoryview(self):
+        assert decode_html(memoryview(b"<p>x</p>")) == "<p>x</p>"
+
+
+class TestRemoveTagsInHead:
+    def test_removes_tags_in_head_only(self):
+        doc = (
+            "<html><head><title>T</title><iframe src='a'></iframe>"
+            "<noscript><img src='b'></noscript></head>"
+            "<body><iframe src='c'></iframe><noscript>d</noscript></body></html>"
+        )
+        assert remove_tags_in_head(doc, ["iframe", "noscript"]) == (
+            "<html><head><title>T</title></head>"
+            "<body><iframe src='c'></iframe><noscript>d</noscript></body></html>"
+        )
+
+    def test_case_insensitive(self):
+        doc = "<HTML><HEAD><IFRAME src='a'></IFRAME><Title>T</Title></HEAD><BODY></BODY>"
+        assert remove_tags_in_head(doc, ["iframe"]) == (
+            "<HTML><HEAD><Title>T</Title></HEAD><BODY></BODY>"
+        )
+
+    def test_markup_in_script_and_comments_is_not_a_tag(self):
+        doc = (
+            "<head><script>var s = '<iframe></head>';</script>"
+            "<!-- <iframe> --><iframe></iframe><title>T</title></head><body></body>"
+        )
+        assert remove_tags_in_head(doc, ["iframe"]) == (
+            "<head><script>var s = '<iframe></head>';</script>"
+            "<!-- <iframe> --><title>T</title></head><body></body>"
+        )
+
+    def test_stops_at_body_without_head_end(self):
+        doc = "<head><title>T</title><body><iframe></iframe></body>"
+        assert remove_tags_in_head(doc, ["iframe"]) == doc
+
+    def test_stops_at_body_content_without_head_end_and_body(self):
+        doc = (
+            "<html><head><title>t</title><iframe src='a'></iframe>"
+            "<p>Body <iframe src='b'></iframe> more</p><noscript>c</noscript></html>"
+        )
+        assert remove_tags_in_head(doc, ["iframe", "noscript"]) == (
+            "<html><head><title>t</title>"
+            "<p>Body <iframe src='b'></iframe> more</p><noscript>c</noscript></html>"
+        )
+
+    def test_markup_in_title_is_not_a_tag(self):
+        doc = "<head><title>a <b> c</title><iframe></iframe></head>"
+        assert remove_tags_in_head(doc, ["iframe"]) == "<head><title>a <b> c</title></head>"
+
+    def test_no_tag_names(self):
+        doc = "<head><iframe></iframe></head>"
+        assert remove_tags_in_head(doc, []) == doc
+
+    def test_unsupported_tag_name(self):
+        with pytest.raises(ValueError):
+            remove_tags_in_head("<head></head>", ["div"])
+
+
+class TestCheckSoupStructure:
+    DOC = "<html><head><title>T</title></head><body><p>x</p></body></html>"
+
+    def test_trailing_comment(self):
+        doc = self.DOC + "\n<!-- cached page -->\n"
+        assert check_soup_structure(make_soup(doc, parser="lxml"), doc)
+        assert make_soup(doc, parser="adaptive").builder.NAME == "lxml"
+
+    def test_trailing_markup(self):
+        doc = self.DOC + "<!-- x --><p>after</p>"
+        assert not check_soup_structure(make_soup(doc, parser="lxml"), doc)
+        assert make_soup(doc, parser="adaptive").builder.NAME == "html5lib"
+
+
+class TestReadHtml:
+    def test_str_is_document(self, article_path):
+        assert read_html("no tags here") == "no tags here"
+        assert read_html("<p>page.html</p>") == "<p>page.html</p>"
+        # strings are never read as filepaths
+        assert read_html(str(article_path)) == str(article_path)
+        assert read_html("missing.html.gz") == "missing.html.gz"
+
+    def test_make_soup_reads_path(self, article_path):
+        assert make_soup(article_path).title.string == "Big news today | The Paper"
+        with pytest.raises(FileNotFoundError):
+            make_soup(article_path.with_name("missing.html.gz"))
+
+    def test_path_is_filepath(self, article_path, article_html):
+        assert read_html(article_path) == article_html
+
+    def test_path_of_wrong_suffix(self, tmp_path):
+        with pytest.raises(ValueError):
+            read_html(tmp_path / "a.txt")
+
+    def test_max_bytes(self):
+        with pytest.raises(BudgetExceededError) as excinfo:
+            read_html(b"<p>0123456789</p>", max_bytes=5)
+        assert excinfo.value.budget == "MAX_INPUT_BYTES"
+        assert excinfo.value.html_doc == "<p>01"
+
+
+COMPRESSIONS = [(".gz", gzip), (".bz2", bz2), (".xz", lzma)]
+
+
+class TestReadCompressedHtml:
+    DOC = "<html><head><title>Caf\u00e9</title></head><body><p>x</p></body></html>"
+
+    @pytest.mark.parametrize("suffix, module", COMPRESSIONS)
+    def test_filepath_by_suffix(self, tmp_path, suffix, module):
+        filepath = tmp_path / ("page.html" + suffix)
+        filepath.write_bytes(module.compress(self.DOC.encode("utf-8")))
+        assert read_html(filepath) == self.DOC
+
+    @pytest.mark.parametrize("suffix, module", COMPRESSIONS)
+    def test_filepath_by_magic_bytes(self, tmp_path, suffix, module):
+        filepath = tmp_path / "page.html"
+        filepath.write_bytes(module.compress(self.DOC.encode("utf-8")))
+        assert read_html(filepath) == self.DOC
+
+    @pytest.mark.parametrize("suffix, module", COMPRESSIONS)
+    @pytest.mark.parametrize("wrap", [bytes, bytearray, memoryview, io.BytesIO])
+    def test_in_memory(self, suffix, module, wrap):
+        data = module.compress(self.DOC.encode("utf-8"))
+        assert read_html(wrap(data)) == self.DOC
+        assert read_html(wrap(data), max_bytes=len(self.DOC) + 10) == self.DOC
+
+    @pytest.mark.parametrize("suffix, module", COMPRESSIONS)
+    def test_max_bytes(self, tmp_path, suffix, module):
+        data = module.compress(self.DOC.encode("utf-8") * 1000)
+        filepath = tmp_path / ("page.html" + suffix)
+        filepath.write_bytes(data)
+        for source in [data, io.BytesIO(data), filepath]:
+            with pytest.raises(BudgetExceededError) as excinfo:
+                read_html(source, max_bytes=20)
+            assert excinfo.value.html_doc == self.DOC[:20]
+
+    @pytest.mark.parametrize("suffix, module", COMPRESSIONS)
+    @pytest.mark.parametrize("max_bytes", [None, 100000])
+    def test_truncated_or_corrupt(self, tmp_path, suffix, module, max_bytes):
+        data = module.compress(self.DOC.encode("utf-8"))
+        filepath = tmp_path / ("page.html" + suffix)
+        for corrupt in [data[: len(data) // 2], data[:6] + b"\x00" * 40]:
+            filepath.write_bytes(corrupt)
+            for source in [corrupt, io.BytesIO(corrupt), filepath]:
+                with pytest.raises(ValueError, match="Corrupt"):
+                    read_html(source, max_bytes=max_bytes)
+
+
+class TestCheckDocumentSize:
+    def test_max_nodes(self):
+        doc = "<p>a</p><p>b</p><p>c</p>"
+        check_document_size(doc, max_nodes=3)
+        with pytest.raises(BudgetExceededError) as excinfo:
+            check_document_size(doc, max_nodes=2)
+        assert excinfo.value.position == doc.index("<p>c")
+
+    def test_max_depth(self):
+        doc = "<div><div><div>x</div></div></div>"
+        check_document_size(doc, max_depth=3)
+        with pytest.raises(BudgetExceededError) as excinfo:
+            check_document_size(doc, max_depth=2)
+        assert excinfo.value.position == doc.index("<div>x")
+
+
+class TestExtractHead:
+    HEAD = '<html><head><title>T</title><meta name="a" content="b"></head>'
+    BODY = (
+        "<body><p>text</p>"
+        '<script type="application/ld+json">{"@type": "NewsArticle"}</script>'
+        "<H1>The <em>headline</em></H1>"
+        '<span itemprop="datePublished">2020-01-02</span>'
+        '<meta itemprop="dateModified" content="2020-01-03"/>'
+        '<div><section itemprop="headline">A <section>nested</section></section></div>'
+        "<p>more text</p></body></html>"
+    )
+
+    def test_head_only(self):
+        doc = self.HEAD + self.BODY
+        assert extract_head(doc, json_ld_in_body=False, short_fields_in_body=False) == (
+            self.HEAD[: -len("</head>")] + "</head><body></body></html>"
+        )
+
+    def test_body_fields_kept(self):
+        # titles and timestamps in <body> are needed for the same results
+        # as a full parse
+        head = extract_head(self.HEAD + self.BODY)
+        assert head == (
+            self.HEAD[: -len("</head>")]
+            + '<script type="application/ld+json">{"@type": "NewsArticle"}</script>'
+            + "</head><body>"
+            + "<H1>The <em>headline</em></H1>"
+            + '<span itemprop="datePublished">2020-01-02</span>'
+            + '<meta itemprop="dateModified" content="2020-01-03"/>'
+            + '<section itemprop="headline">A <section>nested</section>'
+            + "</body></html>"
+        )
+        assert "text" not in head
+
+    def test_unclosed_body_field(self):
+        doc = self.HEAD + "<body><h1>Headline<p>text</p></body></html>"
+        assert extract_head(doc).endswith("</head><body></body></html>")
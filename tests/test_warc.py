@@ -0,0 +1,106 @@
+import gzip
+import io
+
+import pytest
+
+from articleparser.warc import iter_records, parse_records
+
+HTML = b"<html><head><title>Archived</title></head><body><p>Text</p></body></html>"
+
+
+def _warc_record(record_type, uri, content_type, block):
+    headers = [
+        b"WARC/1.0",
+        b"WARC-Type: " + record_type,
+        b"WARC-Target-URI: <" + uri + b">",
+        b"Content-Type: " + content_type,
+        b"Content-Length: " + str(len(block)).encode(),
+    ]
+    return b"\r\n".join(headers) + b"\r\n\r\n" + block + b"\r\n\r\n"
+
+
+def _http_response(content_type, body, chunked=False):
+    headers = [b"HTTP/1.1 200 OK", b"Content-Type: " + content_type]
+    if chunked:
+        headers.append(b"Transfer-Encoding: chunked")
+        body = b"%x\r\n%s\r\n0\r\n\r\n" % (len(body), body)
+    return b"\r\n".join(headers) + b"\r\n\r\n" + body
+
+
+WARC_RECORDS = [
+    _warc_record(b"warcinfo", b"", b"application/warc-fields", b"software: test\r\n"),
+    _warc_record(
+        b"response",
+        b"https://example.com/a",
+        b"application/http; msgtype=response",
+        _http_response(b"text/html; charset=utf-8", HTML, chunked=True),
+    ),
+    _warc_record(
+        b"response",
+        b"https://example.com/b.png",
+        b"application/http; msgtype=response",
+        _http_response(b"image/png", b"\x89PNG" * 100),
+    ),
+    _warc_record(b"resource", b"https://example.com/c", b"text/html", HTML),
+]
+
+
+@pytest.mark.parametrize("compression", [None, "whole", "record"])
+def test_iter_warc_records(compression):
+    if compression == "whole":
+        data = gzip.compress(b"".join(WARC_RECORDS))
+    elif compression == "record":
+        data = b"".join(gzip.compress(record) for record in WARC_RECORDS)
+    else:
+        data = b"".join(WARC_RECORDS)
+    records = list(iter_records(io.BytesIO(data)))
+    assert [record.uri for record in records] == ["https://example.com/a", "https://example.com/c"]
+    assert [record.payload for record in records] == [HTML, HTML]
+    assert records[0].encoding == "utf-8"
+
+
+def test_iter_warc_records_not_html_only(tmp_path):
+    path = tmp_path / "archive.warc"
+    path.write_bytes(b"".join(WARC_RECORDS))
+    records = list(iter_records(path, html_only=False))
+    assert [record.record_type for record in records] == [
+        "warcinfo",
+        "response",
+        "response",
+        "resource",
+    ]
+    assert records[0].payload is None
+    assert records[2].content_type == "image/png"
+    assert records[2].payload == b"\x89PNG" * 100
+
+
+def test_iter_arc_records():
+    version_block = b"1 0 test\nURL IP-address Archive-date Content-type Archive-length\n"
+    data = b"filedesc://test.arc 0.0.0.0 20200101000000 text/plain %d\n%s\n" % (
+        len(version_block),
+        version_block,
+    )
+    for uri, content_type, body in [
+        (b"https://example.com/a", b"text/html", HTML),
+        (b"https://example.com/b.png", b"image/png", b"\x89PNG"),
+    ]:
+        block = _http_response(content_type, body)
+        data += b"%s 0.0.0.0 20200101000000 %s %d\n%s\n" % (uri, content_type, len(block), block)
+    records = list(iter_records(io.BytesIO(data)))
+    assert [(record.uri, record.payload) for record in records] == [
+        ("https://example.com/a", HTML)
+    ]
+
+
+def test_unrecognized_format():
+    with pytest.raises(ValueError):
+        list(iter_records(io.BytesIO(b"<html></html>")))
+
+
+def test_parse_records():
+    articles = list(parse_records(io.BytesIO(b"".join(WARC_RECORDS))))
+    assert [article.uuid for article in articles] == [
+        "https://example.com/a",
+        "https://example.com/c",
+    ]
+    assert all(article.content["record_title"] == "Archived" for article in articles)
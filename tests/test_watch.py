@@ -0,0 +1,131 @@
+import queue
+import threading
+
+import pytest
+
+from articleparser.watch import (
+    PROCESSED_SUFFIX,
+    DirectoryWatcher,
+    ProcessedMarker,
+    inotify_available,
+    mark_processed,
+)
+
+USE_INOTIFY = [
+    False,
+    pytest.param(
+        True, marks=pytest.mark.skipif(not inotify_available(), reason="requires inotify")
+    ),
+]
+
+
+def _watch(watcher):
+    # Iterates over `watcher` in a thread, returning a queue of the filepaths.
+    filepaths = queue.Queue()
+
+    def run():
+        for filepath in watcher:
+            filepaths.put(filepath)
+        filepaths.put(None)
+
+    threading.Thread(target=run, daemon=True).start()
+    return filepaths
+
+
+def test_not_a_directory(tmp_path):
+    with pytest.raises(NotADirectoryError):
+        DirectoryWatcher(tmp_path / "missing", use_inotify=False)
+
+
+@pytest.mark.parametrize("use_inotify", USE_INOTIFY)
+def test_directory_watcher(tmp_path, use_inotify):
+    (tmp_path / "b.html").write_text("<p>b</p>")
+    (tmp_path / "a.html").write_text("<p>a</p>")
+    (tmp_path / "ignored.txt").write_text("text")
+    (tmp_path / ".hidden.html").write_text("<p>hidden</p>")
+    watcher = DirectoryWatcher(
+        tmp_path, use_inotify=use_inotify, poll_interval=0.05, settle_seconds=0.0
+    )
+    assert watcher.use_inotify == use_inotify
+    filepaths = _watch(watcher)
+    try:
+        assert filepaths.get(timeout=10.0) == str(tmp_path / "a.html")
+        assert filepaths.get(timeout=10.0) == str(tmp_path / "b.html")
+        (tmp_path / "ignored.txt.part").write_text("text")
+        (tmp_path / "c.html").write_text("<p>c</p>")
+        assert filepaths.get(timeout=10.0) == str(tmp_path / "c.html")
+    finally:
+        watcher.close()
+    assert filepaths.get(timeout=10.0) is None
+    assert filepaths.empty()
+
+
+def test_directory_watcher_suffixes(tmp_path):
+    (tmp_path / "a.html").write_text("<p>a</p>")
+    (tmp_path / "b.html.gz").write_bytes(b"")
+    watcher = DirectoryWatcher(
+        tmp_path, suffixes=(".gz",), use_inotify=False, poll_interval=0.05, settle_seconds=0.0
+    )
+    filepaths = _watch(watcher)
+    assert filepaths.get(timeout=10.0) == str(tmp_path / "b.html.gz")
+    watcher.close()
+    assert filepaths.get(timeout=10.0) is None
+
+
+def test_directory_watcher_waits_for_writes(tmp_path):
+    # a file modified recently is not yielded until it settles
+    (tmp_path / "a.html").write_text("<p>a</p>")
+    watcher = DirectoryWatcher(tmp_path, use_inotify=False, poll_interval=0.05, settle_seconds=0.5)
+    filepaths = _watch(watcher)
+    try:
+        with pytest.raises(queue.Empty):
+            filepaths.get(timeout=0.2)
+        assert filepaths.get(timeout=10.0) == str(tmp_path / "a.html")
+    finally:
+        watcher.close()
+
+
+def test_mark_processed(tmp_path):
+    filepath = tmp_path / "a.html"
+    filepath.write_text("<p>a</p>")
+    assert mark_processed(filepath) == str(filepath) + PROCESSED_SUFFIX
+    assert not filepath.exists()
+    assert mark_processed(filepath) is None
+
+    filepath.write_text("<p>a</p>")
+    processed_dir = tmp_path / "processed"
+    processed_dir.mkdir()
+    assert mark_processed(str(filepath), processed_dir) == str(processed_dir / "a.html")
+    assert (processed_dir / "a.html").read_text() == "<p>a</p>"
+
+
+def test_processed_marker(tmp_path):
+    flushed = []
+    filepaths = [tmp_path / "a.html", tmp_path / "b.html"]
+    for filepath in filepaths:
+        filepath.write_text("<p></p>")
+    with ProcessedMarker(lambda: flushed.append(True), tmp_path / "processed", 60.0) as marker:
+        for filepath in filepaths:
+            marker.add(str(filepath))
+        # files are only marked after flushing
+        assert not flushed
+        assert all(filepath.exists() for filepath in filepaths)
+    assert flushed == [True]
+    assert marker.files_marked == 2
+    assert sorted(p.name for p in (tmp_path / "processed").iterdir()) == ["a.html", "b.html"]
+
+
+def test_processed_marker_flush_error(tmp_path):
+    filepath = tmp_path / "a.html"
+    filepath.write_text("<p></p>")
+
+    def flush():
+        raise OSError("Flush failed.")
+
+    marker = ProcessedMarker(flush, interval=0.01)
+    marker.add(str(filepath))
+    marker._thread.join(timeout=10.0)
+    with pytest.raises(OSError):
+        marker.add(str(filepath))
+    marker.close()
+    assert filepath.exists()
@@ -0,0 +1,123 @@
+import os
+import threading
+import time
+
+import pytest
+
+from articleparser.workqueue import SpoolQueue, in_shard, parse_shard
+
+ITEMS = ["item-{}".format(i) for i in range(10)]
+
+
+@pytest.fixture
+def spool(tmp_path):
+    return str(tmp_path / "spool")
+
+
+def test_shards_partition_keys():
+    shards = [[key for key in ITEMS if in_shard(key, i, 3)] for i in range(3)]
+    assert sorted(sum(shards, [])) == sorted(ITEMS)
+
+
+def test_parse_shard():
+    assert parse_shard("1/4") == (1, 4)
+    with pytest.raises(ValueError):
+        parse_shard("4/4")
+
+
+def test_create_once(spool):
+    with SpoolQueue(spool, owner="a") as a, SpoolQueue(spool, owner="b") as b:
+        assert a.create(ITEMS, chunk_size=4)
+        assert not b.create(["other"], chunk_size=4)
+        chunks = os.listdir(os.path.join(spool, "pending"))
+        assert len([chunk for chunk in chunks if not chunk.startswith(".")]) == 3
+
+
+def test_create_after_creator_died(spool):
+    # a node which died while populating the queue leaves its directory
+    os.makedirs(os.path.join(spool, ".tmp-dead"))
+    with open(os.path.join(spool, ".tmp-dead", "chunk-000000"), "w") as f:
+        f.write("item-0\n")
+    with SpoolQueue(spool, owner="a") as a:
+        assert a.create(ITEMS, chunk_size=4)
+        assert [a.acquire(wait=False).items for _ in range(3)] == [ITEMS[:4], ITEMS[4:8], ITEMS[8:]]
+        assert a.acquire(wait=False) is None
+
+
+def test_create_once_all_chunks_leased(spool):
+    with SpoolQueue(spool, owner="a") as a, SpoolQueue(spool, owner="b") as b:
+        a.create(ITEMS, chunk_size=10)
+        a.acquire()
+        # "pending/" is empty of chunks, but still populated
+        assert not b.create(ITEMS, chunk_size=10)
+        assert b.acquire(wait=False) is None
+
+
+def test_leases_are_exclusive(spool):
+    with SpoolQueue(spool, owner="a") as a, SpoolQueue(spool, owner="b") as b:
+        a.create(ITEMS, chunk_size=4)
+        leases = [a.acquire(), b.acquire(), a.acquire()]
+        assert [lease.items for lease in leases] == [ITEMS[:4], ITEMS[4:8], ITEMS[8:]]
+        # the lease of "b" is renewed, so "a" has nothing left to take
+        assert a.acquire(wait=False) is None
+        for lease in leases:
+            (a if lease.path.endswith("@a") else b).complete(lease)
+        assert len(os.listdir(os.path.join(spool, "done"))) == 3
+        assert a.acquire(wait=False) is None
+
+
+def test_expired_lease_is_taken_over(spool):
+    lease_seconds = 0.4
+    a = SpoolQueue(spool, lease_seconds=lease_seconds, owner="a")
+    b = SpoolQueue(spool, lease_seconds=lease_seconds, owner="b")
+    try:
+        a.create(ITEMS, chunk_size=10)
+        lease = a.acquire()
+        time.sleep(lease_seconds * 2)
+        # renewed by the heartbeat of "a"
+        assert b.acquire(wait=False) is None
+        # "a" dies, without completing its chunk
+        a.close()
+        time.sleep(lease_seconds * 1.5)
+        taken = b.acquire(wait=False)
+        assert taken.items == lease.items
+        b.complete(taken)
+        # "a" completes too late; its items may be processed twice
+        a.complete(lease)
+        assert os.listdir(os.path.join(spool, "done")) == [lease.chunk]
+    finally:
+        a.close()
+        b.close()
+
+
+def test_iter_items(spool):
+    with SpoolQueue(spool, owner="a") as a:
+        a.create(ITEMS, chunk_size=4)
+        seen = []
+        for index, item in enumerate(a.iter_items(skip=lambda item: item == "item-0")):
+            seen.append(item)
+            a.item_done(index)
+        assert seen == ITEMS[1:]
+        assert len(os.listdir(os.path.join(spool, "done"))) == 3
+
+
+def test_iter_items_leases_after_items_done(spool):
+    with SpoolQueue(spool, owner="a") as a:
+        a.create(ITEMS, chunk_size=4)
+        items = a.iter_items(max_outstanding=4)
+        first = [next(items) for _ in range(8)]
+        assert first == ITEMS[:8]
+        # a third chunk is not leased while more than 4 items are outstanding
+        done = threading.Event()
+
+        def take():
+            next(items)
+            done.set()
+
+        thread = threading.Thread(target=take)
+        thread.start()
+        for index in range(4):
+            assert not done.wait(0.1)
+            a.item_done(index)
+        thread.join(5)
+        assert done.is_set()